@@ -1,4 +1,5 @@
 import os
+import socket
 import uvicorn
 from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
@@ -6,7 +7,15 @@ from dotenv import load_dotenv
 from app_modules.auth import auth_router, get_current_user
 from app_modules.containers import container_router
 from app_modules.compose import compose_router
-from app_modules.claude import claude_router
+from app_modules.claude import claude_router, close_anthropic_client, response_cache
+from app_modules.executor import docker_executor, password_executor
+from app_modules.results import claude_results
+from app_modules.sessions import claude_sessions
+from app_modules.ratelimit import claude_batch_scheduler
+from app_modules.routing import route_stats
+from app_modules.users import user_repository, run_user_repository
+from app_modules.registry import MCP_DATA_DIR
+from app_modules.state import state_cache, STATE_CACHE_ENABLED
 from app_modules.models import User
 
 # 加载环境变量
@@ -34,6 +43,20 @@ app.include_router(container_router, prefix="/api/containers", tags=["容器管
 app.include_router(compose_router, prefix="/api/compose", tags=["Compose管理"], dependencies=[Depends(get_current_user)])
 app.include_router(claude_router, prefix="/api/claude", tags=["Claude AI"], dependencies=[Depends(get_current_user)])
 
+# 启动Docker状态缓存（后台同步，不阻塞启动）
+@app.on_event("startup")
+async def start_state_cache():
+    if STATE_CACHE_ENABLED:
+        state_cache.start()
+
+@app.on_event("shutdown")
+async def stop_state_cache():
+    state_cache.stop()
+
+@app.on_event("shutdown")
+async def close_claude_client():
+    await close_anthropic_client()
+
 @app.get("/", tags=["根"])
 async def root():
     return {"message": "欢迎使用喵哥docker（MCP）服务！"}
@@ -42,9 +65,53 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics", tags=["健康检查"])
+async def metrics():
+    return {
+        "docker_executor": docker_executor.stats(),
+        "password_executor": password_executor.stats(),
+        "users": await run_user_repository(user_repository.stats),
+        "state_cache": state_cache.stats(),
+        "claude_results": claude_results.stats(),
+        "claude_response_cache": response_cache.stats(),
+        "claude_sessions": claude_sessions.stats(),
+        "claude_batch_scheduler": claude_batch_scheduler.stats(),
+        "claude_routes": route_stats.stats()
+    }
+
+# 多进程模式下各工作进程需要共享的状态：用户、异步聊天结果和Compose任务默认保存到数据目录下的SQLite文件
+# 工作进程由主进程启动并继承其环境变量，已显式配置的路径不会被覆盖
+def configure_shared_state():
+    os.environ.setdefault("USER_DB", os.path.join(MCP_DATA_DIR, "users.db"))
+    os.environ.setdefault("CLAUDE_RESULT_DB", os.path.join(MCP_DATA_DIR, "claude_results.db"))
+    os.environ.setdefault("COMPOSE_JOB_DB", os.path.join(MCP_DATA_DIR, "compose_jobs.db"))
+
+# 创建多进程模式的监听套接字
+# uvicorn自己创建的套接字没有指定协议号，asyncio因此不会在接受的连接上设置TCP_NODELAY，
+# 小响应会因Nagle算法和延迟确认每个请求多等约40毫秒；监听套接字上的TCP_NODELAY会被接受的连接继承
+def bind_listen_socket(host: str, port: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM, socket.IPPROTO_TCP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.bind((host, port))
+    sock.set_inheritable(True)
+    return sock
+
 if __name__ == "__main__":
     host = os.getenv("HOST", "0.0.0.0")
     port = int(os.getenv("PORT", 5000))
     debug = os.getenv("DEBUG", "False").lower() == "true"
+    # 工作进程数，大于1时主进程预先启动多个工作进程并监控它们；调试模式下的自动重载只支持单进程
+    workers = 1 if debug else int(os.getenv("WORKERS", 1))
+    # 关闭或重启时等待进行中的请求完成的时间（秒）
+    graceful_timeout = float(os.getenv("GRACEFUL_TIMEOUT", 30))
     
-    uvicorn.run("app:app", host=host, port=port, reload=debug)
\ No newline at end of file
+    if workers > 1:
+        configure_shared_state()
+    if workers > 1 and os.name != "nt":
+        sock = bind_listen_socket(host, port)
+        uvicorn.run("app:app", fd=sock.fileno(), workers=workers, timeout_graceful_shutdown=graceful_timeout)
+    else:
+        uvicorn.run("app:app", host=host, port=port, reload=debug, workers=workers,
+                    timeout_graceful_shutdown=graceful_timeout)
\ No newline at end of file
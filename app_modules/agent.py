@@ -0,0 +1,298 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from app_modules.models import ComposeFile, ContainerCreate, User
+from app_modules import containers, compose
+
+# 配置日志
+logger = logging.getLogger("claude_agent")
+
+# 工具调用循环的最大轮数（每轮一次Claude API调用）
+AGENT_MAX_STEPS = int(os.getenv("AGENT_MAX_STEPS", 8))
+# 整个工具调用循环的超时（秒）
+AGENT_TIMEOUT = float(os.getenv("AGENT_TIMEOUT", 180))
+# 同一轮中并行执行的工具调用数上限
+AGENT_MAX_PARALLEL_TOOLS = int(os.getenv("AGENT_MAX_PARALLEL_TOOLS", 4))
+# 单个工具结果放回对话时的最大字符数
+AGENT_TOOL_RESULT_LIMIT = int(os.getenv("AGENT_TOOL_RESULT_LIMIT", 4000))
+
+# 追加到系统提示词中的工具使用说明
+AGENT_SYSTEM_PROMPT = """
+你可以调用提供的工具直接查询和操作Docker容器与Compose堆栈，而不是只给出命令。
+互不依赖的查询可以在同一轮中同时调用；执行删除、停止等操作前先确认目标存在。
+操作完成后用简洁的中文总结执行结果。
+"""
+
+# 一个工具：Claude看到的定义、执行函数、是否会修改环境
+class AgentTool:
+    def __init__(self, name: str, description: str, properties: Dict[str, Any], required: List[str],
+                 handler: Callable[[Dict[str, Any], User], Awaitable[Any]], mutating: bool,
+                 resource_key: Optional[str] = None):
+        self.name = name
+        self.handler = handler
+        self.mutating = mutating
+        # 输入中标识操作对象的字段，同一对象上的调用按顺序执行
+        self.resource_key = resource_key
+        self.definition = {
+            "name": name,
+            "description": description,
+            "input_schema": {"type": "object", "properties": properties, "required": required}
+        }
+
+CONTAINER_ID_PROPERTY = {"container_id": {"type": "string", "description": "容器ID、ID前缀或名称"}}
+PROJECT_NAME_PROPERTY = {"project_name": {"type": "string", "description": "Compose项目名称"}}
+
+# 以下工具直接调用现有的路由处理函数，权限检查和错误处理与HTTP接口一致
+AGENT_TOOLS: Dict[str, AgentTool] = {tool.name: tool for tool in [
+    AgentTool(
+        "list_containers", "列出所有容器及其状态", {}, [],
+        lambda args, user: containers.list_container_models(),
+        mutating=False
+    ),
+    AgentTool(
+        "get_container", "获取单个容器的详细信息", CONTAINER_ID_PROPERTY, ["container_id"],
+        lambda args, user: containers.get_container(args["container_id"], current_user=user),
+        mutating=False, resource_key="container_id"
+    ),
+    AgentTool(
+        "get_container_logs", "获取容器最近的日志",
+        {**CONTAINER_ID_PROPERTY, "tail": {"type": "integer", "description": "返回的日志行数，默认100"}},
+        ["container_id"],
+        lambda args, user: containers.get_container_logs(args["container_id"], tail=args.get("tail", 100), current_user=user),
+        mutating=False, resource_key="container_id"
+    ),
+    AgentTool(
+        "create_container", "用指定镜像创建容器（不会自动启动）",
+        {
+            "image": {"type": "string", "description": "镜像名称，如nginx:latest"},
+            "name": {"type": "string", "description": "容器名称"},
+            "ports": {"type": "object", "description": "端口映射，如{\"80/tcp\": \"8080\"}"},
+            "volumes": {"type": "object", "description": "卷映射，主机路径 -> 容器路径"},
+            "environment": {"type": "object", "description": "环境变量"},
+            "command": {"type": "string", "description": "启动命令"}
+        },
+        ["image"],
+        lambda args, user: containers.create_container(ContainerCreate(**args), current_user=user),
+        mutating=True, resource_key="name"
+    ),
+    AgentTool(
+        "start_container", "启动容器", CONTAINER_ID_PROPERTY, ["container_id"],
+        lambda args, user: containers.start_container(args["container_id"], current_user=user),
+        mutating=True, resource_key="container_id"
+    ),
+    AgentTool(
+        "stop_container", "停止容器", CONTAINER_ID_PROPERTY, ["container_id"],
+        lambda args, user: containers.stop_container(args["container_id"], current_user=user),
+        mutating=True, resource_key="container_id"
+    ),
+    AgentTool(
+        "delete_container", "删除容器",
+        {**CONTAINER_ID_PROPERTY, "force": {"type": "boolean", "description": "是否强制删除运行中的容器"}},
+        ["container_id"],
+        lambda args, user: containers.delete_container(args["container_id"], force=args.get("force", False), current_user=user),
+        mutating=True, resource_key="container_id"
+    ),
+    AgentTool(
+        "compose_up", "部署Compose堆栈，返回后台任务ID",
+        {"content": {"type": "string", "description": "docker-compose.yml文件内容"}, **PROJECT_NAME_PROPERTY},
+        ["content"],
+        lambda args, user: compose.compose_up(ComposeFile(content=args["content"], project_name=args.get("project_name")),
+                                              wait=False, force=False, current_user=user),
+        mutating=True, resource_key="project_name"
+    ),
+    AgentTool(
+        "compose_down", "停止已部署的Compose项目，返回后台任务ID", PROJECT_NAME_PROPERTY, ["project_name"],
+        lambda args, user: compose.compose_project_down(args["project_name"], wait=False, current_user=user),
+        mutating=True, resource_key="project_name"
+    ),
+    AgentTool(
+        "compose_status", "获取已部署的Compose项目中各服务的状态", PROJECT_NAME_PROPERTY, ["project_name"],
+        lambda args, user: compose.compose_project_status(args["project_name"], current_user=user),
+        mutating=False, resource_key="project_name"
+    ),
+    AgentTool(
+        "list_compose_projects", "列出当前用户已部署的Compose项目", {}, [],
+        lambda args, user: compose.list_compose_projects(current_user=user),
+        mutating=False
+    ),
+    AgentTool(
+        "get_compose_job", "查询Compose部署任务的状态和输出",
+        {"job_id": {"type": "string", "description": "compose_up或compose_down返回的任务ID"}},
+        ["job_id"],
+        lambda args, user: compose.get_compose_job(args["job_id"], offset=0, current_user=user),
+        mutating=False
+    ),
+]}
+
+# 发送给Claude的工具定义
+def get_tool_definitions() -> List[Dict[str, Any]]:
+    return [tool.definition for tool in AGENT_TOOLS.values()]
+
+# 执行单个工具调用，返回调用记录；错误作为工具结果返回给Claude而不是中断循环
+async def execute_tool(name: str, tool_input: Dict[str, Any], user: User, dry_run: bool) -> Dict[str, Any]:
+    started = time.monotonic()
+    tool = AGENT_TOOLS.get(name)
+    try:
+        if tool is None:
+            raise HTTPException(status_code=400, detail=f"未知的工具: {name}")
+        if dry_run and tool.mutating:
+            # 演练模式下不执行修改环境的操作
+            result = {"dry_run": True, "message": f"演练模式，未执行 {name}", "input": tool_input}
+        else:
+            result = jsonable_encoder(await tool.handler(tool_input, user))
+        is_error = False
+    except HTTPException as e:
+        result = {"error": e.detail, "status_code": e.status_code}
+        is_error = True
+    except Exception as e:
+        logger.error(f"执行工具 {name} 时发生错误: {str(e)}")
+        result = {"error": str(e)}
+        is_error = True
+    return {
+        "name": name,
+        "input": tool_input,
+        "result": result,
+        "is_error": is_error,
+        "duration": round(time.monotonic() - started, 3)
+    }
+
+# 执行一轮中的所有工具调用：作用于不同对象的调用并行执行，作用于同一对象的调用按顺序执行
+# 超过timeout时返回已完成的调用，未完成的调用记为超时（已开始的可能仍在Docker线程中执行，不能撤销）
+async def execute_tool_calls(tool_uses: List[Dict[str, Any]], user: User, dry_run: bool,
+                             timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+    semaphore = asyncio.Semaphore(AGENT_MAX_PARALLEL_TOOLS)
+    groups: Dict[Any, List[int]] = {}
+    for index, tool_use in enumerate(tool_uses):
+        tool = AGENT_TOOLS.get(tool_use["name"])
+        key = tool_use["input"].get(tool.resource_key) if tool and tool.resource_key else None
+        # 没有对象标识的修改操作视为互相依赖，放在同一组中
+        if key is None and tool is not None and tool.mutating:
+            key = "__mutating__"
+        groups.setdefault(key if key is not None else f"__call_{index}__", []).append(index)
+
+    results: List[Optional[Dict[str, Any]]] = [None] * len(tool_uses)
+    started_at: List[Optional[float]] = [None] * len(tool_uses)
+
+    async def run_group(indexes: List[int]):
+        for index in indexes:
+            tool_use = tool_uses[index]
+            async with semaphore:
+                started_at[index] = time.monotonic()
+                call = await execute_tool(tool_use["name"], tool_use["input"], user, dry_run)
+            results[index] = {"id": tool_use["id"], **call}
+
+    tasks = [asyncio.ensure_future(run_group(indexes)) for indexes in groups.values()]
+    try:
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+    finally:
+        for task in tasks:
+            task.cancel()
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    for index, tool_use in enumerate(tool_uses):
+        if results[index] is not None:
+            continue
+        if started_at[index] is None:
+            error, duration = "达到时间上限，未执行", 0.0
+        else:
+            error, duration = "达到时间上限，调用未完成，操作可能仍在执行", round(time.monotonic() - started_at[index], 3)
+        results[index] = {
+            "id": tool_use["id"],
+            "name": tool_use["name"],
+            "input": tool_use["input"],
+            "result": {"error": error},
+            "is_error": True,
+            "timed_out": True,
+            "duration": duration
+        }
+    return results
+
+# 将工具调用记录转换为tool_result内容块
+def tool_result_block(call: Dict[str, Any]) -> Dict[str, Any]:
+    content = json.dumps(call["result"], ensure_ascii=False, default=str)
+    if len(content) > AGENT_TOOL_RESULT_LIMIT:
+        content = content[:AGENT_TOOL_RESULT_LIMIT] + f"...（已截断，共{len(content)}个字符）"
+    return {"type": "tool_result", "tool_use_id": call["id"], "content": content, "is_error": call["is_error"]}
+
+# 将Claude返回的内容块转换为可以放回对话的字典
+def content_to_blocks(content) -> List[Dict[str, Any]]:
+    blocks = []
+    for block in content:
+        if block.type == "text":
+            blocks.append({"type": "text", "text": block.text})
+        elif block.type == "tool_use":
+            blocks.append({"type": "tool_use", "id": block.id, "name": block.name, "input": block.input})
+    return blocks
+
+# 服务端工具调用循环：调用Claude，执行其请求的工具并返回结果，直到Claude给出最终回答或达到轮数/时间上限
+async def run_agent(params: Dict[str, Any], create_message: Callable[[Dict[str, Any]], Awaitable[Any]],
+                    user: User, max_steps: int = AGENT_MAX_STEPS, timeout: float = AGENT_TIMEOUT,
+                    dry_run: bool = False) -> Dict[str, Any]:
+    deadline = time.monotonic() + timeout
+    messages = list(params["messages"])
+    params = {
+        **params,
+        "system": list(params["system"]) + [{"type": "text", "text": AGENT_SYSTEM_PROMPT}],
+        "tools": get_tool_definitions()
+    }
+    tool_calls: List[Dict[str, Any]] = []
+    usage = {"input_tokens": 0, "output_tokens": 0}
+    completion = ""
+    model = params["model"]
+    stop_reason = "max_steps"
+    steps = 0
+
+    while steps < max_steps:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            stop_reason = "timeout"
+            break
+        steps += 1
+        try:
+            message = await asyncio.wait_for(create_message({**params, "messages": list(messages)}), remaining)
+        except asyncio.TimeoutError:
+            stop_reason = "timeout"
+            break
+
+        model = message.model
+        for field in usage:
+            value = getattr(getattr(message, "usage", None), field, None)
+            if isinstance(value, int):
+                usage[field] += value
+        blocks = content_to_blocks(message.content)
+        texts = [block["text"] for block in blocks if block["type"] == "text"]
+        if texts:
+            completion = "".join(texts)
+        messages.append({"role": "assistant", "content": blocks})
+
+        tool_uses = [block for block in blocks if block["type"] == "tool_use"]
+        if message.stop_reason != "tool_use" or not tool_uses:
+            stop_reason = message.stop_reason
+            break
+
+        logger.info(f"用户 {user.username} 的第 {steps} 轮调用工具: {', '.join(t['name'] for t in tool_uses)}")
+        calls = await execute_tool_calls(tool_uses, user, dry_run, timeout=max(deadline - time.monotonic(), 0.001))
+        for call in calls:
+            call["step"] = steps
+        # 超时的这一轮也记录在tool_calls中，调用方可以知道哪些操作已经执行或可能仍在执行
+        tool_calls.extend(calls)
+        if any(call.get("timed_out") for call in calls):
+            stop_reason = "timeout"
+            break
+        messages.append({"role": "user", "content": [tool_result_block(call) for call in calls]})
+
+    return {
+        "completion": completion,
+        "stop_reason": stop_reason,
+        "model": model,
+        "steps": steps,
+        "dry_run": dry_run,
+        "tool_calls": tool_calls,
+        **usage
+    }
@@ -1,12 +1,16 @@
 import os
-from jose import jwt
+import time
+from jose import jwt, JWTError
 from datetime import datetime, timedelta
 from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from passlib.context import CryptContext
 from pydantic import BaseModel
 from app_modules.models import User, UserCreate, UserInDB, Token, TokenData
+from app_modules.cache import TTLCache
+from app_modules.executor import password_executor
+from app_modules.users import fake_users_db, user_repository, run_user_repository
 import uuid
 
 # 创建路由器
@@ -18,14 +22,19 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 # OAuth2 密码Bearer
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/token")
 
-# 模拟数据库用户表
-fake_users_db = {}
-
 # 获取密钥
 SECRET_KEY = os.getenv("SECRET_KEY", "your_secret_key_here")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# 已验证令牌的缓存时间（秒），为0时不缓存；缓存时间不会超过令牌本身的有效期
+AUTH_TOKEN_CACHE_TTL = float(os.getenv("AUTH_TOKEN_CACHE_TTL", 60))
+# 缓存的令牌数上限
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", 1024))
+
+# 已验证的令牌 -> 用户
+token_cache = TTLCache(max_entries=AUTH_TOKEN_CACHE_SIZE, ttl=AUTH_TOKEN_CACHE_TTL)
+
 # 验证密码
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -35,18 +44,15 @@ def get_password_hash(password):
     return pwd_context.hash(password)
 
 # 获取用户
-def get_user(db, username: str):
-    if username in db:
-        user_dict = db[username]
-        return UserInDB(**user_dict)
-    return None
-
-# 认证用户
-def authenticate_user(fake_db, username: str, password: str):
-    user = get_user(fake_db, username)
+async def get_user(username: str) -> Optional[UserInDB]:
+    return await run_user_repository(user_repository.get, username)
+
+# 认证用户，密码验证在密码线程池中执行
+async def authenticate_user(username: str, password: str):
+    user = await get_user(username)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    if not await password_executor.run(verify_password, password, user.hashed_password, operation="verify"):
         return False
     return user
 
@@ -61,8 +67,13 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-# 获取当前用户
-async def get_current_user(token: str = Depends(oauth2_scheme)):
+# 验证令牌并获取对应用户，短时间内重复使用的令牌直接从缓存返回
+async def resolve_token(token: str) -> UserInDB:
+    if AUTH_TOKEN_CACHE_TTL > 0:
+        user = token_cache.get(token)
+        if user is not None:
+            return user
+    
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="无法验证凭据",
@@ -74,11 +85,25 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         if username is None:
             raise credentials_exception
         token_data = TokenData(username=username)
-    except jwt.PyJWTError:
+    except JWTError:
         raise credentials_exception
-    user = get_user(fake_users_db, username=token_data.username)
+    user = await get_user(token_data.username)
     if user is None:
         raise credentials_exception
+    
+    if AUTH_TOKEN_CACHE_TTL > 0:
+        expires_in = payload.get("exp", 0) - time.time()
+        if expires_in > 0:
+            token_cache.set(token, user, ttl=min(AUTH_TOKEN_CACHE_TTL, expires_in))
+    return user
+
+# 获取当前用户
+# 结果保存在request.state中，同一请求中路由级和接口级依赖只解析一次
+async def get_current_user(request: Request, token: str = Depends(oauth2_scheme)):
+    user = getattr(request.state, "user", None)
+    if user is None:
+        user = await resolve_token(token)
+        request.state.user = user
     return user
 
 # 获取当前活跃用户
@@ -90,14 +115,14 @@ async def get_current_active_user(current_user: User = Depends(get_current_user)
 # 注册新用户
 @auth_router.post("/register", response_model=User)
 async def register_user(user: UserCreate):
-    if user.username in fake_users_db:
+    if await get_user(user.username) is not None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="用户名已存在"
         )
     
     user_id = str(uuid.uuid4())
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await password_executor.run(get_password_hash, user.password, operation="hash")
     
     user_dict = {
         "id": user_id,
@@ -109,7 +134,12 @@ async def register_user(user: UserCreate):
         "created_at": datetime.now()
     }
     
-    fake_users_db[user.username] = user_dict
+    # 计算哈希期间可能已有同名用户注册成功（也可能在其他进程中）
+    if not await run_user_repository(user_repository.create, user_dict):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="用户名已存在"
+        )
     
     return {
         "id": user_id,
@@ -123,7 +153,7 @@ async def register_user(user: UserCreate):
 # 登录获取令牌
 @auth_router.post("/token", response_model=Token)
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = authenticate_user(fake_users_db, form_data.username, form_data.password)
+    user = await authenticate_user(form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -1,12 +1,26 @@
 import os
 import json
+import hashlib
+import time
+import asyncio
 import logging
 import anthropic
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, Response
 from typing import Dict, Any, List, Optional
-from app_modules.models import ClaudeRequest, ClaudeResponse, User
+from app_modules.models import (ClaudeRequest, ClaudeResponse, ClaudeAsyncResult, AgentRequest, AgentResponse,
+                                ClaudeSession, SessionChatResponse, ClaudeBatchRequest, ClaudeBatchResponse, User)
 from app_modules.auth import get_current_active_user
-import docker
+from app_modules.executor import run_docker
+from app_modules.context import format_docker_context, context_fingerprint, snapshot_covers_prompt
+from app_modules.cache import TTLCache
+from app_modules.results import claude_results
+from app_modules.agent import run_agent, AGENT_MAX_STEPS
+from app_modules.sessions import claude_sessions, ConversationSession, SESSION_SUMMARY_MODEL
+from app_modules.ratelimit import claude_batch_scheduler, parse_retry_after
+from app_modules.routing import route_stats, classify_prompt, ROUTE_MODELS, CLAUDE_ROUTING_ENABLED
+from app_modules.state import state_cache
+from app_modules.docker_client import client as docker_client
+from app_modules.streaming import ClosingStreamingResponse
 from datetime import datetime
 
 # 配置日志
@@ -19,8 +33,28 @@ claude_router = APIRouter()
 # 获取Claude API密钥
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
 
-# 创建Docker客户端
-docker_client = docker.from_env()
+# Claude客户端连接池和重试配置
+CLAUDE_MAX_CONNECTIONS = int(os.getenv("CLAUDE_MAX_CONNECTIONS", 20))
+CLAUDE_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("CLAUDE_MAX_KEEPALIVE_CONNECTIONS", 10))
+CLAUDE_KEEPALIVE_EXPIRY = float(os.getenv("CLAUDE_KEEPALIVE_EXPIRY", 60))
+CLAUDE_MAX_RETRIES = int(os.getenv("CLAUDE_MAX_RETRIES", 3))
+CLAUDE_TIMEOUT = float(os.getenv("CLAUDE_TIMEOUT", 120))
+# 同时进行的Claude API调用数上限
+CLAUDE_MAX_CONCURRENCY = int(os.getenv("CLAUDE_MAX_CONCURRENCY", 8))
+# 是否使用提示词缓存（系统提示词和Docker环境信息作为可缓存前缀）
+CLAUDE_PROMPT_CACHE_ENABLED = os.getenv("CLAUDE_PROMPT_CACHE_ENABLED", "True").lower() == "true"
+# 用户的Docker环境快照固定时间（秒），与服务端提示词缓存的有效期一致
+CLAUDE_CONTEXT_PIN_TTL = float(os.getenv("CLAUDE_CONTEXT_PIN_TTL", 300))
+# temperature为0的请求的响应缓存
+CLAUDE_RESPONSE_CACHE_ENABLED = os.getenv("CLAUDE_RESPONSE_CACHE_ENABLED", "True").lower() == "true"
+CLAUDE_RESPONSE_CACHE_TTL = float(os.getenv("CLAUDE_RESPONSE_CACHE_TTL", 300))
+CLAUDE_RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("CLAUDE_RESPONSE_CACHE_MAX_ENTRIES", 500))
+# 单次批量请求的条目数上限和单个条目的重试次数
+CLAUDE_BATCH_MAX_ITEMS = int(os.getenv("CLAUDE_BATCH_MAX_ITEMS", 100))
+CLAUDE_BATCH_MAX_RETRIES = int(os.getenv("CLAUDE_BATCH_MAX_RETRIES", 3))
+
+# 响应中的token用量字段
+USAGE_FIELDS = ("input_tokens", "output_tokens", "cache_creation_input_tokens", "cache_read_input_tokens")
 
 # 可用的Claude模型
 AVAILABLE_MODELS = [
@@ -29,8 +63,11 @@ AVAILABLE_MODELS = [
     "claude-3-haiku-20240307"
 ]
 
-# 默认模型
-DEFAULT_MODEL = "claude-3-opus-20240229"
+# 默认模型（关闭自动路由时，未指定模型的请求使用）
+DEFAULT_MODEL = os.getenv("CLAUDE_DEFAULT_MODEL", "claude-3-opus-20240229")
+
+# 模型对应的路由名称，用于统计
+MODEL_ROUTES = {model: route for route, model in ROUTE_MODELS.items()}
 
 # 系统提示词
 SYSTEM_PROMPT = """
@@ -45,25 +82,71 @@ SYSTEM_PROMPT = """
 请根据用户的自然语言请求，生成相应的Docker命令或操作步骤。
 """
 
+# 进程级共享的异步Claude客户端和并发信号量（首次使用时创建）
+_anthropic_client: Optional[anthropic.AsyncAnthropic] = None
+_claude_semaphore: Optional[asyncio.Semaphore] = None
+_claude_semaphore_loop = None
+
+# 获取共享的异步Claude客户端
+# 复用连接池中的长连接，避免每个请求重新建立TLS连接；失败请求由SDK按带抖动的指数退避自动重试
+def get_anthropic_client() -> anthropic.AsyncAnthropic:
+    global _anthropic_client
+    if _anthropic_client is None:
+        # 使用SDK自带的httpx Limits类型，避免额外依赖
+        limits = type(anthropic.DEFAULT_CONNECTION_LIMITS)(
+            max_connections=CLAUDE_MAX_CONNECTIONS,
+            max_keepalive_connections=CLAUDE_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=CLAUDE_KEEPALIVE_EXPIRY
+        )
+        _anthropic_client = anthropic.AsyncAnthropic(
+            api_key=ANTHROPIC_API_KEY,
+            max_retries=CLAUDE_MAX_RETRIES,
+            timeout=CLAUDE_TIMEOUT,
+            http_client=anthropic.DefaultAsyncHttpxClient(limits=limits)
+        )
+    return _anthropic_client
+
+# 关闭共享的Claude客户端
+async def close_anthropic_client():
+    global _anthropic_client
+    if _anthropic_client is not None:
+        await _anthropic_client.close()
+        _anthropic_client = None
+
+# 获取限制Claude API并发调用数的信号量（与事件循环绑定，按当前循环创建）
+def get_claude_semaphore() -> asyncio.Semaphore:
+    global _claude_semaphore, _claude_semaphore_loop
+    loop = asyncio.get_running_loop()
+    if _claude_semaphore is None or _claude_semaphore_loop is not loop:
+        _claude_semaphore = asyncio.Semaphore(CLAUDE_MAX_CONCURRENCY)
+        _claude_semaphore_loop = loop
+    return _claude_semaphore
+
 # 获取Docker环境信息
 def get_docker_context():
     try:
-        # 获取当前Docker环境信息
-        containers = docker_client.containers.list(all=True)
-        container_info = [{
-            "id": container.id[:12],
-            "name": container.name,
-            "image": container.image.tags[0] if container.image.tags else container.image.id,
-            "status": container.status
-        } for container in containers]
+        # 获取当前Docker环境信息（状态缓存可用时直接读内存，否则各查询一次摘要）
+        if state_cache.is_fresh():
+            containers = state_cache.list_containers()
+            images = state_cache.list_images()
+        else:
+            containers = docker_client.api.containers(all=True)
+            images = docker_client.api.images()
         
         # 获取Docker镜像信息
-        images = docker_client.images.list()
         image_info = [{
-            "id": image.id[:12],
-            "tags": image.tags,
-            "size": image.attrs["Size"] // (1024 * 1024)  # 转换为MB
+            "id": image['Id'].split(':')[-1][:12],
+            "tags": [tag for tag in (image.get('RepoTags') or []) if tag != '<none>:<none>'],
+            "size": image.get('Size', 0) // (1024 * 1024)  # 转换为MB
         } for image in images]
+        image_tags = {image['Id']: info['tags'][0] for image, info in zip(images, image_info) if info['tags']}
+        
+        container_info = [{
+            "id": container['Id'][:12],
+            "name": (container.get('Names') or ['/' + container['Id'][:12]])[0].lstrip('/'),
+            "image": image_tags.get(container.get('ImageID'), container.get('ImageID')),
+            "status": container['State']
+        } for container in containers]
         
         # 构建上下文信息
         context = {
@@ -83,63 +166,473 @@ async def get_claude_config(current_user: User = Depends(get_current_active_user
     return {
         "available_models": AVAILABLE_MODELS,
         "default_model": DEFAULT_MODEL,
+        "routing_enabled": CLAUDE_ROUTING_ENABLED,
+        "routes": ROUTE_MODELS,
         "max_tokens_limit": 4096,
         "api_status": "available" if ANTHROPIC_API_KEY else "unavailable"
     }
 
+# 选择路由和模型：请求中指定的模型优先，其次是指定的路由，否则按提示词复杂度自动选择
+def select_route(request: ClaudeRequest):
+    if request.model in AVAILABLE_MODELS:
+        return "explicit", request.model
+    if request.route in ROUTE_MODELS:
+        return request.route, ROUTE_MODELS[request.route]
+    if not CLAUDE_ROUTING_ENABLED:
+        return "default", DEFAULT_MODEL
+    route = classify_prompt(request.prompt)
+    return route, ROUTE_MODELS[route]
+
+# 获取请求使用的模型
+def select_model(request: ClaudeRequest) -> str:
+    return select_route(request)[1]
+
+# 每个用户固定的Docker环境快照：环境未变化时连续请求复用完全相同的文本，使其能命中提示词缓存
+pinned_contexts = TTLCache(max_entries=1000, ttl=CLAUDE_CONTEXT_PIN_TTL)
+
+# 获取用户的Docker环境快照文本；环境变化或快照缺少提示词中提到的条目时重新生成
+def get_context_snapshot(context: Dict[str, Any], prompt: str, username: Optional[str] = None) -> str:
+    fingerprint = context_fingerprint(context)
+    if username:
+        pinned = pinned_contexts.get(username)
+        if pinned and pinned[0] == fingerprint and snapshot_covers_prompt(pinned[1], context, prompt):
+            # 刷新固定时间
+            pinned_contexts.set(username, pinned)
+            return pinned[1]
+    snapshot = format_docker_context(context, prompt)
+    if username:
+        pinned_contexts.set(username, (fingerprint, snapshot))
+    return snapshot
+
+# 确定性请求（temperature为0）的响应缓存，Docker环境变化后缓存键随之改变
+response_cache = TTLCache(max_entries=CLAUDE_RESPONSE_CACHE_MAX_ENTRIES, ttl=CLAUDE_RESPONSE_CACHE_TTL)
+
+# 计算响应缓存键，非确定性请求返回None
+def response_cache_key(request: ClaudeRequest, context: Dict[str, Any]) -> Optional[str]:
+    if not CLAUDE_RESPONSE_CACHE_ENABLED or request.temperature != 0 or context.get('error'):
+        return None
+    data = {
+        "model": select_model(request),
+        "prompt": request.prompt,
+        "max_tokens": request.max_tokens_to_sample,
+        "temperature": request.temperature,
+        "context": context_fingerprint(context)
+    }
+    return hashlib.sha256(json.dumps(data, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+# 构建Messages API请求参数
+# 系统提示词和环境快照放在前面并标记为可缓存前缀，用户问题放在最后
+def build_message_params(request: ClaudeRequest, context: Dict[str, Any], username: Optional[str] = None) -> Dict[str, Any]:
+    system_block = {"type": "text", "text": SYSTEM_PROMPT}
+    context_block = {"type": "text", "text": f"当前Docker环境信息:\n{get_context_snapshot(context, request.prompt, username)}"}
+    if CLAUDE_PROMPT_CACHE_ENABLED:
+        system_block["cache_control"] = {"type": "ephemeral"}
+        context_block["cache_control"] = {"type": "ephemeral"}
+    return {
+        "model": select_model(request),
+        "max_tokens": request.max_tokens_to_sample,
+        "temperature": request.temperature,
+        "system": [system_block],
+        "messages": [
+            {
+                "role": "user",
+                "content": [context_block, {"type": "text", "text": request.prompt}]
+            }
+        ]
+    }
+
+# 提取响应中的token用量（包括提示词缓存的写入和命中）
+def get_usage(message) -> Dict[str, Optional[int]]:
+    usage = getattr(message, "usage", None)
+    values = {field: getattr(usage, field, None) for field in USAGE_FIELDS}
+    return {field: value if isinstance(value, int) else None for field, value in values.items()}
+
+# 将Claude消息转换为ClaudeResponse字段
+def message_to_response(message) -> Dict[str, Any]:
+    return {
+        "completion": "".join(block.text for block in message.content if getattr(block, "type", None) == "text"),
+        "stop_reason": message.stop_reason,
+        "model": message.model,
+        "route": MODEL_ROUTES.get(message.model),
+        **get_usage(message)
+    }
+
+# 调用Claude API，受并发上限约束
+async def create_claude_message(params: Dict[str, Any]):
+    async with get_claude_semaphore():
+        started = time.monotonic()
+        try:
+            message = await get_anthropic_client().messages.create(**params)
+        except Exception:
+            record_route_stats(params["model"], started, None, error=True)
+            raise
+        record_route_stats(params["model"], started, message)
+        return message
+
+# 调用Claude API并返回响应头；不使用SDK的自动重试，由批量调度器根据限流情况决定何时重试
+async def create_claude_message_with_headers(params: Dict[str, Any]):
+    async with get_claude_semaphore():
+        started = time.monotonic()
+        try:
+            raw = await get_anthropic_client().with_options(max_retries=0).messages.with_raw_response.create(**params)
+            message = raw.parse()
+        except Exception:
+            record_route_stats(params["model"], started, None, error=True)
+            raise
+        record_route_stats(params["model"], started, message)
+        return message, raw.headers
+
+# 记录一次调用的路由统计
+def record_route_stats(model: str, started: float, message, error: bool = False):
+    usage = get_usage(message) if message is not None else {}
+    route_stats.record(MODEL_ROUTES.get(model, model), model, time.monotonic() - started, usage, error=error)
+
+# 将Claude API异常转换为HTTP异常
+def claude_http_exception(e: anthropic.APIError) -> HTTPException:
+    if isinstance(e, anthropic.RateLimitError):
+        logger.error(f"Claude API速率限制错误: {str(e)}")
+        return HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=f"Claude API速率限制错误: {str(e)}")
+    if isinstance(e, anthropic.APIConnectionError):
+        logger.error(f"Claude API连接错误: {str(e)}")
+        return HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=f"Claude API连接错误: {str(e)}")
+    logger.error(f"Claude API错误: {str(e)}")
+    return HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Claude API错误: {str(e)}")
+
+# 格式化一条SSE事件
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
 # 与Claude AI交互
 @claude_router.post("/chat", response_model=ClaudeResponse)
-async def chat_with_claude(request: ClaudeRequest, current_user: User = Depends(get_current_active_user)):
+async def chat_with_claude(request: ClaudeRequest, response: Response, current_user: User = Depends(get_current_active_user)):
     if not ANTHROPIC_API_KEY:
         logger.error("Claude API密钥未配置")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Claude API密钥未配置")
     
     try:
         # 获取Docker环境上下文
-        context = get_docker_context()
+        context = await run_docker(get_docker_context, operation="context")
         
         # 记录请求信息
         logger.info(f"用户 {current_user.username} 发送请求: {request.prompt[:50]}...")
         
+        # 相同的确定性请求在环境未变化时直接返回缓存的响应
+        cache_key = response_cache_key(request, context)
+        if cache_key is not None:
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"用户 {current_user.username} 的请求命中响应缓存")
+                response.headers["X-Cache"] = "HIT"
+                return ClaudeResponse(**cached)
+        
         # 调用Claude API
-        client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
-        
-        # 使用请求中指定的模型，如果未指定则使用默认模型
-        model = request.model if hasattr(request, 'model') and request.model in AVAILABLE_MODELS else DEFAULT_MODEL
-        
-        message = client.messages.create(
-            model=model,
-            max_tokens=request.max_tokens_to_sample,
-            temperature=request.temperature,
-            system=SYSTEM_PROMPT,
-            messages=[
-                {
-                    "role": "user",
-                    "content": f"当前Docker环境信息:\n{json.dumps(context, ensure_ascii=False, indent=2)}\n\n{request.prompt}"
-                }
-            ]
-        )
+        message = await create_claude_message(build_message_params(request, context, current_user.username))
         
         # 记录响应信息
-        logger.info(f"Claude响应: {message.content[0].text[:50]}...")
+        result = message_to_response(message)
+        logger.info(f"Claude响应: {result['completion'][:50]}... "
+                    f"(缓存命中 {result['cache_read_input_tokens']} tokens, 缓存写入 {result['cache_creation_input_tokens']} tokens)")
         
-        return ClaudeResponse(
-            completion=message.content[0].text,
-            stop_reason=message.stop_reason,
-            model=message.model
+        if cache_key is not None:
+            response_cache.set(cache_key, result)
+            response.headers["X-Cache"] = "MISS"
+        else:
+            response.headers["X-Cache"] = "BYPASS"
+        return ClaudeResponse(**result)
+    except anthropic.APIError as e:
+        raise claude_http_exception(e)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"处理请求时发生错误: {str(e)}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"处理请求时发生错误: {str(e)}")
+
+# 让Claude通过工具直接执行容器和Compose操作
+# dry_run为true时只执行查询类工具，修改环境的工具调用只记录不执行
+@claude_router.post("/agent", response_model=AgentResponse)
+async def run_claude_agent(request: AgentRequest, current_user: User = Depends(get_current_active_user)):
+    if not ANTHROPIC_API_KEY:
+        logger.error("Claude API密钥未配置")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Claude API密钥未配置")
+    
+    try:
+        # 获取Docker环境上下文
+        context = await run_docker(get_docker_context, operation="context")
+        logger.info(f"用户 {current_user.username} 发送工具调用请求（dry_run={request.dry_run}）: {request.prompt[:50]}...")
+        
+        max_steps = min(request.max_steps or AGENT_MAX_STEPS, AGENT_MAX_STEPS)
+        return await run_agent(
+            build_message_params(request, context, current_user.username),
+            create_claude_message,
+            current_user,
+            max_steps=max_steps,
+            dry_run=request.dry_run
         )
     except anthropic.APIError as e:
-        logger.error(f"Claude API错误: {str(e)}")
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Claude API错误: {str(e)}")
-    except anthropic.APIConnectionError as e:
-        logger.error(f"Claude API连接错误: {str(e)}")
-        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=f"Claude API连接错误: {str(e)}")
-    except anthropic.RateLimitError as e:
-        logger.error(f"Claude API速率限制错误: {str(e)}")
-        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=f"Claude API速率限制错误: {str(e)}")
+        raise claude_http_exception(e)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"处理请求时发生错误: {str(e)}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"处理请求时发生错误: {str(e)}")
+
+# 压缩会话历史时使用的系统提示词
+SUMMARY_PROMPT = "请把下面的Docker运维对话压缩成简洁的中文摘要，保留用户的目标、涉及的容器和服务、已执行的操作、结论和未解决的问题。"
+
+# 把较早的会话消息连同已有摘要压缩为新的摘要；调用失败时保留已有摘要，不影响本轮对话
+async def summarize_history(summary: Optional[str], messages: List[Dict[str, str]]) -> str:
+    transcript = "\n\n".join(f"{'用户' if m['role'] == 'user' else '助手'}: {m['content']}" for m in messages)
+    prompt = (f"已有摘要:\n{summary}\n\n" if summary else "") + f"对话记录:\n{transcript}"
+    try:
+        message = await create_claude_message({
+            "model": SESSION_SUMMARY_MODEL,
+            "max_tokens": 800,
+            "temperature": 0,
+            "system": SUMMARY_PROMPT,
+            "messages": [{"role": "user", "content": prompt}]
+        })
+        return message_to_response(message)["completion"]
+    except anthropic.APIError as e:
+        logger.error(f"压缩会话历史失败: {str(e)}")
+        return (summary + "\n" if summary else "") + f"（较早的{len(messages)}条消息已省略）"
+
+# 构建会话中一轮对话的请求参数：摘要放在系统提示词后，历史消息作为可缓存前缀，本轮只附带环境变化
+def build_session_params(request: ClaudeRequest, session: ConversationSession, user_content: str) -> Dict[str, Any]:
+    system = [{"type": "text", "text": SYSTEM_PROMPT}]
+    if CLAUDE_PROMPT_CACHE_ENABLED:
+        system[0]["cache_control"] = {"type": "ephemeral"}
+    if session.summary:
+        system.append({"type": "text", "text": f"之前对话的摘要:\n{session.summary}"})
+    messages = [dict(m) for m in session.messages]
+    if messages and CLAUDE_PROMPT_CACHE_ENABLED:
+        last = messages[-1]
+        last["content"] = [{"type": "text", "text": last["content"], "cache_control": {"type": "ephemeral"}}]
+    messages.append({"role": "user", "content": user_content})
+    return {
+        "model": select_model(request),
+        "max_tokens": request.max_tokens_to_sample,
+        "temperature": request.temperature,
+        "system": system,
+        "messages": messages
+    }
+
+# 获取当前用户的会话，不存在时返回404
+def get_user_session(session_id: str, current_user: User) -> ConversationSession:
+    session = claude_sessions.get(session_id)
+    if session is None or session.owner != current_user.username:
+        raise HTTPException(status_code=404, detail="会话未找到或已过期")
+    return session
+
+# 创建对话会话
+@claude_router.post("/sessions", response_model=ClaudeSession, status_code=status.HTTP_201_CREATED)
+async def create_session(current_user: User = Depends(get_current_active_user)):
+    return claude_sessions.create(current_user.username).to_dict()
+
+# 列出当前用户的对话会话
+@claude_router.get("/sessions", response_model=List[ClaudeSession])
+async def list_sessions(current_user: User = Depends(get_current_active_user)):
+    return [session.to_dict(include_messages=False) for session in claude_sessions.list_sessions(current_user.username)]
+
+# 获取会话及其历史消息
+@claude_router.get("/sessions/{session_id}", response_model=ClaudeSession)
+async def get_session(session_id: str, current_user: User = Depends(get_current_active_user)):
+    return get_user_session(session_id, current_user).to_dict()
+
+# 删除会话
+@claude_router.delete("/sessions/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_session(session_id: str, current_user: User = Depends(get_current_active_user)):
+    get_user_session(session_id, current_user)
+    claude_sessions.delete(session_id)
+
+# 在会话中与Claude对话
+# 第一轮附带完整的环境快照，之后只附带自上一轮以来的环境变化；历史超过预算时先压缩较早的对话
+@claude_router.post("/sessions/{session_id}/chat", response_model=SessionChatResponse)
+async def chat_in_session(session_id: str, request: ClaudeRequest, current_user: User = Depends(get_current_active_user)):
+    if not ANTHROPIC_API_KEY:
+        logger.error("Claude API密钥未配置")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Claude API密钥未配置")
+    
+    session = get_user_session(session_id, current_user)
+    if session.busy:
+        raise HTTPException(status_code=409, detail="会话正在处理上一条消息")
+    session.busy = True
+    try:
+        compacted = await session.compact(summarize_history)
+        
+        # 获取Docker环境上下文
+        context = await run_docker(get_docker_context, operation="context")
+        context_mode, context_text = session.context_text(
+            context, lambda c: format_docker_context(c, request.prompt)
+        )
+        user_content = f"{context_text}\n\n{request.prompt}"
+        logger.info(f"用户 {current_user.username} 在会话 {session_id} 中发送请求（{context_mode}）: {request.prompt[:50]}...")
+        
+        # 调用Claude API
+        message = await create_claude_message(build_session_params(request, session, user_content))
+        result = message_to_response(message)
+        session.record_turn(user_content, result["completion"], context)
+        
+        return SessionChatResponse(
+            **result,
+            session_id=session.id,
+            turn=session.turns,
+            context_mode=context_mode,
+            compacted=compacted
+        )
+    except anthropic.APIError as e:
+        raise claude_http_exception(e)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"处理请求时发生错误: {str(e)}")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"处理请求时发生错误: {str(e)}")
+    finally:
+        session.busy = False
+
+# 执行批量请求中的一项：经调度器排队后调用，遇到限流、过载或连接错误时降低并发并重试；
+# 任何错误都只记为该项失败，不影响其他项
+async def run_batch_item(index: int, request: ClaudeRequest, context: Dict[str, Any], current_user: User,
+                         batch_semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+    started = time.monotonic()
+    attempts = 0
+    async with batch_semaphore:
+        try:
+            params = build_message_params(request, context, current_user.username)
+            while True:
+                attempts += 1
+                await claude_batch_scheduler.acquire()
+                rate_limited = False
+                retry_after = None
+                try:
+                    message, headers = await create_claude_message_with_headers(params)
+                except (anthropic.RateLimitError, anthropic.InternalServerError, anthropic.APIConnectionError) as e:
+                    rate_limited = True
+                    response = getattr(e, "response", None)
+                    retry_after = parse_retry_after(response.headers if response is not None else None)
+                    if retry_after is None:
+                        retry_after = min(2 ** attempts, 30)
+                    if attempts > CLAUDE_BATCH_MAX_RETRIES:
+                        raise
+                    logger.warning(f"批量请求第 {index} 项第 {attempts} 次调用失败，将重试: {str(e)}")
+                    continue
+                finally:
+                    # 调度器是进程共享的，任务被取消（客户端断开等）时也必须归还并发名额
+                    claude_batch_scheduler.release(rate_limited=rate_limited, retry_after=retry_after)
+                claude_batch_scheduler.update_from_headers(headers)
+                return {
+                    "index": index,
+                    "status": "succeeded",
+                    "response": message_to_response(message),
+                    "attempts": attempts,
+                    "duration": round(time.monotonic() - started, 3)
+                }
+        except HTTPException as e:
+            error = str(e.detail)
+        except Exception as e:
+            error = str(e)
+    logger.error(f"批量请求第 {index} 项失败: {error}")
+    return {
+        "index": index,
+        "status": "failed",
+        "error": error,
+        "attempts": attempts,
+        "duration": round(time.monotonic() - started, 3)
+    }
+
+# 批量与Claude AI交互，每项单独返回结果；所有项共用一次获取的Docker环境信息
+@claude_router.post("/batch", response_model=ClaudeBatchResponse)
+async def chat_with_claude_batch(batch: ClaudeBatchRequest, current_user: User = Depends(get_current_active_user)):
+    if not ANTHROPIC_API_KEY:
+        logger.error("Claude API密钥未配置")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Claude API密钥未配置")
+    if not batch.requests:
+        raise HTTPException(status_code=400, detail="批量请求不能为空")
+    if len(batch.requests) > CLAUDE_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"批量请求最多包含 {CLAUDE_BATCH_MAX_ITEMS} 项")
+    
+    started = time.monotonic()
+    context = await run_docker(get_docker_context, operation="context")
+    logger.info(f"用户 {current_user.username} 提交批量请求: {len(batch.requests)} 项")
+    
+    batch_semaphore = asyncio.Semaphore(max(1, batch.max_concurrency or len(batch.requests)))
+    results = await asyncio.gather(*(
+        run_batch_item(index, request, context, current_user, batch_semaphore)
+        for index, request in enumerate(batch.requests)
+    ))
+    succeeded = sum(1 for result in results if result["status"] == "succeeded")
+    return {
+        "results": results,
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "duration": round(time.monotonic() - started, 3)
+    }
+
+# 以SSE流式返回Claude的回复
+# 事件依次为 start、若干 delta（增量文本）、done（完整回复、首个token耗时等）；流中途出错时发送 error 事件
+@claude_router.post("/chat/stream")
+async def chat_with_claude_stream(request: ClaudeRequest, current_user: User = Depends(get_current_active_user)):
+    if not ANTHROPIC_API_KEY:
+        logger.error("Claude API密钥未配置")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Claude API密钥未配置")
+    
+    # 获取Docker环境上下文
+    context = await run_docker(get_docker_context, operation="context")
+    params = build_message_params(request, context, current_user.username)
+    logger.info(f"用户 {current_user.username} 发送流式请求: {request.prompt[:50]}...")
+    
+    # 在返回响应之前建立流，连接和限流错误仍以HTTP状态码返回
+    semaphore = get_claude_semaphore()
+    await semaphore.acquire()
+    started = time.monotonic()
+    try:
+        manager = get_anthropic_client().messages.stream(**params)
+        stream = await manager.__aenter__()
+    except anthropic.APIError as e:
+        semaphore.release()
+        raise claude_http_exception(e)
+    except Exception as e:
+        semaphore.release()
+        logger.error(f"处理请求时发生错误: {str(e)}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"处理请求时发生错误: {str(e)}")
+    
+    # 关闭上游连接并释放并发名额，只执行一次
+    closed = False
+    async def close_stream():
+        nonlocal closed
+        if closed:
+            return
+        closed = True
+        try:
+            await manager.__aexit__(None, None, None)
+        finally:
+            semaphore.release()
+    
+    async def events():
+        time_to_first_token = None
+        try:
+            yield sse_event("start", {"model": params["model"], "route": MODEL_ROUTES.get(params["model"])})
+            async for text in stream.text_stream:
+                if time_to_first_token is None:
+                    time_to_first_token = round(time.monotonic() - started, 3)
+                    logger.info(f"用户 {current_user.username} 的流式请求首个token耗时 {time_to_first_token} 秒")
+                yield sse_event("delta", {"text": text})
+            message = await stream.get_final_message()
+            record_route_stats(params["model"], started, message)
+            yield sse_event("done", {
+                **message_to_response(message),
+                "time_to_first_token": time_to_first_token,
+                "duration": round(time.monotonic() - started, 3)
+            })
+        except anthropic.APIError as e:
+            record_route_stats(params["model"], started, None, error=True)
+            logger.error(f"Claude流式响应错误: {str(e)}")
+            yield sse_event("error", {"detail": f"Claude API错误: {str(e)}"})
+        finally:
+            await close_stream()
+    
+    # 流结束或客户端断开时关闭，客户端在第一个事件之前断开（events从未开始执行）时由响应负责关闭
+    return ClosingStreamingResponse(events(), on_close=close_stream, media_type="text/event-stream",
+                                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 # 异步与Claude AI交互
 @claude_router.post("/chat/async", response_model=Dict[str, Any])
@@ -148,8 +641,9 @@ async def chat_with_claude_async(request: ClaudeRequest, background_tasks: Backg
         logger.error("Claude API密钥未配置")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Claude API密钥未配置")
     
-    # 生成请求ID
-    request_id = f"{current_user.username}_{datetime.now().strftime('%Y%m%d%H%M%S')}_{hash(request.prompt)%1000}"
+    # 创建请求记录，生成请求ID
+    record = await claude_results.run(claude_results.create, current_user.username, model=select_model(request))
+    request_id = record["request_id"]
     
     # 添加到后台任务
     background_tasks.add_task(process_claude_request, request, request_id, current_user)
@@ -160,39 +654,44 @@ async def chat_with_claude_async(request: ClaudeRequest, background_tasks: Backg
         "message": "请求已提交，正在处理中"
     }
 
+# 查询异步请求的状态和结果
+@claude_router.get("/chat/async/{request_id}", response_model=ClaudeAsyncResult)
+async def get_chat_async_result(request_id: str, current_user: User = Depends(get_current_active_user)):
+    record = await claude_results.run(claude_results.get, request_id)
+    if record is None or record.get("owner") != current_user.username:
+        raise HTTPException(status_code=404, detail="请求未找到或已过期")
+    return record
+
 # 后台处理Claude请求
 async def process_claude_request(request: ClaudeRequest, request_id: str, current_user: User):
     try:
         # 获取Docker环境上下文
-        context = get_docker_context()
+        await claude_results.run(claude_results.update, request_id, status="processing", progress="collecting_context",
+                                 started_at=datetime.now())
+        context = await run_docker(get_docker_context, operation="context")
         
         # 记录请求信息
         logger.info(f"异步处理用户 {current_user.username} 的请求 {request_id}: {request.prompt[:50]}...")
         
         # 调用Claude API
-        client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
-        
-        # 使用请求中指定的模型，如果未指定则使用默认模型
-        model = request.model if hasattr(request, 'model') and request.model in AVAILABLE_MODELS else DEFAULT_MODEL
-        
-        message = client.messages.create(
-            model=model,
-            max_tokens=request.max_tokens_to_sample,
-            temperature=request.temperature,
-            system=SYSTEM_PROMPT,
-            messages=[
-                {
-                    "role": "user",
-                    "content": f"当前Docker环境信息:\n{json.dumps(context, ensure_ascii=False, indent=2)}\n\n{request.prompt}"
-                }
-            ]
-        )
+        await claude_results.run(claude_results.update, request_id, progress="waiting_for_model")
+        message = await create_claude_message(build_message_params(request, context, current_user.username))
         
         # 记录响应信息
         logger.info(f"请求 {request_id} 的Claude响应: {message.content[0].text[:50]}...")
         
-        # 这里可以将结果保存到数据库或缓存中，供后续查询
-        # 实际项目中应该实现结果存储和查询机制
+        # 保存结果，供 GET /chat/async/{request_id} 查询
+        await claude_results.run(
+            claude_results.update,
+            request_id,
+            status="succeeded",
+            progress="completed",
+            finished_at=datetime.now(),
+            result=message_to_response(message)
+        )
         
     except Exception as e:
-        logger.error(f"处理异步请求 {request_id} 时发生错误: {str(e)}")
\ No newline at end of file
+        logger.error(f"处理异步请求 {request_id} 时发生错误: {str(e)}")
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        await claude_results.run(claude_results.update, request_id, status="failed", progress="completed",
+                                 finished_at=datetime.now(), error=detail)
\ No newline at end of file
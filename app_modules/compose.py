@@ -1,113 +1,281 @@
 import os
-import docker
+import json
+import uuid
 import yaml
-import tempfile
+from datetime import datetime
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
-from typing import Dict, Any, Optional
-from app_modules.models import ComposeFile, ComposeStatus, User
+from fastapi.responses import StreamingResponse
+from typing import Dict, Any, List, Optional
+from app_modules.models import ComposeFile, ComposeStatus, ComposeJob, ComposeProject, User
 from app_modules.auth import get_current_active_user
+from app_modules.executor import run_docker
+from app_modules.jobs import compose_jobs, Job, COMPOSE_COMMAND, COMPOSE_TIMEOUT
+from app_modules.registry import project_registry, content_hash, hash_project_name, PROJECT_NAME_PATTERN, ProjectBusyError, run_registry
+from app_modules.state import state_cache, build_compose_index, COMPOSE_PROJECT_LABEL, COMPOSE_NUMBER_LABEL
+from app_modules.docker_client import client
 
 # 创建路由器
 compose_router = APIRouter()
 
-# 创建Docker客户端
-client = docker.from_env()
+# 各操作的提示文字
+COMPOSE_ACTION_TEXT = {"up": "部署", "down": "停止"}
+
+# 解析compose文件内容
+def parse_compose(content: str) -> Dict[str, Any]:
+    try:
+        compose_data = yaml.safe_load(content)
+    except yaml.YAMLError as e:
+        raise HTTPException(status_code=400, detail=f"compose文件格式错误: {str(e)}")
+    if not isinstance(compose_data, dict):
+        raise HTTPException(status_code=400, detail="compose文件格式错误")
+    return compose_data
+
+# 确定项目名称：用户指定 > compose文件顶层name > 内容哈希，同样的内容总是对应同一个项目
+def resolve_project_name(compose_file: ComposeFile, compose_data: Dict[str, Any]) -> str:
+    project_name = compose_file.project_name or compose_data.get('name') or hash_project_name(compose_file.content)
+    if not PROJECT_NAME_PATTERN.match(project_name):
+        raise HTTPException(status_code=400, detail="项目名称只能包含小写字母、数字、下划线和连字符")
+    return project_name
+
+# 获取当前用户可操作的项目记录（不存在时返回None）
+async def get_user_project(project_name: str, current_user: User) -> Optional[Dict[str, Any]]:
+    record = await run_registry(project_registry.get, project_name)
+    if record and record.get('owner') and record['owner'] != current_user.username:
+        raise HTTPException(status_code=403, detail="无权操作该Compose项目")
+    return record
+
+# 项目记录中的上一个任务已结束（但结束状态可能还未写回注册表）时返回其ID
+# 任务记录已丢失（提交它的进程已退出且未配置COMPOSE_JOB_DB）时，占用超过COMPOSE_TIMEOUT后视为已结束
+async def get_finished_job_id(record: Optional[Dict[str, Any]]) -> Optional[str]:
+    if not record or not record.get('last_job_id'):
+        return None
+    job = await compose_jobs.get(record['last_job_id'])
+    if job is not None:
+        finished = job.finished
+    else:
+        finished = (datetime.now() - datetime.fromisoformat(record['updated_at'])).total_seconds() > COMPOSE_TIMEOUT
+    return record['last_job_id'] if finished else None
+
+# 以docker-compose任务的形式提交操作，任务结束后把结果写回注册表
+# 先在注册表中占用项目，同一项目的并发请求只有一个能提交任务；content不为空时占用成功后才写入新的compose文件
+async def submit_compose_job(action: str, project_name: str, record: Optional[Dict[str, Any]], command: List[str],
+                             current_user: User, content: Optional[str] = None) -> Job:
+    job_id = uuid.uuid4().hex
+    fields = {"last_action": action}
+    if content is not None:
+        fields.update(compose_file=project_registry.compose_file_path(project_name), content_hash=content_hash(content))
+    try:
+        record = await run_registry(
+            project_registry.claim, project_name, job_id, current_user.username, await get_finished_job_id(record), **fields
+        )
+    except PermissionError:
+        raise HTTPException(status_code=403, detail="无权操作该Compose项目")
+    except ProjectBusyError:
+        raise HTTPException(status_code=409, detail=f"Compose堆栈 {project_name} 有正在执行的任务")
+    
+    async def on_finish(job: Job):
+        await run_registry(project_registry.finish, project_name, job.id, job.status)
+    
+    try:
+        if content is not None:
+            await run_registry(project_registry.write_compose_file, project_name, content)
+        args = COMPOSE_COMMAND.split() + ["-f", record['compose_file'], "-p", project_name] + command
+        return await compose_jobs.submit(action, project_name, args, current_user.username, on_finish=on_finish, job_id=job_id)
+    except Exception:
+        # 任务没有提交成功，释放占用
+        await run_registry(project_registry.finish, project_name, job_id, "error")
+        raise
+
+# 默认立即返回任务ID供轮询；wait=true时等待任务完成（不阻塞事件循环）
+async def respond_compose_job(job: Job, wait: bool) -> Dict[str, Any]:
+    text = COMPOSE_ACTION_TEXT[job.action]
+    if not wait:
+        return {
+            "status": "accepted",
+            "job_id": job.id,
+            "project_name": job.project_name,
+            "message": f"Compose堆栈 {job.project_name} {text}任务已提交"
+        }
+    
+    await compose_jobs.wait(job)
+    if job.status != "succeeded":
+        raise HTTPException(status_code=500, detail=f"{text}Compose堆栈失败")
+    
+    return {
+        "status": "success",
+        "job_id": job.id,
+        "project_name": job.project_name,
+        "message": f"Compose堆栈 {job.project_name} 已成功{text}"
+    }
 
 # 部署Compose堆栈
+# 内容未变化且所有服务都在运行时跳过部署（force=true强制重新部署）
 @compose_router.post("/up", response_model=Dict[str, Any])
-async def compose_up(compose_file: ComposeFile, current_user: User = Depends(get_current_active_user)):
+async def compose_up(compose_file: ComposeFile, wait: bool = False, force: bool = False, current_user: User = Depends(get_current_active_user)):
     try:
-        # 创建临时文件保存compose内容
-        with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.yml') as tmp:
-            tmp.write(compose_file.content)
-            tmp_path = tmp.name
-        
-        # 使用docker-compose命令部署堆栈
-        project_name = f"mcp_{os.path.basename(tmp_path).split('.')[0]}"
+        compose_data = parse_compose(compose_file.content)
+        project_name = resolve_project_name(compose_file, compose_data)
+        record = await get_user_project(project_name, current_user)
         
-        # 使用Docker SDK的API调用docker-compose
-        cmd = f"docker-compose -f {tmp_path} -p {project_name} up -d"
-        result = os.system(cmd)
-        
-        # 清理临时文件
-        os.unlink(tmp_path)
-        
-        if result != 0:
-            raise HTTPException(status_code=500, detail="部署Compose堆栈失败")
+        if (not force and record and record.get('content_hash') == content_hash(compose_file.content)
+                and record.get('last_action') == "up" and record.get('last_status') == "succeeded"):
+            services_index = await get_compose_services_index(project_name)
+            if build_compose_status(compose_data.get('services', {}).keys(), services_index).is_running:
+                return {
+                    "status": "unchanged",
+                    "project_name": project_name,
+                    "message": f"Compose堆栈 {project_name} 未变化，已跳过部署"
+                }
         
-        return {"status": "success", "message": f"Compose堆栈 {project_name} 已成功部署"}
+        job = await submit_compose_job(
+            "up", project_name, record, ["up", "-d", "--remove-orphans"], current_user, content=compose_file.content
+        )
+        return await respond_compose_job(job, wait)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"部署Compose堆栈错误: {str(e)}")
 
 # 停止Compose堆栈
 @compose_router.post("/down", response_model=Dict[str, Any])
-async def compose_down(compose_file: ComposeFile, current_user: User = Depends(get_current_active_user)):
+async def compose_down(compose_file: ComposeFile, wait: bool = False, current_user: User = Depends(get_current_active_user)):
     try:
-        # 创建临时文件保存compose内容
-        with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.yml') as tmp:
-            tmp.write(compose_file.content)
-            tmp_path = tmp.name
-        
-        # 使用docker-compose命令停止堆栈
-        project_name = f"mcp_{os.path.basename(tmp_path).split('.')[0]}"
-        
-        # 使用Docker SDK的API调用docker-compose
-        cmd = f"docker-compose -f {tmp_path} -p {project_name} down"
-        result = os.system(cmd)
+        compose_data = parse_compose(compose_file.content)
+        project_name = resolve_project_name(compose_file, compose_data)
+        record = await get_user_project(project_name, current_user)
         
-        # 清理临时文件
-        os.unlink(tmp_path)
-        
-        if result != 0:
-            raise HTTPException(status_code=500, detail="停止Compose堆栈失败")
-        
-        return {"status": "success", "message": f"Compose堆栈 {project_name} 已成功停止"}
+        job = await submit_compose_job("down", project_name, record, ["down"], current_user, content=compose_file.content)
+        return await respond_compose_job(job, wait)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"停止Compose堆栈错误: {str(e)}")
 
+# 获取compose项目的服务索引 service -> 容器摘要列表
+# 状态缓存可用时直接读内存索引，否则按compose项目标签做一次服务端过滤查询
+async def get_compose_services_index(project_name: str) -> Dict[str, List[Dict[str, Any]]]:
+    if state_cache.is_fresh():
+        return state_cache.compose_index().get(project_name, {})
+    label = f"{COMPOSE_PROJECT_LABEL}={project_name}"
+    containers = await run_docker(client.api.containers, all=True, filters={"label": label}, operation="list")
+    return build_compose_index(containers).get(project_name, {})
+
+# 根据服务索引汇总每个服务的状态，列出所有副本
+def build_compose_status(service_names, services_index: Dict[str, List[Dict[str, Any]]]) -> ComposeStatus:
+    services_status = {}
+    is_running = True
+    
+    for service_name in service_names:
+        replicas = sorted(
+            services_index.get(service_name, []),
+            key=lambda c: int((c.get('Labels') or {}).get(COMPOSE_NUMBER_LABEL) or 0)
+        )
+        
+        if replicas:
+            running = all(c['State'] == "running" for c in replicas)
+            not_running = [c for c in replicas if c['State'] != "running"]
+            services_status[service_name] = {
+                "id": replicas[0]['Id'],
+                "status": "running" if running else not_running[0]['State'],
+                "running": running,
+                "replicas": [{
+                    "id": c['Id'],
+                    "name": (c.get('Names') or ['/' + c['Id'][:12]])[0].lstrip('/'),
+                    "status": c['State'],
+                    "running": c['State'] == "running"
+                } for c in replicas]
+            }
+            if not running:
+                is_running = False
+        else:
+            services_status[service_name] = {
+                "id": None,
+                "status": "not_created",
+                "running": False,
+                "replicas": []
+            }
+            is_running = False
+    
+    return ComposeStatus(services=services_status, is_running=is_running)
+
 # 获取Compose堆栈状态
 @compose_router.post("/status", response_model=ComposeStatus)
 async def compose_status(compose_file: ComposeFile, current_user: User = Depends(get_current_active_user)):
     try:
-        # 创建临时文件保存compose内容
-        with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.yml') as tmp:
-            tmp.write(compose_file.content)
-            tmp_path = tmp.name
-        
-        # 解析compose文件获取服务名称
-        compose_data = yaml.safe_load(compose_file.content)
+        # 解析compose文件获取服务名称和项目名称
+        compose_data = parse_compose(compose_file.content)
         services = compose_data.get('services', {})
+        project_name = compose_file.project_name or compose_data.get('name')
         
-        # 获取所有容器
-        containers = client.containers.list(all=True)
-        
-        # 检查每个服务的状态
-        services_status = {}
-        is_running = True
-        
-        for service_name in services.keys():
-            service_containers = [c for c in containers if service_name in c.name]
-            
-            if service_containers:
-                container = service_containers[0]
-                services_status[service_name] = {
-                    "id": container.id,
-                    "status": container.status,
-                    "running": container.status == "running"
-                }
-                if container.status != "running":
-                    is_running = False
-            else:
-                services_status[service_name] = {
-                    "id": None,
-                    "status": "not_created",
-                    "running": False
-                }
-                is_running = False
-        
-        # 清理临时文件
-        os.unlink(tmp_path)
+        # 未显式指定项目时，若该内容曾通过本服务部署则使用其哈希项目名
+        if not project_name and await run_registry(project_registry.get, hash_project_name(compose_file.content)):
+            project_name = hash_project_name(compose_file.content)
         
-        return ComposeStatus(services=services_status, is_running=is_running)
+        # 无法确定项目时不按服务名匹配其他项目的容器（服务名在不同项目间可能重复），所有服务视为未创建
+        services_index = await get_compose_services_index(project_name) if project_name else {}
+        return build_compose_status(services.keys(), services_index)
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"获取Compose堆栈状态错误: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"获取Compose堆栈状态错误: {str(e)}")
+
+# 获取当前用户的任务，不存在或不属于当前用户时返回404
+async def get_user_job(job_id: str, current_user: User) -> Job:
+    job = await compose_jobs.get(job_id)
+    if job is None or job.owner != current_user.username:
+        raise HTTPException(status_code=404, detail="任务未找到")
+    return job
+
+# 列出Compose任务
+@compose_router.get("/jobs", response_model=List[ComposeJob])
+async def list_compose_jobs(current_user: User = Depends(get_current_active_user)):
+    return [job.to_dict(offset=len(job.output)) for job in await compose_jobs.list_jobs(current_user.username)]
+
+# 查询Compose任务状态，offset用于增量获取输出
+@compose_router.get("/jobs/{job_id}", response_model=ComposeJob)
+async def get_compose_job(job_id: str, offset: int = 0, current_user: User = Depends(get_current_active_user)):
+    job = await get_user_job(job_id, current_user)
+    return job.to_dict(offset=max(offset, 0))
+
+# 流式获取Compose任务输出（NDJSON），任务结束时输出最终状态
+@compose_router.get("/jobs/{job_id}/stream")
+async def stream_compose_job(job_id: str, current_user: User = Depends(get_current_active_user)):
+    job = await get_user_job(job_id, current_user)
+    
+    async def lines():
+        async for line in compose_jobs.follow(job):
+            yield json.dumps(line, ensure_ascii=False) + "\n"
+        yield json.dumps({"status": job.status, "returncode": job.returncode, "error": job.error}, ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+# 列出当前用户已部署的Compose项目
+@compose_router.get("/projects", response_model=List[ComposeProject])
+async def list_compose_projects(current_user: User = Depends(get_current_active_user)):
+    return await run_registry(project_registry.list_projects, owner=current_user.username)
+
+# 获取已注册项目的记录和compose内容，不存在时返回404
+async def get_registered_project(project_name: str, current_user: User):
+    record = await run_registry(project_registry.get, project_name)
+    if record is None or record.get('owner') != current_user.username:
+        raise HTTPException(status_code=404, detail="Compose项目未找到")
+    content = await run_registry(project_registry.read_compose_file, project_name)
+    if content is None:
+        raise HTTPException(status_code=404, detail="Compose项目文件不存在")
+    return record, content
+
+# 按项目名称获取Compose堆栈状态（无需重新上传compose文件）
+@compose_router.get("/projects/{project_name}/status", response_model=ComposeStatus)
+async def compose_project_status(project_name: str, current_user: User = Depends(get_current_active_user)):
+    _, content = await get_registered_project(project_name, current_user)
+    services = parse_compose(content).get('services', {})
+    services_index = await get_compose_services_index(project_name)
+    return build_compose_status(services.keys(), services_index)
+
+# 按项目名称停止Compose堆栈（使用注册表中保存的compose文件）
+@compose_router.post("/projects/{project_name}/down", response_model=Dict[str, Any])
+async def compose_project_down(project_name: str, wait: bool = False, current_user: User = Depends(get_current_active_user)):
+    record, _ = await get_registered_project(project_name, current_user)
+    job = await submit_compose_job("down", project_name, record, ["down"], current_user)
+    return await respond_compose_job(job, wait)
@@ -1,71 +1,380 @@
 import docker
 import os
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List, Optional
-from app_modules.models import Container, ContainerCreate, User
+import json
+import time
+import base64
+import binascii
+import struct
+import asyncio
+from datetime import datetime, timezone
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from starlette.concurrency import iterate_in_threadpool
+from typing import Annotated, Any, Callable, Dict, List, Optional, Set, Tuple
+from app_modules.models import (Container, ContainerCreate, ContainerFields, ContainerBulkRequest,
+                                ContainerBulkResponse, User)
 from app_modules.auth import get_current_active_user
+from app_modules.executor import run_docker
+from app_modules.state import state_cache
+from app_modules.docker_client import client
+from app_modules.streaming import ClosingStreamingResponse
 
 # 创建路由器
 container_router = APIRouter()
 
-# 创建Docker客户端
-client = docker.from_env()
+# 批量操作的默认并发数（实际并发还受Docker操作线程池大小限制）
+CONTAINER_BULK_CONCURRENCY = int(os.getenv("CONTAINER_BULK_CONCURRENCY", 8))
+# 单次批量操作的容器数上限
+CONTAINER_BULK_MAX_ITEMS = int(os.getenv("CONTAINER_BULK_MAX_ITEMS", 200))
+# 容器列表分页时每页的最大条数
+CONTAINER_LIST_MAX_LIMIT = int(os.getenv("CONTAINER_LIST_MAX_LIMIT", 500))
 
-# 将Docker容器对象转换为API模型
-def convert_container(container):
-    ports = {}
-    if container.attrs['NetworkSettings']['Ports']:
-        for port, bindings in container.attrs['NetworkSettings']['Ports'].items():
-            if bindings:
-                ports[port] = bindings
+# 容器列表可排序的字段，字段名前加"-"表示降序
+CONTAINER_SORT_FIELDS = ("name", "image", "status", "created")
+# 容器状态过滤可用的值
+CONTAINER_STATUSES = ("created", "restarting", "running", "removing", "paused", "exited", "dead")
+# fields参数可选的字段，id总是返回
+CONTAINER_FIELDS = ("id", "name", "image", "status", "created", "ports", "volumes", "environment")
+
+# 按需要的字段构造容器模型：fields为None时返回完整的Container，否则只包含这些字段
+def build_container(values: Dict[str, Any], fields: Optional[Set[str]]):
+    if fields is None:
+        return Container(**values)
+    return ContainerFields(**{key: value for key, value in values.items() if key == "id" or key in fields})
+
+# 将Docker容器对象转换为API模型，fields指定时跳过未请求字段的计算（如镜像标签需要额外的API调用）
+def convert_container(container, fields: Optional[Set[str]] = None):
+    values = {"id": container.id}
+    wanted = lambda field: fields is None or field in fields
+    
+    if wanted("ports"):
+        ports = {}
+        if container.attrs['NetworkSettings']['Ports']:
+            for port, bindings in container.attrs['NetworkSettings']['Ports'].items():
+                if bindings:
+                    ports[port] = bindings
+        values["ports"] = ports
+    
+    if wanted("volumes"):
+        volumes = []
+        if container.attrs['Mounts']:
+            for mount in container.attrs['Mounts']:
+                volumes.append({
+                    'source': mount['Source'],
+                    'target': mount['Destination'],
+                    'type': mount['Type']
+                })
+        values["volumes"] = volumes
+    
+    if wanted("environment"):
+        environment = {}
+        if container.attrs['Config']['Env']:
+            for env in container.attrs['Config']['Env']:
+                if '=' in env:
+                    key, value = env.split('=', 1)
+                    environment[key] = value
+        values["environment"] = environment
+    
+    if wanted("name"):
+        values["name"] = container.name
+    if wanted("image"):
+        values["image"] = container.image.tags[0] if container.image.tags else container.image.id
+    if wanted("status"):
+        values["status"] = container.status
+    if wanted("created"):
+        values["created"] = container.attrs['Created']
+    return build_container(values, fields)
+
+# 构建镜像ID到标签的映射，整个列表请求共享，只需一次/images/json调用
+def build_image_tag_map(images) -> Dict[str, str]:
+    image_tags = {}
+    for image in images:
+        tags = [tag for tag in (image.get('RepoTags') or []) if tag != '<none>:<none>']
+        if tags:
+            image_tags[image['Id']] = tags[0]
+    return image_tags
+
+# 将/containers/json返回的容器摘要转换为API模型（不触发inspect调用），fields指定时只计算这些字段
+def convert_container_summary(summary, image_tags: Dict[str, str], fields: Optional[Set[str]] = None):
+    values = {"id": summary['Id'], "environment": None}
+    wanted = lambda field: fields is None or field in fields
+    
+    if wanted("ports"):
+        ports = {}
+        for port in summary.get('Ports') or []:
+            if port.get('PublicPort'):
+                key = f"{port['PrivatePort']}/{port.get('Type', 'tcp')}"
+                ports.setdefault(key, []).append({
+                    'HostIp': port.get('IP', ''),
+                    'HostPort': str(port['PublicPort'])
+                })
+        values["ports"] = ports
     
-    volumes = []
-    if container.attrs['Mounts']:
-        for mount in container.attrs['Mounts']:
+    if wanted("volumes"):
+        volumes = []
+        for mount in summary.get('Mounts') or []:
             volumes.append({
-                'source': mount['Source'],
+                'source': mount.get('Source', ''),
                 'target': mount['Destination'],
                 'type': mount['Type']
             })
+        values["volumes"] = volumes
     
-    environment = {}
-    if container.attrs['Config']['Env']:
-        for env in container.attrs['Config']['Env']:
-            if '=' in env:
-                key, value = env.split('=', 1)
-                environment[key] = value
-    
-    return Container(
-        id=container.id,
-        name=container.name,
-        image=container.image.tags[0] if container.image.tags else container.image.id,
-        status=container.status,
-        created=container.attrs['Created'],
-        ports=ports,
-        volumes=volumes,
-        environment=environment
-    )
+    if wanted("name"):
+        names = summary.get('Names') or []
+        values["name"] = names[0].lstrip('/') if names else summary['Id'][:12]
+    if wanted("image"):
+        image_id = summary.get('ImageID', '')
+        values["image"] = image_tags.get(image_id, image_id)
+    if wanted("status"):
+        values["status"] = summary['State']
+    if wanted("created"):
+        values["created"] = datetime.fromtimestamp(summary['Created'], tz=timezone.utc)
+    return build_container(values, fields)
 
-# 获取所有容器
-@container_router.get("/", response_model=List[Container])
-async def list_containers(current_user: User = Depends(get_current_active_user)):
+# 解析fields参数（逗号分隔），未指定时返回None表示全部字段
+def parse_container_fields(fields: Optional[str]) -> Optional[Set[str]]:
+    if fields is None:
+        return None
+    selected = {field.strip() for field in fields.split(',') if field.strip()}
+    unknown = selected - set(CONTAINER_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"未知的字段: {', '.join(sorted(unknown))}")
+    return selected | {"id"}
+
+# 只保留请求的字段：为过滤和排序额外计算的字段不出现在响应中（响应使用response_model_exclude_unset）
+def project_containers(containers: List[Any], fields: Set[str]) -> List[ContainerFields]:
+    return [
+        container if container.model_fields_set <= fields
+        else ContainerFields.model_construct(**container.model_dump(include=fields))
+        for container in containers
+    ]
+
+# 将label查询参数（"key"或"key=value"）转换为 标签 -> 值 的映射，值为None表示只要求存在该标签
+def parse_label_filters(labels: Optional[List[str]]) -> Dict[str, Optional[str]]:
+    parsed = {}
+    for label in labels or []:
+        key, sep, value = label.partition('=')
+        if not key:
+            raise HTTPException(status_code=400, detail=f"无效的label参数: {label}")
+        parsed[key] = value if sep else None
+    return parsed
+
+# 可以交给Docker处理的过滤条件（/containers/json的filters参数）
+def build_docker_filters(status_filter: Optional[str], labels: Dict[str, Optional[str]]) -> Dict[str, List[str]]:
+    filters = {}
+    if status_filter:
+        filters["status"] = [status_filter]
+    if labels:
+        filters["label"] = [key if value is None else f"{key}={value}" for key, value in labels.items()]
+    return filters
+
+# 在状态缓存中的容器摘要上应用与Docker filters相同的过滤
+def summary_matches(summary: Dict[str, Any], status_filter: Optional[str], labels: Dict[str, Optional[str]]) -> bool:
+    if status_filter and summary.get('State') != status_filter:
+        return False
+    summary_labels = summary.get('Labels') or {}
+    return all(key in summary_labels and (value is None or summary_labels[key] == value)
+               for key, value in labels.items())
+
+# 排序键：排序字段的值加容器ID，保证顺序稳定
+def container_sort_key(container: Container, field: str) -> Tuple[Any, str]:
+    if field == "created":
+        return (container.created.timestamp(), container.id)
+    return (getattr(container, field), container.id)
+
+# 游标是上一页最后一个容器的排序键，编码为URL安全的base64
+def encode_cursor(sort: str, key: Tuple[Any, str]) -> str:
+    return base64.urlsafe_b64encode(json.dumps([sort, *key]).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor: str, sort: str) -> Tuple[Any, str]:
+    try:
+        cursor_sort, value, container_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (binascii.Error, UnicodeError, ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="无效的cursor参数")
+    if cursor_sort != sort:
+        raise HTTPException(status_code=400, detail="cursor与sort参数不匹配")
+    return (value, container_id)
+
+# 排序并取出一页，返回（本页容器，下一页游标）
+def paginate_containers(containers: List[Container], sort: str, cursor: Optional[str],
+                        limit: Optional[int]) -> Tuple[List[Container], Optional[str]]:
+    field, descending = sort.lstrip('-'), sort.startswith('-')
+    containers = sorted(containers, key=lambda c: container_sort_key(c, field), reverse=descending)
+    if cursor:
+        after = decode_cursor(cursor, sort)
+        if descending:
+            containers = [c for c in containers if container_sort_key(c, field) < after]
+        else:
+            containers = [c for c in containers if container_sort_key(c, field) > after]
+    if limit is None or len(containers) <= limit:
+        return containers, None
+    page = containers[:limit]
+    return page, encode_cursor(sort, container_sort_key(page[-1], field))
+
+# 查询并过滤容器，返回API模型列表（容器列表接口和Claude工具共用）
+# 默认基于容器摘要构建列表（状态缓存可用时直接读内存，否则单次/containers/json查询）；
+# detail=full时逐个inspect以返回环境变量等完整字段
+# status和label过滤交给Docker（或在状态缓存上执行），名称和镜像前缀在转换后过滤；compute指定时只计算这些字段
+async def list_container_models(detail: str = "summary", status_filter: Optional[str] = None,
+                                labels: Optional[Dict[str, Optional[str]]] = None, name: Optional[str] = None,
+                                image: Optional[str] = None, compute: Optional[Set[str]] = None) -> List[Any]:
+    labels = labels or {}
+    filters = build_docker_filters(status_filter, labels)
+    
+    def list_full():
+        containers = client.containers.list(all=True, filters=filters) if filters else client.containers.list(all=True)
+        return [convert_container(container, compute) for container in containers]
+    
+    def list_summary():
+        summaries = client.api.containers(all=True, filters=filters) if filters else client.api.containers(all=True)
+        image_tags = build_image_tag_map(client.api.images()) if compute is None or "image" in compute else {}
+        return [convert_container_summary(summary, image_tags, compute) for summary in summaries]
+    
     try:
-        containers = client.containers.list(all=True)
-        return [convert_container(container) for container in containers]
+        if detail == "full":
+            containers = await run_docker(list_full, operation="list")
+        elif state_cache.is_fresh():
+            image_tags = build_image_tag_map(state_cache.list_images()) if compute is None or "image" in compute else {}
+            containers = [
+                convert_container_summary(summary, image_tags, compute) for summary in state_cache.list_containers()
+                if summary_matches(summary, status_filter, labels)
+            ]
+        else:
+            containers = await run_docker(list_summary, operation="list")
     except docker.errors.APIError as e:
         raise HTTPException(status_code=500, detail=f"Docker API错误: {str(e)}")
+    
+    if name:
+        containers = [c for c in containers if c.name.startswith(name)]
+    if image:
+        containers = [c for c in containers if c.image.startswith(image)]
+    return containers
 
-# 获取单个容器
-@container_router.get("/{container_id}", response_model=Container)
-async def get_container(container_id: str, current_user: User = Depends(get_current_active_user)):
+# 获取所有容器
+# 指定sort或limit时按字段排序并分页，总数和下一页游标通过X-Total-Count和X-Next-Cursor响应头返回
+# 指定fields时只计算和返回这些字段；不需要environment时即使detail=full也不逐个inspect
+# 未指定fields时返回所有字段，响应模型中除id外的字段都可能被省略
+@container_router.get("/", response_model=List[ContainerFields], response_model_exclude_unset=True)
+async def list_containers(response: Response, detail: str = "summary",
+                          status_filter: Annotated[Optional[str], Query(alias="status")] = None,
+                          label: Annotated[Optional[List[str]], Query()] = None, name: Optional[str] = None,
+                          image: Optional[str] = None, sort: Optional[str] = None,
+                          limit: Optional[int] = None, cursor: Optional[str] = None, fields: Optional[str] = None,
+                          current_user: User = Depends(get_current_active_user)):
+    if detail not in ("summary", "full"):
+        raise HTTPException(status_code=400, detail="detail参数只能为summary或full")
+    if status_filter is not None and status_filter not in CONTAINER_STATUSES:
+        raise HTTPException(status_code=400, detail=f"status参数只能为{'、'.join(CONTAINER_STATUSES)}")
+    if sort is not None and sort.lstrip('-') not in CONTAINER_SORT_FIELDS:
+        raise HTTPException(status_code=400, detail=f"sort参数只能为{'、'.join(CONTAINER_SORT_FIELDS)}（可加-前缀降序）")
+    if limit is not None and not 1 <= limit <= CONTAINER_LIST_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit参数必须在1到{CONTAINER_LIST_MAX_LIMIT}之间")
+    labels = parse_label_filters(label)
+    selected = parse_container_fields(fields)
+    paginated = sort is not None or limit is not None or cursor is not None
+    sort = sort or "-created"
+    
+    # 需要计算的字段：请求的字段，加上过滤和排序用到的字段
+    compute = None
+    if selected is not None:
+        compute = set(selected)
+        compute.update(field for field, used in (("name", name), ("image", image)) if used)
+        if paginated:
+            compute.add(sort.lstrip('-'))
+        if detail == "full" and "environment" not in selected:
+            detail = "summary"
+    
+    containers = await list_container_models(detail, status_filter, labels, name, image, compute)
+    
+    headers = {}
+    if paginated:
+        total = len(containers)
+        containers, next_cursor = paginate_containers(containers, sort, cursor, limit)
+        headers["X-Total-Count"] = str(total)
+        if next_cursor:
+            headers["X-Next-Cursor"] = next_cursor
+    response.headers.update(headers)
+    if selected is not None:
+        return project_containers(containers, selected)
+    return containers
+
+# 在Docker线程池中执行单个容器的操作，并把Docker错误转换为HTTP错误（单个和批量接口共用）
+async def run_container_operation(func: Callable[..., Any], *args, operation: str, **kwargs) -> Any:
     try:
-        container = client.containers.get(container_id)
-        return convert_container(container)
+        return await run_docker(func, *args, operation=operation, **kwargs)
     except docker.errors.NotFound:
         raise HTTPException(status_code=404, detail="容器未找到")
     except docker.errors.APIError as e:
         raise HTTPException(status_code=500, detail=f"Docker API错误: {str(e)}")
 
+# 以下为在Docker线程池中执行的单个容器操作
+def inspect_container(container_id: str, fields: Optional[Set[str]] = None):
+    return convert_container(client.containers.get(container_id), fields)
+
+def start_container_sync(container_id: str):
+    container = client.containers.get(container_id)
+    container.start()
+    return convert_container(container)
+
+def stop_container_sync(container_id: str):
+    container = client.containers.get(container_id)
+    container.stop()
+    return convert_container(container)
+
+def restart_container_sync(container_id: str):
+    container = client.containers.get(container_id)
+    container.restart()
+    return convert_container(container)
+
+def remove_container_sync(container_id: str, force: bool = False):
+    container = client.containers.get(container_id)
+    container.remove(force=force)
+
+# 批量操作支持的动作：动作 -> (同步函数, 线程池操作名)；重启包含停止，使用停止操作的超时
+BULK_ACTIONS = {
+    "start": (start_container_sync, "start"),
+    "stop": (stop_container_sync, "stop"),
+    "restart": (restart_container_sync, "stop"),
+    "remove": (remove_container_sync, "remove")
+}
+
+# 按ID、名称或唯一的ID前缀查询单个容器的摘要（与inspect的匹配规则一致），不存在时返回None
+def find_container_summary(container_id: str) -> Optional[Dict[str, Any]]:
+    summaries = client.api.containers(all=True, filters={"id": [container_id]})
+    exact = [summary for summary in summaries if summary['Id'] == container_id]
+    if exact or len(summaries) == 1:
+        return (exact or summaries)[0]
+    for summary in client.api.containers(all=True, filters={"name": [container_id]}):
+        if '/' + container_id in (summary.get('Names') or []):
+            return summary
+    return None
+
+# 从摘要构建只包含部分字段的容器，需要镜像标签时只查询该容器的镜像
+def summary_container_sync(container_id: str, fields: Set[str]):
+    summary = find_container_summary(container_id)
+    if summary is None:
+        raise docker.errors.NotFound("容器未找到")
+    image_tags = build_image_tag_map([client.api.inspect_image(summary['ImageID'])]) if "image" in fields else {}
+    return convert_container_summary(summary, image_tags, fields)
+
+# 获取单个容器
+# 指定fields且不需要environment时从容器摘要构建，不调用inspect（状态缓存可用时直接读内存）
+@container_router.get("/{container_id}", response_model=ContainerFields, response_model_exclude_unset=True)
+async def get_container(container_id: str, fields: Optional[str] = None, current_user: User = Depends(get_current_active_user)):
+    selected = parse_container_fields(fields)
+    if selected is None:
+        return await run_container_operation(inspect_container, container_id, operation="inspect")
+    if "environment" in selected:
+        return await run_container_operation(inspect_container, container_id, selected, operation="inspect")
+    
+    if state_cache.is_fresh():
+        summary = state_cache.find_container(container_id)
+        if summary is None:
+            raise HTTPException(status_code=404, detail="容器未找到")
+        image_tags = build_image_tag_map(state_cache.list_images()) if "image" in selected else {}
+        return convert_container_summary(summary, image_tags, selected)
+    return await run_container_operation(summary_container_sync, container_id, selected, operation="list")
+
 # 创建容器
 @container_router.post("/create", response_model=Container, status_code=status.HTTP_201_CREATED)
 async def create_container(container_data: ContainerCreate, current_user: User = Depends(get_current_active_user)):
@@ -83,16 +392,18 @@ async def create_container(container_data: ContainerCreate, current_user: User =
                 volumes[host_path] = {'bind': container_path, 'mode': 'rw'}
         
         # 创建容器
-        container = client.containers.create(
-            image=container_data.image,
-            name=container_data.name,
-            ports=ports,
-            volumes=volumes,
-            environment=container_data.environment,
-            command=container_data.command
-        )
+        def create():
+            container = client.containers.create(
+                image=container_data.image,
+                name=container_data.name,
+                ports=ports,
+                volumes=volumes,
+                environment=container_data.environment,
+                command=container_data.command
+            )
+            return convert_container(container)
         
-        return convert_container(container)
+        return await run_docker(create, operation="create")
     except docker.errors.ImageNotFound:
         raise HTTPException(status_code=404, detail="镜像未找到")
     except docker.errors.APIError as e:
@@ -101,47 +412,177 @@ async def create_container(container_data: ContainerCreate, current_user: User =
 # 启动容器
 @container_router.post("/{container_id}/start", response_model=Container)
 async def start_container(container_id: str, current_user: User = Depends(get_current_active_user)):
-    try:
-        container = client.containers.get(container_id)
-        container.start()
-        return convert_container(container)
-    except docker.errors.NotFound:
-        raise HTTPException(status_code=404, detail="容器未找到")
-    except docker.errors.APIError as e:
-        raise HTTPException(status_code=500, detail=f"Docker API错误: {str(e)}")
+    return await run_container_operation(start_container_sync, container_id, operation="start")
 
 # 停止容器
 @container_router.post("/{container_id}/stop", response_model=Container)
 async def stop_container(container_id: str, current_user: User = Depends(get_current_active_user)):
-    try:
-        container = client.containers.get(container_id)
-        container.stop()
-        return convert_container(container)
-    except docker.errors.NotFound:
-        raise HTTPException(status_code=404, detail="容器未找到")
-    except docker.errors.APIError as e:
-        raise HTTPException(status_code=500, detail=f"Docker API错误: {str(e)}")
+    return await run_container_operation(stop_container_sync, container_id, operation="stop")
+
+# 重启容器
+@container_router.post("/{container_id}/restart", response_model=Container)
+async def restart_container(container_id: str, current_user: User = Depends(get_current_active_user)):
+    return await run_container_operation(restart_container_sync, container_id, operation="stop")
 
 # 删除容器
 @container_router.delete("/{container_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_container(container_id: str, force: bool = False, current_user: User = Depends(get_current_active_user)):
+    await run_container_operation(remove_container_sync, container_id, force=force, operation="remove")
+    return {"detail": "容器已删除"}
+
+# 按标签选择容器，返回容器ID列表；状态缓存可用时直接读内存，否则按标签过滤查询一次
+async def select_containers_by_labels(labels: Dict[str, str]) -> List[str]:
+    if state_cache.is_fresh():
+        return [
+            summary['Id'] for summary in state_cache.list_containers()
+            if all((summary.get('Labels') or {}).get(key) == value for key, value in labels.items())
+        ]
+    filters = {"label": [f"{key}={value}" for key, value in labels.items()]}
     try:
-        container = client.containers.get(container_id)
-        container.remove(force=force)
-        return {"detail": "容器已删除"}
-    except docker.errors.NotFound:
-        raise HTTPException(status_code=404, detail="容器未找到")
+        summaries = await run_docker(client.api.containers, all=True, filters=filters, operation="list")
     except docker.errors.APIError as e:
         raise HTTPException(status_code=500, detail=f"Docker API错误: {str(e)}")
+    return [summary['Id'] for summary in summaries]
+
+# 对一个容器执行批量操作中的一项，错误记录在结果中而不是中断整个批次；
+# 连接中断等非HTTP错误也只记为该项失败（500），使客户端知道哪些操作已经执行
+async def run_bulk_item(container_id: str, request: ContainerBulkRequest, semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+    func, operation = BULK_ACTIONS[request.action]
+    kwargs = {"force": request.force} if request.action == "remove" else {}
+    started = time.monotonic()
+    async with semaphore:
+        try:
+            container = await run_container_operation(func, container_id, operation=operation, **kwargs)
+            item = {"id": container_id, "status": "succeeded", "status_code": 200, "container": container}
+        except HTTPException as e:
+            item = {"id": container_id, "status": "failed", "status_code": e.status_code, "error": e.detail}
+        except Exception as e:
+            item = {"id": container_id, "status": "failed", "status_code": 500, "error": f"Docker错误: {str(e)}"}
+    item["duration"] = round(time.monotonic() - started, 3)
+    return item
+
+# 批量启动、停止、重启或删除容器
+# 按ID列表或标签选择容器，以有限的并发同时执行，返回每个容器的结果
+@container_router.post("/bulk", response_model=ContainerBulkResponse)
+async def bulk_container_operation(request: ContainerBulkRequest, current_user: User = Depends(get_current_active_user)):
+    if bool(request.ids) == bool(request.labels):
+        raise HTTPException(status_code=400, detail="ids和labels必须指定其中一个")
+    
+    started = time.monotonic()
+    container_ids = list(dict.fromkeys(request.ids)) if request.ids else await select_containers_by_labels(request.labels)
+    if len(container_ids) > CONTAINER_BULK_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"单次批量操作最多{CONTAINER_BULK_MAX_ITEMS}个容器")
+    
+    semaphore = asyncio.Semaphore(max(1, min(request.max_concurrency or CONTAINER_BULK_CONCURRENCY, CONTAINER_BULK_CONCURRENCY)))
+    results = await asyncio.gather(*(run_bulk_item(container_id, request, semaphore) for container_id in container_ids))
+    succeeded = sum(1 for item in results if item["status"] == "succeeded")
+    return {
+        "action": request.action,
+        "results": results,
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "duration": round(time.monotonic() - started, 3)
+    }
 
 # 获取容器日志
 @container_router.get("/{container_id}/logs")
 async def get_container_logs(container_id: str, tail: Optional[int] = 100, current_user: User = Depends(get_current_active_user)):
-    try:
+    def logs():
         container = client.containers.get(container_id)
-        logs = container.logs(tail=tail, timestamps=True).decode('utf-8')
-        return {"logs": logs}
-    except docker.errors.NotFound:
-        raise HTTPException(status_code=404, detail="容器未找到")
-    except docker.errors.APIError as e:
-        raise HTTPException(status_code=500, detail=f"Docker API错误: {str(e)}")
\ No newline at end of file
+        return container.logs(tail=tail, timestamps=True).decode('utf-8', errors='replace')
+    
+    return {"logs": await run_container_operation(logs, operation="logs")}
+
+# 多路复用日志流中的流编号
+LOG_STREAM_NAMES = {0: "stdin", 1: "stdout", 2: "stderr"}
+
+# 将一行日志（带时间戳）转换为帧
+def make_log_frame(stream_name: str, line: bytes):
+    text = line.rstrip(b'\n').decode('utf-8', errors='replace')
+    timestamp, _, message = text.partition(' ')
+    return {"stream": stream_name, "timestamp": timestamp, "line": message}
+
+# 逐帧读取日志响应：非TTY容器按8字节头部拆分stdout/stderr，TTY容器按行拆分；
+# 一个数据帧可能在行中间结束，未结束的行按流分别缓冲，与下一个数据帧拼接
+def iter_log_frames(response, tty: bool):
+    if tty:
+        buffer = b''
+        for chunk in response.iter_content(chunk_size=4096, decode_unicode=False):
+            buffer += chunk
+            while b'\n' in buffer:
+                line, buffer = buffer.split(b'\n', 1)
+                yield make_log_frame("stdout", line)
+        if buffer:
+            yield make_log_frame("stdout", buffer)
+        return
+    
+    buffers: Dict[int, bytes] = {}
+    while True:
+        header = response.raw.read(8)
+        if len(header) < 8:
+            break
+        stream_id, length = struct.unpack('>BxxxL', header)
+        if not length:
+            continue
+        data = response.raw.read(length)
+        if not data:
+            break
+        buffer = buffers.get(stream_id, b'') + data
+        while b'\n' in buffer:
+            line, buffer = buffer.split(b'\n', 1)
+            yield make_log_frame(LOG_STREAM_NAMES.get(stream_id, "stdout"), line)
+        buffers[stream_id] = buffer
+    for stream_id, buffer in buffers.items():
+        if buffer:
+            yield make_log_frame(LOG_STREAM_NAMES.get(stream_id, "stdout"), buffer)
+
+# 打开容器日志流；docker SDK的logs(stream=True)会丢弃流编号，因此直接请求日志接口并自行拆帧，
+# 与SDK的流式接口一样取消套接字的读取超时，避免follow时容器长时间没有输出导致流被中断
+def open_log_stream(container_id: str, follow: bool, tail: Optional[int], since: Optional[float],
+                    until: Optional[float], stdout: bool, stderr: bool):
+    container = client.containers.get(container_id)
+    params = {
+        'stdout': int(stdout),
+        'stderr': int(stderr),
+        'timestamps': 1,
+        'follow': int(follow),
+        'tail': tail if tail is not None and tail >= 0 else 'all'
+    }
+    if since is not None:
+        params['since'] = since
+    if until is not None:
+        params['until'] = until
+    url = client.api._url("/containers/{0}/logs", container.id)
+    response = client.api._get(url, params=params, stream=True)
+    try:
+        client.api._raise_for_status(response)
+        client.api._disable_socket_timeout(client.api._get_raw_response_socket(response))
+    except Exception:
+        response.close()
+        raise
+    return response, bool(container.attrs['Config'].get('Tty'))
+
+# 流式获取容器日志
+# 以NDJSON或SSE逐帧推送，读取速度受客户端消费速度约束（背压），不在服务端缓冲完整日志
+@container_router.get("/{container_id}/logs/stream")
+async def stream_container_logs(container_id: str, follow: bool = False, tail: Optional[int] = 100,
+                                since: Optional[float] = None, until: Optional[float] = None,
+                                stdout: bool = True, stderr: bool = True, format: str = "ndjson",
+                                current_user: User = Depends(get_current_active_user)):
+    if format not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="format参数只能为ndjson或sse")
+    response, tty = await run_container_operation(open_log_stream, container_id, follow, tail, since, until,
+                                                  stdout, stderr, operation="logs")
+    
+    # 日志读取在通用线程池中逐帧进行，避免长时间的follow流占用Docker操作线程池
+    async def frames():
+        async for frame in iterate_in_threadpool(iter_log_frames(response, tty)):
+            data = json.dumps(frame, ensure_ascii=False)
+            if format == "sse":
+                yield f"event: {frame['stream']}\ndata: {data}\n\n"
+            else:
+                yield data + "\n"
+    
+    # 响应结束或客户端断开时（包括还未开始读取日志时）关闭连接，使阻塞在读取上的线程立即退出
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return ClosingStreamingResponse(frames(), on_close=response.close, media_type=media_type)
\ No newline at end of file
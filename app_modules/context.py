@@ -0,0 +1,124 @@
+import os
+import re
+import json
+import hashlib
+from typing import Any, Dict, List, Tuple
+
+# 放入提示词的Docker环境信息的token预算
+CLAUDE_CONTEXT_TOKEN_BUDGET = int(os.getenv("CLAUDE_CONTEXT_TOKEN_BUDGET", 1500))
+
+# 提示词中可能是容器ID前缀的单词：至少包含一个数字，避免把dead、cafe、added等英文单词当作ID；
+# 边界只按英文字母和数字判断（Python的\b把中文字符也当作单词字符，"查看容器00000000018f的日志"中的ID无法匹配）
+ID_PREFIX_PATTERN = re.compile(r"(?<![0-9A-Za-z])(?=[a-f]*[0-9])[0-9a-f]{4,64}(?![0-9A-Za-z])")
+
+# 估算文本的token数：ASCII约4个字符一个token，中文等非ASCII字符按一个字符一个token计
+def estimate_tokens(text: str) -> int:
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return (len(text) - non_ascii + 3) // 4 + non_ascii
+
+# 镜像标签中的仓库名，如 registry.example.com/library/nginx:1.25 -> nginx
+def image_repository(tag: str) -> str:
+    return tag.rsplit(':', 1)[0].rsplit('/', 1)[-1].lower() if tag else ''
+
+# 按与提示词的相关程度给容器打分：提示词中提到的名称、ID、镜像优先，其次是运行中的容器
+def score_container(container: Dict[str, Any], prompt: str, id_prefixes: List[str]) -> int:
+    score = 0
+    name = (container.get('name') or '').lower()
+    if name and name in prompt:
+        score += 100
+    if any(container.get('id', '').startswith(prefix) for prefix in id_prefixes):
+        score += 100
+    repository = image_repository(container.get('image') or '')
+    if repository and repository in prompt:
+        score += 50
+    if container.get('status') == 'running':
+        score += 10
+    return score
+
+# 按与提示词的相关程度给镜像打分：提示词中提到的镜像优先，其次是被容器使用的镜像
+def score_image(image: Dict[str, Any], prompt: str, used_tags: set) -> int:
+    score = 0
+    tags = image.get('tags') or []
+    if any(image_repository(tag) and image_repository(tag) in prompt for tag in tags):
+        score += 50
+    if any(tag in used_tags for tag in tags):
+        score += 10
+    return score
+
+# 在预算内按顺序放入表格行，返回放入的行和剩余预算
+def fill_rows(rows: List[str], budget: int) -> Tuple[List[str], int]:
+    kept = []
+    for row in rows:
+        cost = estimate_tokens(row) + 1
+        if cost > budget:
+            break
+        kept.append(row)
+        budget -= cost
+    return kept, budget
+
+# Docker环境信息的指纹，环境未变化时保持不变（不含时间戳）
+def context_fingerprint(context: Dict[str, Any]) -> str:
+    data = {key: context.get(key) for key in ("containers", "images", "error")}
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+# 已生成的环境文本是否包含提示词中提到的所有容器和镜像
+def snapshot_covers_prompt(snapshot: str, context: Dict[str, Any], prompt: str) -> bool:
+    prompt = prompt.lower()
+    id_prefixes = ID_PREFIX_PATTERN.findall(prompt)
+    for container in context.get('containers') or []:
+        if score_container(container, prompt, id_prefixes) >= 50 and f"|{container.get('id')}|" not in snapshot:
+            return False
+    for image in context.get('images') or []:
+        if score_image(image, prompt, set()) >= 50 and f"|{image.get('id')}|" not in snapshot:
+            return False
+    return True
+
+# 将Docker环境信息编码为紧凑的表格文本，按相关程度排序并限制在token预算内
+# 放不下的条目用一行汇总代替，让模型知道信息被截断
+def format_docker_context(context: Dict[str, Any], prompt: str = "", token_budget: int = CLAUDE_CONTEXT_TOKEN_BUDGET) -> str:
+    if context.get('error'):
+        return f"Docker环境信息不可用: {context['error']}"
+
+    prompt = prompt.lower()
+    id_prefixes = ID_PREFIX_PATTERN.findall(prompt)
+    containers = sorted(
+        context.get('containers') or [],
+        key=lambda c: score_container(c, prompt, id_prefixes),
+        reverse=True
+    )
+    used_tags = {c.get('image') for c in containers}
+    images = sorted(
+        context.get('images') or [],
+        key=lambda i: score_image(i, prompt, used_tags),
+        reverse=True
+    )
+
+    container_rows = [
+        f"{c.get('name')}|{c.get('id')}|{c.get('image')}|{c.get('status')}" for c in containers
+    ]
+    image_rows = [
+        f"{','.join(i.get('tags') or []) or '<none>'}|{i.get('id')}|{i.get('size')}" for i in images
+    ]
+
+    # 为表头和截断汇总行预留预算，剩余预算先分给容器，再分给镜像
+    reserved = 60
+    budget = max(token_budget - reserved, 0)
+    kept_containers, budget = fill_rows(container_rows, budget)
+    kept_images, budget = fill_rows(image_rows, budget)
+
+    lines = [f"容器 {len(kept_containers)}/{len(containers)} (name|id|image|status):"]
+    lines.extend(kept_containers)
+    omitted = containers[len(kept_containers):]
+    if omitted:
+        states: Dict[str, int] = {}
+        for c in omitted:
+            states[c.get('status')] = states.get(c.get('status'), 0) + 1
+        summary = ", ".join(f"{state}: {count}" for state, count in sorted(states.items(), key=lambda x: -x[1]))
+        lines.append(f"... 另有 {len(omitted)} 个容器未列出 ({summary})")
+
+    lines.append(f"镜像 {len(kept_images)}/{len(images)} (tags|id|size_mb):")
+    lines.extend(kept_images)
+    if len(images) > len(kept_images):
+        lines.append(f"... 另有 {len(images) - len(kept_images)} 个镜像未列出")
+
+    return "\n".join(lines)
@@ -0,0 +1,31 @@
+import os
+import threading
+import docker
+
+# 连接池大小，默认与Docker操作线程池大小一致，保证每个工作线程都有可复用的长连接
+DOCKER_MAX_CONNECTIONS = int(os.getenv("DOCKER_MAX_CONNECTIONS", os.getenv("DOCKER_EXECUTOR_WORKERS", 16)))
+# 单次HTTP请求超时（秒）
+DOCKER_CLIENT_TIMEOUT = int(os.getenv("DOCKER_CLIENT_TIMEOUT", 60))
+
+_client = None
+_client_lock = threading.Lock()
+
+# 获取进程级共享的Docker客户端（首次使用时创建）
+def get_docker_client() -> docker.DockerClient:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = docker.from_env(timeout=DOCKER_CLIENT_TIMEOUT, max_pool_size=DOCKER_MAX_CONNECTIONS)
+    return _client
+
+# 共享客户端的延迟代理，导入模块时不连接dockerd
+class LazyDockerClient:
+    def __getattr__(self, name):
+        # 私有和特殊属性不转发，避免mock、asyncio等内省操作触发连接
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(get_docker_client(), name)
+
+# 所有路由共享的Docker客户端
+client = LazyDockerClient()
@@ -0,0 +1,139 @@
+import os
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+from fastapi import HTTPException, status
+
+# 配置日志
+logger = logging.getLogger("executor")
+
+# 有界线程池：把同步阻塞调用移出事件循环，并统计队列深度、超时等指标
+# 设置max_queue后，排队任务数达到上限时直接返回503，而不是无限排队
+class BoundedExecutor:
+    def __init__(self, name: str, max_workers: int, default_timeout: float, timeouts: Optional[Dict[str, float]] = None,
+                 max_queue: Optional[int] = None):
+        self.name = name
+        self.max_workers = max_workers
+        self.default_timeout = default_timeout
+        self.timeouts = timeouts or {}
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-worker")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self._max_queue_depth = 0
+        self._completed = 0
+        self._failed = 0
+        self._timeouts = 0
+        self._rejected = 0
+        self._total_seconds = 0.0
+
+    # 获取操作对应的超时时间
+    def get_timeout(self, operation: str) -> float:
+        return self.timeouts.get(operation, self.default_timeout)
+
+    # 在线程池中执行同步函数，超时后返回504
+    async def run(self, func: Callable[..., Any], *args, operation: str = "default", timeout: Optional[float] = None, **kwargs) -> Any:
+        if timeout is None:
+            timeout = self.get_timeout(operation)
+
+        def task():
+            with self._lock:
+                self._queued -= 1
+                self._active += 1
+            started = time.monotonic()
+            try:
+                result = func(*args, **kwargs)
+                with self._lock:
+                    self._completed += 1
+                return result
+            except Exception:
+                with self._lock:
+                    self._failed += 1
+                raise
+            finally:
+                with self._lock:
+                    self._active -= 1
+                    self._total_seconds += time.monotonic() - started
+
+        with self._lock:
+            if self.max_queue is not None and self._queued >= self.max_queue:
+                self._rejected += 1
+                rejected = True
+            else:
+                rejected = False
+                self._queued += 1
+                self._max_queue_depth = max(self._max_queue_depth, self._queued)
+        if rejected:
+            logger.warning(f"{self.name}线程池队列已满，拒绝操作 {operation}")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=f"服务繁忙，请稍后重试: {operation}"
+            )
+
+        # 尚未开始执行的任务直接取消并退出排队计数；已在执行的任务只能等待其自行结束
+        def cancel_queued():
+            if future.cancel():
+                with self._lock:
+                    self._queued -= 1
+
+        future = self._pool.submit(task)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.CancelledError:
+            # 等待的协程被取消（例如客户端断开）时，排队中的任务不会再执行
+            cancel_queued()
+            raise
+        except asyncio.TimeoutError:
+            cancel_queued()
+            with self._lock:
+                self._timeouts += 1
+            logger.error(f"{self.name}操作 {operation} 超时（{timeout}秒）")
+            raise HTTPException(
+                status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+                detail=f"操作超时: {operation}"
+            )
+
+    # 获取线程池运行指标
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            finished = self._completed + self._failed
+            return {
+                "max_workers": self.max_workers,
+                "queued": self._queued,
+                "active": self._active,
+                "max_queue_depth": self._max_queue_depth,
+                "completed": self._completed,
+                "failed": self._failed,
+                "timeouts": self._timeouts,
+                "rejected": self._rejected,
+                "avg_seconds": round(self._total_seconds / finished, 4) if finished else 0.0
+            }
+
+# Docker操作线程池，stop/remove等慢操作使用更长的超时
+docker_executor = BoundedExecutor(
+    "docker",
+    max_workers=int(os.getenv("DOCKER_EXECUTOR_WORKERS", 16)),
+    default_timeout=float(os.getenv("DOCKER_OPERATION_TIMEOUT", 30)),
+    timeouts={
+        "create": float(os.getenv("DOCKER_CREATE_TIMEOUT", 120)),
+        "stop": float(os.getenv("DOCKER_STOP_TIMEOUT", 60)),
+        "remove": float(os.getenv("DOCKER_REMOVE_TIMEOUT", 60))
+    }
+)
+
+# 密码哈希线程池：bcrypt每次计算需要数百毫秒CPU（计算期间会释放GIL），
+# 放在独立的小线程池中，登录高峰时既不阻塞事件循环，也不占用Docker操作的线程
+password_executor = BoundedExecutor(
+    "password",
+    max_workers=int(os.getenv("PASSWORD_HASH_WORKERS", 4)),
+    default_timeout=float(os.getenv("PASSWORD_HASH_TIMEOUT", 10)),
+    max_queue=int(os.getenv("PASSWORD_HASH_MAX_QUEUE", 64))
+)
+
+# 在Docker线程池中执行同步Docker调用
+async def run_docker(func: Callable[..., Any], *args, operation: str = "default", timeout: Optional[float] = None, **kwargs) -> Any:
+    return await docker_executor.run(func, *args, operation=operation, timeout=timeout, **kwargs)
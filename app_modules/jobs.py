@@ -0,0 +1,283 @@
+import os
+import time
+import asyncio
+import inspect
+import logging
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+from app_modules.results import ResultStore
+
+# 配置日志
+logger = logging.getLogger("jobs")
+
+# docker-compose命令，可替换为"docker compose"
+COMPOSE_COMMAND = os.getenv("COMPOSE_COMMAND", "docker-compose")
+# 同时运行的Compose任务数上限
+COMPOSE_MAX_CONCURRENT_JOBS = int(os.getenv("COMPOSE_MAX_CONCURRENT_JOBS", 2))
+# 单个Compose任务超时（秒）
+COMPOSE_TIMEOUT = float(os.getenv("COMPOSE_TIMEOUT", 600))
+# 内存中保留的任务记录数
+COMPOSE_JOB_HISTORY = int(os.getenv("COMPOSE_JOB_HISTORY", 200))
+# 任务记录持久化使用的SQLite文件路径，为空时任务只能在提交它的进程中查询（多进程部署时需要设置）
+COMPOSE_JOB_DB = os.getenv("COMPOSE_JOB_DB", "")
+# 任务记录在数据库中的保留时间（秒）
+COMPOSE_JOB_RETENTION = float(os.getenv("COMPOSE_JOB_RETENTION", 86400))
+# 运行中任务的输出写入数据库的最小间隔（秒），其他进程中的读取方也按此间隔轮询
+COMPOSE_JOB_SYNC_INTERVAL = float(os.getenv("COMPOSE_JOB_SYNC_INTERVAL", 0.5))
+
+# 任务结束状态
+FINISHED_STATUSES = {"succeeded", "failed", "timeout", "error"}
+
+# 解析从数据库读出的时间
+def parse_time(value: Any) -> Optional[datetime]:
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+# 一个子进程任务及其逐行输出
+class Job:
+    def __init__(self, action: str, project_name: str, args: List[str], owner: str,
+                 on_finish: Optional[Callable[["Job"], Any]] = None, job_id: Optional[str] = None):
+        self.id = job_id or uuid.uuid4().hex
+        self.action = action
+        self.project_name = project_name
+        self.args = args
+        self.owner = owner
+        self.on_finish = on_finish
+        self.status = "queued"
+        self.returncode: Optional[int] = None
+        self.error: Optional[str] = None
+        self.output: List[Dict[str, str]] = []
+        self.created_at = datetime.now()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self._updated = asyncio.Event()
+        self._task: Optional[asyncio.Future] = None
+        # 由其他进程执行、从数据库读取的任务
+        self.remote = False
+        self._synced_at = 0.0
+
+    # 由数据库中的记录构造任务（任务在其他进程中执行）
+    @classmethod
+    def from_record(cls, record: Dict[str, Any]) -> "Job":
+        job = cls(record["action"], record["project_name"], [], record["owner"])
+        job.id = record["id"]
+        job.remote = True
+        job.apply_record(record)
+        return job
+
+    # 用数据库中的记录更新任务状态和输出
+    def apply_record(self, record: Dict[str, Any]):
+        self.status = record["status"]
+        self.returncode = record.get("returncode")
+        self.error = record.get("error")
+        self.output = record.get("output") or []
+        self.created_at = parse_time(record.get("created_at")) or self.created_at
+        self.started_at = parse_time(record.get("started_at"))
+        self.finished_at = parse_time(record.get("finished_at"))
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    # 唤醒所有等待新输出的读取方
+    def notify(self):
+        event, self._updated = self._updated, asyncio.Event()
+        event.set()
+
+    # 转换为API返回的字典，offset用于增量轮询输出
+    def to_dict(self, offset: int = 0) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "action": self.action,
+            "project_name": self.project_name,
+            "status": self.status,
+            "returncode": self.returncode,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "output_lines": len(self.output),
+            "output": self.output[offset:]
+        }
+
+    # 写入数据库的记录
+    def to_record(self) -> Dict[str, Any]:
+        return {**self.to_dict(), "owner": self.owner}
+
+# 基于asyncio子进程的任务执行器：限制并发、强制超时、逐行收集stdout/stderr
+# 配置store后任务状态和输出同步写入数据库，其他工作进程可以查询、等待和跟踪这些任务
+class JobRunner:
+    def __init__(self, max_concurrent: int, timeout: float, history: int, store: Optional[ResultStore] = None):
+        self.max_concurrent = max_concurrent
+        self.timeout = timeout
+        self.history = history
+        self.store = store
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._semaphore_loop = None
+
+    # 信号量与事件循环绑定，按当前循环创建
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    # 提交任务并立即返回，任务在后台运行；on_finish在任务结束后调用，可以是普通函数或协程函数
+    # job_id用于调用方在提交前预先记录任务ID（例如先在注册表中占用项目）
+    async def submit(self, action: str, project_name: str, args: List[str], owner: str,
+                     on_finish: Optional[Callable[[Job], Any]] = None, job_id: Optional[str] = None) -> Job:
+        job = Job(action, project_name, args, owner, on_finish, job_id)
+        self._jobs[job.id] = job
+        while len(self._jobs) > self.history:
+            oldest_id, oldest = next(iter(self._jobs.items()))
+            if not oldest.finished:
+                break
+            del self._jobs[oldest_id]
+        await self._sync(job)
+        job._task = asyncio.ensure_future(self._run(job))
+        return job
+
+    # 把任务写入数据库（在存储的线程中执行，不阻塞事件循环）；force为False时运行中的任务按COMPOSE_JOB_SYNC_INTERVAL节流
+    async def _sync(self, job: Job, force: bool = True):
+        if self.store is None:
+            return
+        now = time.monotonic()
+        if not force and now - job._synced_at < COMPOSE_JOB_SYNC_INTERVAL:
+            return
+        job._synced_at = now
+        try:
+            await self.store.run(self.store.put, job.to_record())
+        except Exception as e:
+            logger.error(f"保存任务 {job.id} 失败: {str(e)}")
+
+    # 获取任务，本进程中没有时从数据库读取
+    async def get(self, job_id: str) -> Optional[Job]:
+        job = self._jobs.get(job_id)
+        if job is None and self.store is not None:
+            record = await self.store.run(self.store.get, job_id)
+            if record is not None:
+                job = Job.from_record(record)
+        return job
+
+    # 列出某个用户的任务（最新的在前），包括其他进程中的任务
+    async def list_jobs(self, owner: str) -> List[Job]:
+        jobs = [job for job in reversed(self._jobs.values()) if job.owner == owner]
+        if self.store is not None:
+            local_ids = {job.id for job in jobs}
+            records = await self.store.run(self.store.list_records, owner)
+            jobs.extend(Job.from_record(record) for record in records if record["id"] not in local_ids)
+            jobs.sort(key=lambda job: job.created_at, reverse=True)
+        return jobs
+
+    # 从数据库刷新其他进程中的任务
+    async def refresh(self, job: Job) -> Job:
+        if job.remote and self.store is not None:
+            record = await self.store.run(self.store.get, job.id)
+            if record is not None:
+                job.apply_record(record)
+        return job
+
+    # 等待任务结束；其他进程中的任务轮询数据库，最多等待任务超时时间
+    async def wait(self, job: Job) -> Job:
+        if job._task is not None:
+            await asyncio.shield(job._task)
+        elif job.remote:
+            deadline = time.monotonic() + self.timeout
+            while not job.finished and time.monotonic() < deadline:
+                await asyncio.sleep(COMPOSE_JOB_SYNC_INTERVAL)
+                await self.refresh(job)
+        return job
+
+    # 逐行产出任务输出，直到任务结束
+    async def follow(self, job: Job) -> AsyncIterator[Dict[str, str]]:
+        index = 0
+        deadline = time.monotonic() + self.timeout
+        while True:
+            updated = job._updated
+            while index < len(job.output):
+                yield job.output[index]
+                index += 1
+            if job.finished:
+                break
+            if job.remote:
+                if time.monotonic() >= deadline:
+                    break
+                await asyncio.sleep(COMPOSE_JOB_SYNC_INTERVAL)
+                await self.refresh(job)
+            else:
+                await updated.wait()
+
+    # 读取子进程的一个输出流
+    async def _read_stream(self, job: Job, stream, name: str):
+        while True:
+            line = await stream.readline()
+            if not line:
+                break
+            job.output.append({"stream": name, "line": line.decode('utf-8', errors='replace').rstrip('\n')})
+            job.notify()
+            await self._sync(job, force=False)
+
+    # 执行任务
+    async def _run(self, job: Job):
+        process = None
+        try:
+            async with self._get_semaphore():
+                job.status = "running"
+                job.started_at = datetime.now()
+                job.notify()
+                await self._sync(job)
+                process = await asyncio.create_subprocess_exec(
+                    *job.args,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE
+                )
+                try:
+                    await asyncio.wait_for(asyncio.gather(
+                        self._read_stream(job, process.stdout, "stdout"),
+                        self._read_stream(job, process.stderr, "stderr"),
+                        process.wait()
+                    ), self.timeout)
+                    job.returncode = process.returncode
+                    job.status = "succeeded" if process.returncode == 0 else "failed"
+                except asyncio.TimeoutError:
+                    process.kill()
+                    await process.wait()
+                    job.returncode = process.returncode
+                    job.status = "timeout"
+                    job.error = f"任务超时（{self.timeout}秒）"
+        except Exception as e:
+            logger.error(f"任务 {job.id} 执行错误: {str(e)}")
+            job.status = "error"
+            job.error = str(e)
+        finally:
+            if not job.finished:
+                # 任务被取消（如服务关闭）
+                job.status = "error"
+                job.error = "任务被取消"
+                if process is not None and process.returncode is None:
+                    process.kill()
+            job.finished_at = datetime.now()
+            await self._sync(job)
+            if job.on_finish:
+                try:
+                    result = job.on_finish(job)
+                    if inspect.isawaitable(result):
+                        await result
+                except Exception as e:
+                    logger.error(f"任务 {job.id} 结束回调错误: {str(e)}")
+            job.notify()
+            logger.info(f"任务 {job.id} ({job.action} {job.project_name}) 结束: {job.status}")
+
+# Compose任务执行器
+compose_jobs = JobRunner(
+    max_concurrent=COMPOSE_MAX_CONCURRENT_JOBS,
+    timeout=COMPOSE_TIMEOUT,
+    history=COMPOSE_JOB_HISTORY,
+    store=ResultStore(COMPOSE_JOB_HISTORY, COMPOSE_JOB_RETENTION, COMPOSE_JOB_DB, key_field="id",
+                      finished_statuses=FINISHED_STATUSES) if COMPOSE_JOB_DB else None
+)
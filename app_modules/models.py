@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Literal
 from datetime import datetime
 
 # 用户模型
@@ -37,25 +37,81 @@ class ContainerCreate(BaseModel):
     environment: Optional[Dict[str, str]] = None
     command: Optional[str] = None
 
-class Container(BaseModel):
+# 只包含部分字段的容器（fields参数），未请求的字段不计算
+class ContainerFields(BaseModel):
     id: str
+    name: Optional[str] = None
+    image: Optional[str] = None
+    status: Optional[str] = None
+    created: Optional[datetime] = None
+    ports: Optional[Dict[str, Any]] = None
+    volumes: Optional[List[Dict[str, Any]]] = None
+    environment: Optional[Dict[str, str]] = None
+
+# 完整的容器；继承ContainerFields，在响应模型为ContainerFields的接口中可以直接返回而不需要重新校验
+class Container(ContainerFields):
     name: str
     image: str
     status: str
     created: datetime
-    ports: Optional[Dict[str, Any]] = None
-    volumes: Optional[List[Dict[str, Any]]] = None
-    environment: Optional[Dict[str, str]] = None
+
+# 批量容器操作模型
+class ContainerBulkRequest(BaseModel):
+    action: Literal["start", "stop", "restart", "remove"]
+    ids: Optional[List[str]] = None
+    labels: Optional[Dict[str, str]] = None
+    force: bool = False
+    max_concurrency: Optional[int] = None
+
+class ContainerBulkItem(BaseModel):
+    id: str
+    status: str
+    status_code: int
+    container: Optional[Container] = None
+    error: Optional[str] = None
+    duration: float = 0.0
+
+class ContainerBulkResponse(BaseModel):
+    action: str
+    results: List[ContainerBulkItem]
+    succeeded: int
+    failed: int
+    duration: float
 
 # Docker Compose模型
 class ComposeFile(BaseModel):
     content: str
     path: Optional[str] = None
+    project_name: Optional[str] = None
 
 class ComposeStatus(BaseModel):
     services: Dict[str, Dict[str, Any]]
     is_running: bool
 
+class ComposeProject(BaseModel):
+    project_name: str
+    compose_file: Optional[str] = None
+    content_hash: Optional[str] = None
+    owner: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    last_action: Optional[str] = None
+    last_status: Optional[str] = None
+    last_job_id: Optional[str] = None
+
+class ComposeJob(BaseModel):
+    id: str
+    action: str
+    project_name: str
+    status: str
+    returncode: Optional[int] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    output_lines: int = 0
+    output: List[Dict[str, str]] = []
+
 # Claude AI请求模型
 class ClaudeRequest(BaseModel):
     prompt: str
@@ -64,8 +120,89 @@ class ClaudeRequest(BaseModel):
     temperature: float = 0.7
     top_p: float = 0.9
     top_k: int = 40
+    # 模型路由：auto（默认，按提示词复杂度选择）、fast、balanced、quality；指定model时忽略
+    route: Optional[Literal["auto", "fast", "balanced", "quality"]] = None
 
 class ClaudeResponse(BaseModel):
     completion: str
     stop_reason: Optional[str] = None
-    model: Optional[str] = None
\ No newline at end of file
+    model: Optional[str] = None
+    route: Optional[str] = None
+    input_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+    cache_creation_input_tokens: Optional[int] = None
+    cache_read_input_tokens: Optional[int] = None
+
+# Claude工具调用请求模型
+class AgentRequest(ClaudeRequest):
+    max_steps: Optional[int] = None
+    dry_run: bool = False
+
+class AgentToolCall(BaseModel):
+    id: str
+    step: int
+    name: str
+    input: Dict[str, Any]
+    result: Any = None
+    is_error: bool = False
+    # 达到时间上限时调用还未结束（已开始的修改操作可能仍在执行）
+    timed_out: bool = False
+    duration: float
+
+class AgentResponse(BaseModel):
+    completion: str
+    stop_reason: Optional[str] = None
+    model: Optional[str] = None
+    steps: int
+    dry_run: bool = False
+    tool_calls: List[AgentToolCall] = []
+    input_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+
+# Claude对话会话模型
+class ClaudeSession(BaseModel):
+    id: str
+    turns: int = 0
+    compactions: int = 0
+    summary: Optional[str] = None
+    history_tokens: int = 0
+    created_at: datetime
+    updated_at: datetime
+    messages: Optional[List[Dict[str, str]]] = None
+
+class SessionChatResponse(ClaudeResponse):
+    session_id: str
+    turn: int
+    context_mode: str
+    compacted: bool = False
+
+# Claude批量请求模型
+class ClaudeBatchRequest(BaseModel):
+    requests: List[ClaudeRequest]
+    max_concurrency: Optional[int] = None
+
+class ClaudeBatchItem(BaseModel):
+    index: int
+    status: str
+    response: Optional[ClaudeResponse] = None
+    error: Optional[str] = None
+    attempts: int = 0
+    duration: float = 0.0
+
+class ClaudeBatchResponse(BaseModel):
+    results: List[ClaudeBatchItem]
+    succeeded: int
+    failed: int
+    duration: float
+
+# Claude异步请求结果模型
+class ClaudeAsyncResult(BaseModel):
+    request_id: str
+    status: str
+    progress: str
+    model: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    result: Optional[ClaudeResponse] = None
+    error: Optional[str] = None
\ No newline at end of file
@@ -0,0 +1,134 @@
+import os
+import time
+import asyncio
+import threading
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Mapping, Optional
+
+# 批量请求的初始速率（每分钟请求数），收到API的速率限制头后按其调整
+CLAUDE_BATCH_RPM = float(os.getenv("CLAUDE_BATCH_RPM", 50))
+# 批量请求的最大并发数
+CLAUDE_BATCH_MAX_CONCURRENCY = int(os.getenv("CLAUDE_BATCH_MAX_CONCURRENCY", 8))
+
+# 没有其他信息时等待的最长单次间隔（秒）
+MAX_WAIT_SLICE = 1.0
+
+# 解析速率限制头中的时间：RFC 3339时间戳或秒数
+def parse_reset_time(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return time.time() + float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        pass
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+# 解析retry-after头（秒数或HTTP日期），返回需要等待的秒数
+def parse_retry_after(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    if not headers:
+        return None
+    reset_at = parse_reset_time(headers.get('retry-after'))
+    return max(reset_at - time.time(), 0.0) if reset_at is not None else None
+
+# 读取整数类型的头
+def header_int(headers: Mapping[str, str], name: str) -> Optional[int]:
+    try:
+        return int(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+# 速率感知的调度器：令牌桶限制请求速率，并发上限按AIMD调整
+# （成功时缓慢增加，遇到429等限流错误时减半），并遵守API返回的速率限制头
+# 状态由线程锁保护、等待使用asyncio.sleep，因此可以在多个事件循环之间共享
+class RateLimitScheduler:
+    def __init__(self, requests_per_minute: float = CLAUDE_BATCH_RPM,
+                 max_concurrency: int = CLAUDE_BATCH_MAX_CONCURRENCY, min_concurrency: int = 1):
+        self.rate = requests_per_minute / 60.0
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self._lock = threading.Lock()
+        self._tokens = float(max_concurrency)
+        self._last_refill = time.monotonic()
+        self._limit = float(max_concurrency)
+        self._active = 0
+        self._paused_until = 0.0
+        self.rate_limited = 0
+        self.completed = 0
+
+    # 当前并发上限
+    @property
+    def concurrency_limit(self) -> int:
+        return max(self.min_concurrency, int(self._limit))
+
+    # 按时间补充令牌，桶容量等于最大并发数
+    def _refill(self, now: float):
+        self._tokens = min(float(self.max_concurrency), self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    # 等待直到可以发出一个请求：未处于暂停期、并发未满、令牌桶中有令牌
+    async def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                elif self._active >= self.concurrency_limit:
+                    wait = 0.05
+                elif self._tokens < 1:
+                    wait = (1 - self._tokens) / self.rate if self.rate > 0 else MAX_WAIT_SLICE
+                else:
+                    self._tokens -= 1
+                    self._active += 1
+                    return
+            await asyncio.sleep(min(wait, MAX_WAIT_SLICE))
+
+    # 请求结束：成功时并发上限加性增加，被限流时减半并暂停到retry_after之后
+    def release(self, rate_limited: bool = False, retry_after: Optional[float] = None):
+        with self._lock:
+            self._active -= 1
+            if rate_limited:
+                self.rate_limited += 1
+                self._limit = max(float(self.min_concurrency), self._limit / 2)
+                if retry_after:
+                    self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            else:
+                self.completed += 1
+                self._limit = min(float(self.max_concurrency), self._limit + 1 / self._limit)
+
+    # 根据API返回的速率限制头调整速率，并在额度用完时暂停到重置时间
+    def update_from_headers(self, headers: Optional[Mapping[str, str]]):
+        if not headers:
+            return
+        with self._lock:
+            limit = header_int(headers, 'anthropic-ratelimit-requests-limit')
+            if limit:
+                self.rate = limit / 60.0
+            for kind in ('requests', 'tokens', 'input-tokens', 'output-tokens'):
+                if header_int(headers, f'anthropic-ratelimit-{kind}-remaining') == 0:
+                    reset_at = parse_reset_time(headers.get(f'anthropic-ratelimit-{kind}-reset'))
+                    if reset_at is not None:
+                        self._paused_until = max(self._paused_until, time.monotonic() + max(reset_at - time.time(), 0.0))
+
+    # 调度器运行指标
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests_per_minute": round(self.rate * 60, 2),
+                "concurrency_limit": self.concurrency_limit,
+                "active": self._active,
+                "paused_seconds": round(max(self._paused_until - time.monotonic(), 0.0), 2),
+                "completed": self.completed,
+                "rate_limited": self.rate_limited
+            }
+
+# Claude批量请求共享的调度器
+claude_batch_scheduler = RateLimitScheduler()
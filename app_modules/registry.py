@@ -0,0 +1,159 @@
+import os
+import re
+import json
+import asyncio
+import hashlib
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+from app_modules.jobs import FINISHED_STATUSES
+
+try:
+    import fcntl
+except ImportError:
+    # Windows上没有fcntl，只能保证单进程内的互斥
+    fcntl = None
+
+# 数据目录，保存已部署的compose文件和项目注册表
+MCP_DATA_DIR = os.getenv("MCP_DATA_DIR", "data")
+
+# compose项目名称规则：小写字母、数字、下划线和连字符
+PROJECT_NAME_PATTERN = re.compile(r"^[a-z0-9][a-z0-9_-]*$")
+
+# 计算compose内容的哈希
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+# 由compose内容哈希派生的稳定项目名称
+def hash_project_name(content: str) -> str:
+    return f"mcp_{content_hash(content)[:12]}"
+
+# 项目的上一个任务尚未结束，不能提交新任务
+class ProjectBusyError(Exception):
+    pass
+
+# 已部署compose项目的持久化注册表
+# 每个项目的compose文件保存在 <root>/<项目名>/docker-compose.yml，元数据保存在 <root>/registry.json
+# 多个工作进程共享同一个注册表：写入时先获取文件锁，读取依赖原子替换，不需要加锁
+class ProjectRegistry:
+    def __init__(self, root: str):
+        self.root = root
+        self.path = os.path.join(root, "registry.json")
+        self.lock_path = os.path.join(root, "registry.lock")
+        self._lock = threading.Lock()
+
+    # 获取进程内的线程锁和跨进程的文件锁
+    @contextmanager
+    def _write_lock(self):
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            os.makedirs(self.root, exist_ok=True)
+            with open(self.lock_path, 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    # 先写临时文件再替换，避免写入中断导致注册表损坏
+    def _save(self, projects: Dict[str, Dict[str, Any]]):
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(projects, f, ensure_ascii=False, indent=2, default=str)
+        os.replace(tmp_path, self.path)
+
+    # 获取项目记录
+    def get(self, project_name: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._load().get(project_name)
+
+    # 列出项目记录，可按所有者过滤
+    def list_projects(self, owner: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            projects = self._load().values()
+        return [p for p in projects if owner is None or p.get('owner') == owner]
+
+    # 更新项目记录（不存在时创建），返回更新后的记录
+    def update(self, project_name: str, **fields) -> Dict[str, Any]:
+        with self._write_lock():
+            projects = self._load()
+            now = datetime.now().isoformat()
+            record = projects.get(project_name) or {"project_name": project_name, "created_at": now}
+            record.update(fields)
+            record["updated_at"] = now
+            projects[project_name] = record
+            self._save(projects)
+            return record
+
+    # 为新任务占用项目：检查所有者和上一个任务、写入新任务ID在同一个写锁内完成，
+    # 并发的部署/停止请求中只有一个能占用成功，其余抛出ProjectBusyError
+    # finished_job_id为调用方已确认结束的任务ID：记录中的任务状态尚未写回，但就是这个任务时也可以占用
+    def claim(self, project_name: str, job_id: str, owner: str, finished_job_id: Optional[str] = None,
+              **fields) -> Dict[str, Any]:
+        with self._write_lock():
+            projects = self._load()
+            now = datetime.now().isoformat()
+            record = projects.get(project_name) or {"project_name": project_name, "created_at": now}
+            if record.get('owner') and record['owner'] != owner:
+                raise PermissionError(project_name)
+            last_status = record.get('last_status')
+            if last_status is not None and last_status not in FINISHED_STATUSES and record.get('last_job_id') != finished_job_id:
+                raise ProjectBusyError(project_name)
+            record.update(fields)
+            record.update(owner=owner, last_job_id=job_id, last_status="queued", updated_at=now)
+            projects[project_name] = record
+            self._save(projects)
+            return record
+
+    # 写回任务的最终状态；项目已被之后的任务占用时不覆盖
+    def finish(self, project_name: str, job_id: str, status: str):
+        with self._write_lock():
+            projects = self._load()
+            record = projects.get(project_name)
+            if record is None or record.get('last_job_id') != job_id:
+                return
+            record.update(last_status=status, updated_at=datetime.now().isoformat())
+            self._save(projects)
+
+    # 项目compose文件的路径
+    def compose_file_path(self, project_name: str) -> str:
+        return os.path.abspath(os.path.join(self.root, project_name, "docker-compose.yml"))
+
+    # 保存项目的compose文件，返回文件路径
+    def write_compose_file(self, project_name: str, content: str) -> str:
+        compose_path = self.compose_file_path(project_name)
+        os.makedirs(os.path.dirname(compose_path), exist_ok=True)
+        with open(compose_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return compose_path
+
+    # 读取项目的compose文件内容
+    def read_compose_file(self, project_name: str) -> Optional[str]:
+        record = self.get(project_name)
+        if not record or not os.path.exists(record.get('compose_file', '')):
+            return None
+        with open(record['compose_file'], 'r', encoding='utf-8') as f:
+            return f.read()
+
+# Compose项目注册表
+project_registry = ProjectRegistry(os.path.join(MCP_DATA_DIR, "compose"))
+
+# 注册表专用的单个线程：等待其他进程持有的文件锁和读写JSON时不阻塞事件循环，
+# 写入按提交顺序执行，调用方被取消后先提交的写入也不会覆盖后提交的写入
+registry_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="registry")
+
+# 在注册表线程中执行注册表操作
+async def run_registry(func: Callable[..., Any], *args, **kwargs) -> Any:
+    return await asyncio.get_running_loop().run_in_executor(registry_executor, functools.partial(func, *args, **kwargs))
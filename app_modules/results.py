@@ -0,0 +1,170 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import sqlite3
+import threading
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+from app_modules.cache import TTLCache
+
+# 内存中保留的异步请求结果数上限
+CLAUDE_RESULT_MAX_ENTRIES = int(os.getenv("CLAUDE_RESULT_MAX_ENTRIES", 1000))
+# 异步请求结果保留时间（秒）
+CLAUDE_RESULT_TTL = float(os.getenv("CLAUDE_RESULT_TTL", 3600))
+# 结果持久化使用的SQLite文件路径，为空时只保存在内存中
+CLAUDE_RESULT_DB = os.getenv("CLAUDE_RESULT_DB", "")
+
+# 清理过期记录的最小间隔（秒）
+RESULT_PURGE_INTERVAL = 60
+
+# 请求结束状态
+FINISHED_RESULT_STATUSES = {"succeeded", "failed"}
+
+# 异步请求结果存储：内存LRU+TTL缓存，可选写入SQLite，使结果在重启后和多个进程之间可查询
+# key_field为记录中作为ID的字段，finished_statuses中的记录不会再变化，可以放入其他进程的缓存
+class ResultStore:
+    def __init__(self, max_entries: int, ttl: float, db_path: Optional[str] = None,
+                 key_field: str = "request_id", finished_statuses=FINISHED_RESULT_STATUSES):
+        self.ttl = ttl
+        self.db_path = db_path
+        self.key_field = key_field
+        self.finished_statuses = set(finished_statuses)
+        self._cache = TTLCache(max_entries, ttl)
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._last_purge = time.monotonic()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    # 在事件循环中调用存储的方法：配置了数据库时在存储专用的单个线程中按提交顺序执行，
+    # 等待数据库锁时不阻塞事件循环，调用方被取消后先提交的写入也不会覆盖后提交的写入
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        if not self.db_path:
+            return func(*args, **kwargs)
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="result-store")
+        return await asyncio.get_running_loop().run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    # 首次使用时打开数据库
+    def _get_db(self) -> Optional[sqlite3.Connection]:
+        if not self.db_path:
+            return None
+        if self._db is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(self.db_path, check_same_thread=False, timeout=10)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "id TEXT PRIMARY KEY, owner TEXT NOT NULL, data TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS results_expires_at ON results (expires_at)")
+            db.execute("CREATE INDEX IF NOT EXISTS results_owner ON results (owner)")
+            db.commit()
+            self._db = db
+        return self._db
+
+    # 保存记录到缓存和数据库
+    def _save(self, record: Dict[str, Any]):
+        key = record[self.key_field]
+        self._cache.set(key, record)
+        db = self._get_db()
+        if db is not None:
+            db.execute(
+                "INSERT OR REPLACE INTO results (id, owner, data, expires_at) VALUES (?, ?, ?, ?)",
+                (key, record["owner"], json.dumps(record, ensure_ascii=False, default=str),
+                 time.time() + self.ttl)
+            )
+            db.commit()
+
+    # 创建一条排队中的请求记录，使用随机ID避免冲突
+    def create(self, owner: str, **fields) -> Dict[str, Any]:
+        if time.monotonic() - self._last_purge > RESULT_PURGE_INTERVAL:
+            self.purge_expired()
+        record = {
+            "request_id": uuid.uuid4().hex,
+            "owner": owner,
+            "status": "queued",
+            "progress": "queued",
+            "created_at": datetime.now(),
+            "started_at": None,
+            "finished_at": None,
+            "result": None,
+            "error": None
+        }
+        record.update(fields)
+        with self._lock:
+            self._save(record)
+        return record
+
+    # 保存由调用方生成ID的完整记录
+    def put(self, record: Dict[str, Any]):
+        with self._lock:
+            self._save(record)
+
+    # 更新请求记录，返回更新后的记录
+    def update(self, request_id: str, **fields) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            record = self._load(request_id)
+            if record is None:
+                return None
+            record = {**record, **fields}
+            self._save(record)
+            return record
+
+    # 先查内存，再查数据库；记录只由创建它的进程更新，本进程写入的记录都在缓存中，
+    # 从数据库读到的其他进程的记录只有结束后才放入缓存（未结束的还会被其他进程更新）
+    def _load(self, request_id: str) -> Optional[Dict[str, Any]]:
+        record = self._cache.get(request_id)
+        if record is not None:
+            return record
+        db = self._get_db()
+        if db is None:
+            return None
+        row = db.execute(
+            "SELECT data FROM results WHERE id = ? AND expires_at > ?", (request_id, time.time())
+        ).fetchone()
+        if row is None:
+            return None
+        record = json.loads(row[0])
+        if record.get("status") in self.finished_statuses:
+            self._cache.set(request_id, record)
+        return record
+
+    # 获取请求记录
+    def get(self, request_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._load(request_id)
+
+    # 列出某个用户在数据库中的记录（包括其他进程写入的），未配置数据库时返回空列表
+    def list_records(self, owner: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            db = self._get_db()
+            if db is None:
+                return []
+            rows = db.execute(
+                "SELECT data FROM results WHERE owner = ? AND expires_at > ?", (owner, time.time())
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    # 清除已过期的记录
+    def purge_expired(self):
+        self._last_purge = time.monotonic()
+        self._cache.purge_expired()
+        with self._lock:
+            db = self._get_db()
+            if db is not None:
+                db.execute("DELETE FROM results WHERE expires_at <= ?", (time.time(),))
+                db.commit()
+
+    # 存储运行指标
+    def stats(self) -> Dict[str, Any]:
+        return {**self._cache.stats(), "persistent": bool(self.db_path)}
+
+# Claude异步请求结果存储
+claude_results = ResultStore(CLAUDE_RESULT_MAX_ENTRIES, CLAUDE_RESULT_TTL, CLAUDE_RESULT_DB or None)
@@ -0,0 +1,109 @@
+import os
+import re
+import threading
+from typing import Any, Dict, Optional
+
+# 是否按提示词复杂度自动选择模型（关闭时未指定模型的请求使用默认模型）
+CLAUDE_ROUTING_ENABLED = os.getenv("CLAUDE_ROUTING_ENABLED", "True").lower() == "true"
+
+# 各路由使用的模型：fast用于简单查询，balanced用于一般问题，quality用于复杂的排查和设计
+ROUTE_MODELS = {
+    "fast": os.getenv("CLAUDE_FAST_MODEL", "claude-3-haiku-20240307"),
+    "balanced": os.getenv("CLAUDE_BALANCED_MODEL", "claude-3-sonnet-20240229"),
+    "quality": os.getenv("CLAUDE_QUALITY_MODEL", "claude-3-opus-20240229")
+}
+
+# 超过此长度（字符）的提示词使用quality路由
+ROUTE_QUALITY_MIN_LENGTH = int(os.getenv("CLAUDE_ROUTE_QUALITY_MIN_LENGTH", 1500))
+# 不超过此长度（字符）且是简单查询的提示词使用fast路由
+ROUTE_FAST_MAX_LENGTH = int(os.getenv("CLAUDE_ROUTE_FAST_MAX_LENGTH", 200))
+
+# 英文关键词的边界：Python的\b把中文字符也当作单词字符，中英文混写时（如"帮我debug这个容器"）无法匹配，
+# 因此只以英文字母判断边界
+# 需要推理的问题：排查、诊断、分析、设计等
+QUALITY_PATTERN = re.compile(
+    r"排查|诊断|分析|为什么|原因|优化|设计|架构|迁移|安全|性能|故障|崩溃|报错|错误日志|"
+    r"(?<![A-Za-z])(why|debug|troubleshoot|diagnose|analy[sz]e|optimi[sz]e|design|architecture|migrat[a-z]*|security|root cause)(?![A-Za-z])",
+    re.IGNORECASE
+)
+# 简单查询：列出、显示、查看状态等
+FAST_PATTERN = re.compile(
+    r"列出|显示|查看|有哪些|有多少|是否在运行|状态|多少个|"
+    r"(?<![A-Za-z])(list|show|status|how many|which|is .* running|ps)(?![A-Za-z])",
+    re.IGNORECASE
+)
+# 包含compose文件或代码块的提示词
+CODE_PATTERN = re.compile(r"```|^\s*services:\s*$", re.MULTILINE)
+
+# 各模型每百万token的价格（美元）：输入、输出；缓存写入按输入价格的1.25倍、缓存命中按0.1倍计
+MODEL_PRICING = {
+    "claude-3-haiku-20240307": (0.25, 1.25),
+    "claude-3-sonnet-20240229": (3.0, 15.0),
+    "claude-3-opus-20240229": (15.0, 75.0)
+}
+
+# 按提示词选择路由
+def classify_prompt(prompt: str) -> str:
+    if len(prompt) >= ROUTE_QUALITY_MIN_LENGTH or QUALITY_PATTERN.search(prompt):
+        return "quality"
+    if CODE_PATTERN.search(prompt):
+        return "balanced"
+    if len(prompt) <= ROUTE_FAST_MAX_LENGTH and FAST_PATTERN.search(prompt):
+        return "fast"
+    return "balanced"
+
+# 估算一次调用的费用（美元），未知模型返回None
+def estimate_cost(model: str, usage: Dict[str, Optional[int]]) -> Optional[float]:
+    pricing = MODEL_PRICING.get(model)
+    if pricing is None:
+        return None
+    input_price, output_price = pricing
+    cost = (
+        (usage.get("input_tokens") or 0) * input_price
+        + (usage.get("cache_creation_input_tokens") or 0) * input_price * 1.25
+        + (usage.get("cache_read_input_tokens") or 0) * input_price * 0.1
+        + (usage.get("output_tokens") or 0) * output_price
+    )
+    return cost / 1_000_000
+
+# 按路由统计调用次数、延迟、token用量和费用
+class RouteStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes: Dict[str, Dict[str, Any]] = {}
+
+    # 记录一次调用
+    def record(self, route: str, model: str, seconds: float, usage: Dict[str, Optional[int]], error: bool = False):
+        cost = estimate_cost(model, usage) or 0.0
+        with self._lock:
+            stats = self._routes.setdefault(route, {
+                "calls": 0, "errors": 0, "total_seconds": 0.0, "max_seconds": 0.0,
+                "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0, "models": {}
+            })
+            stats["calls"] += 1
+            stats["errors"] += 1 if error else 0
+            stats["total_seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+            stats["input_tokens"] += (usage.get("input_tokens") or 0)
+            stats["output_tokens"] += (usage.get("output_tokens") or 0)
+            stats["cost_usd"] += cost
+            stats["models"][model] = stats["models"].get(model, 0) + 1
+
+    # 统计结果
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                route: {
+                    "calls": s["calls"],
+                    "errors": s["errors"],
+                    "avg_seconds": round(s["total_seconds"] / s["calls"], 3) if s["calls"] else 0.0,
+                    "max_seconds": round(s["max_seconds"], 3),
+                    "input_tokens": s["input_tokens"],
+                    "output_tokens": s["output_tokens"],
+                    "cost_usd": round(s["cost_usd"], 6),
+                    "models": dict(s["models"])
+                } for route, s in self._routes.items()
+            }
+
+# Claude调用的路由统计
+route_stats = RouteStats()
@@ -0,0 +1,162 @@
+import os
+import uuid
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from app_modules.cache import TTLCache
+from app_modules.context import CLAUDE_CONTEXT_TOKEN_BUDGET, estimate_tokens
+
+# 会话在最后一次使用后的保留时间（秒）
+SESSION_TTL = float(os.getenv("SESSION_TTL", 3600))
+# 内存中保留的会话数上限
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", 1000))
+# 会话历史的token预算，超过后把较早的对话压缩为摘要
+SESSION_HISTORY_TOKEN_BUDGET = int(os.getenv("SESSION_HISTORY_TOKEN_BUDGET", 4000))
+# 压缩时保留的最近消息数（用户和助手各算一条）
+SESSION_KEEP_MESSAGES = int(os.getenv("SESSION_KEEP_MESSAGES", 4))
+# 压缩历史时用于生成摘要的模型
+SESSION_SUMMARY_MODEL = os.getenv("SESSION_SUMMARY_MODEL", "claude-3-haiku-20240307")
+
+# 以容器ID为键的摘要，用于比较两次环境信息
+def index_containers(context: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    return {c.get('id'): c for c in context.get('containers') or []}
+
+# 以镜像ID为键的摘要
+def index_images(context: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    return {i.get('id'): i for i in context.get('images') or []}
+
+# 计算两次Docker环境信息之间的变化，以紧凑文本表示
+def diff_docker_context(old: Dict[str, Any], new: Dict[str, Any]) -> str:
+    if new.get('error'):
+        return f"Docker环境信息不可用: {new['error']}"
+
+    old_containers, new_containers = index_containers(old), index_containers(new)
+    old_images, new_images = index_images(old), index_images(new)
+    lines = []
+    for cid, c in new_containers.items():
+        if cid not in old_containers:
+            lines.append(f"+ 容器 {c.get('name')}|{cid}|{c.get('image')}|{c.get('status')}")
+        else:
+            before = old_containers[cid]
+            changes = [
+                f"{field}: {before.get(field)} -> {c.get(field)}"
+                for field in ("name", "image", "status") if before.get(field) != c.get(field)
+            ]
+            if changes:
+                lines.append(f"~ 容器 {c.get('name')}|{cid} {', '.join(changes)}")
+    for cid, c in old_containers.items():
+        if cid not in new_containers:
+            lines.append(f"- 容器 {c.get('name')}|{cid}")
+    for iid, i in new_images.items():
+        if iid not in old_images:
+            lines.append(f"+ 镜像 {','.join(i.get('tags') or []) or '<none>'}|{iid}|{i.get('size')}")
+    for iid, i in old_images.items():
+        if iid not in new_images:
+            lines.append(f"- 镜像 {','.join(i.get('tags') or []) or '<none>'}|{iid}")
+
+    if not lines:
+        return "自上一轮以来Docker环境没有变化"
+    return "自上一轮以来Docker环境的变化:\n" + "\n".join(lines)
+
+# 估算消息列表的token数
+def estimate_messages_tokens(messages: List[Dict[str, str]]) -> int:
+    return sum(estimate_tokens(message["content"]) + 4 for message in messages)
+
+# 服务端保存的对话会话
+class ConversationSession:
+    def __init__(self, owner: str):
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.messages: List[Dict[str, str]] = []
+        self.summary: Optional[str] = None
+        self.last_context: Optional[Dict[str, Any]] = None
+        self.turns = 0
+        self.compactions = 0
+        self.busy = False
+        self.created_at = datetime.now()
+        self.updated_at = self.created_at
+
+    # 本轮附带的环境信息：第一轮（或压缩后）发送完整快照，之后只发送变化
+    # 变化超过token预算时（例如批量创建或删除了很多容器）改为发送按预算截断的完整快照
+    def context_text(self, context: Dict[str, Any], format_full: Callable[[Dict[str, Any]], str],
+                     token_budget: int = CLAUDE_CONTEXT_TOKEN_BUDGET):
+        if self.last_context is not None and not self.last_context.get('error'):
+            diff = diff_docker_context(self.last_context, context)
+            if estimate_tokens(diff) <= token_budget:
+                return "diff", diff
+        return "full", f"当前Docker环境信息:\n{format_full(context)}"
+
+    # 记录一轮对话
+    def record_turn(self, user_content: str, assistant_content: str, context: Dict[str, Any]):
+        self.messages.append({"role": "user", "content": user_content})
+        self.messages.append({"role": "assistant", "content": assistant_content})
+        self.last_context = context
+        self.turns += 1
+        self.updated_at = datetime.now()
+
+    # 历史超过token预算时，把较早的消息交给summarize压缩为摘要，只保留最近的消息
+    # 压缩后下一轮重新发送完整的环境快照，避免变化信息失去参照
+    async def compact(self, summarize: Callable[[Optional[str], List[Dict[str, str]]], Awaitable[str]],
+                      token_budget: int = SESSION_HISTORY_TOKEN_BUDGET,
+                      keep_messages: int = SESSION_KEEP_MESSAGES) -> bool:
+        history_tokens = estimate_messages_tokens(self.messages) + estimate_tokens(self.summary or "")
+        if history_tokens <= token_budget or len(self.messages) <= keep_messages:
+            return False
+        # 保证保留部分从用户消息开始
+        split = len(self.messages) - keep_messages
+        if split % 2:
+            split -= 1
+        # 摘要生成成功后才替换历史，失败时保留原来的消息
+        summary = await summarize(self.summary, self.messages[:split])
+        self.messages = self.messages[split:]
+        self.summary = summary
+        self.last_context = None
+        self.compactions += 1
+        return True
+
+    # 转换为API返回的字典
+    def to_dict(self, include_messages: bool = True) -> Dict[str, Any]:
+        data = {
+            "id": self.id,
+            "turns": self.turns,
+            "compactions": self.compactions,
+            "summary": self.summary,
+            "history_tokens": estimate_messages_tokens(self.messages),
+            "created_at": self.created_at,
+            "updated_at": self.updated_at
+        }
+        if include_messages:
+            data["messages"] = self.messages
+        return data
+
+# 会话存储：按最近使用淘汰，闲置超过SESSION_TTL后过期
+class SessionStore:
+    def __init__(self, max_entries: int = SESSION_MAX_ENTRIES, ttl: float = SESSION_TTL):
+        self._cache = TTLCache(max_entries, ttl)
+
+    # 创建会话
+    def create(self, owner: str) -> ConversationSession:
+        session = ConversationSession(owner)
+        self._cache.set(session.id, session)
+        return session
+
+    # 获取会话并刷新过期时间
+    def get(self, session_id: str) -> Optional[ConversationSession]:
+        session = self._cache.get(session_id)
+        if session is not None:
+            self._cache.set(session_id, session)
+        return session
+
+    # 删除会话
+    def delete(self, session_id: str) -> Optional[ConversationSession]:
+        return self._cache.pop(session_id)
+
+    # 列出某个用户的会话（最近使用的在前）
+    def list_sessions(self, owner: str) -> List[ConversationSession]:
+        return [s for s in reversed(self._cache.values()) if s.owner == owner]
+
+    # 存储运行指标
+    def stats(self) -> Dict[str, Any]:
+        return self._cache.stats()
+
+# Claude对话会话存储
+claude_sessions = SessionStore()
@@ -0,0 +1,216 @@
+import os
+import time
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+from app_modules.docker_client import get_docker_client
+
+# 配置日志
+logger = logging.getLogger("docker_state")
+
+# 是否启用事件驱动的状态缓存
+STATE_CACHE_ENABLED = os.getenv("STATE_CACHE_ENABLED", "True").lower() == "true"
+# 缓存允许的最大陈旧时间（秒），超过后读取方回退到直接查询dockerd
+STATE_CACHE_MAX_STALENESS = float(os.getenv("STATE_CACHE_MAX_STALENESS", 60))
+# 事件流窗口长度（秒），每个窗口正常结束即确认缓存仍然是最新的
+STATE_CACHE_EVENT_WINDOW = float(os.getenv("STATE_CACHE_EVENT_WINDOW", 20))
+# 兜底的全量重新同步间隔（秒）
+STATE_CACHE_RESYNC_INTERVAL = float(os.getenv("STATE_CACHE_RESYNC_INTERVAL", 600))
+
+# 会改变容器摘要的事件，收到后重新获取该容器的摘要
+CONTAINER_REFRESH_ACTIONS = {
+    "create", "start", "restart", "die", "stop", "kill", "oom",
+    "pause", "unpause", "rename", "update"
+}
+# 会改变镜像列表或标签的事件
+IMAGE_REFRESH_ACTIONS = {"tag", "untag", "delete", "pull", "import", "load"}
+
+# Compose为容器添加的标签
+COMPOSE_PROJECT_LABEL = "com.docker.compose.project"
+COMPOSE_SERVICE_LABEL = "com.docker.compose.service"
+COMPOSE_NUMBER_LABEL = "com.docker.compose.container-number"
+
+# 按compose标签建立 project -> service -> 容器摘要列表 的索引
+def build_compose_index(containers: List[Dict[str, Any]]) -> Dict[str, Dict[str, List[Dict[str, Any]]]]:
+    index: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
+    for container in containers:
+        labels = container.get('Labels') or {}
+        project = labels.get(COMPOSE_PROJECT_LABEL)
+        service = labels.get(COMPOSE_SERVICE_LABEL)
+        if project and service:
+            index.setdefault(project, {}).setdefault(service, []).append(container)
+    return index
+
+# 进程级Docker状态缓存：启动时全量同步一次，之后消费docker events保持最新
+class DockerStateCache:
+    def __init__(self, max_staleness: float = STATE_CACHE_MAX_STALENESS,
+                 event_window: float = STATE_CACHE_EVENT_WINDOW,
+                 resync_interval: float = STATE_CACHE_RESYNC_INTERVAL):
+        self.max_staleness = max_staleness
+        self.event_window = event_window
+        self.resync_interval = resync_interval
+        self._lock = threading.RLock()
+        self._containers: Dict[str, Dict[str, Any]] = {}
+        self._images: Dict[str, Dict[str, Any]] = {}
+        self._client = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._stream = None
+        self._ready = False
+        self._last_confirmed = 0.0
+        self._last_sync = 0.0
+        self._since: Optional[int] = None
+        self._compose_index = None
+        self._compose_index_generation = -1
+        self.generation = 0
+        self.events_processed = 0
+        self.resyncs = 0
+
+    # 启动后台同步线程（不阻塞应用启动，dockerd不可用时读取方自动回退）
+    def start(self, client=None):
+        if self._thread and self._thread.is_alive():
+            return
+        self._client = client
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="docker-state-cache", daemon=True)
+        self._thread.start()
+
+    # 停止后台同步线程
+    def stop(self):
+        self._stop.set()
+        stream = self._stream
+        if stream is not None:
+            try:
+                stream.close()
+            except Exception:
+                pass
+
+    # 缓存是否可用于读取：已完成同步且在陈旧时间限制内得到过确认
+    def is_fresh(self) -> bool:
+        with self._lock:
+            return self._ready and time.monotonic() - self._last_confirmed < self.max_staleness
+
+    # 获取所有容器摘要（与/containers/json格式相同）
+    def list_containers(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._containers.values())
+
+    # 按完整ID、ID前缀或名称查找容器摘要
+    def find_container(self, ref: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if ref in self._containers:
+                return self._containers[ref]
+            for summary in self._containers.values():
+                if '/' + ref in (summary.get('Names') or []):
+                    return summary
+            matches = [s for cid, s in self._containers.items() if cid.startswith(ref)]
+            return matches[0] if len(matches) == 1 else None
+
+    # 获取compose索引，状态未变化时复用上次构建的结果
+    def compose_index(self) -> Dict[str, Dict[str, List[Dict[str, Any]]]]:
+        with self._lock:
+            if self._compose_index_generation != self.generation:
+                self._compose_index = build_compose_index(list(self._containers.values()))
+                self._compose_index_generation = self.generation
+            return self._compose_index
+
+    # 获取所有镜像摘要（与/images/json格式相同）
+    def list_images(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._images.values())
+
+    # 缓存运行指标
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": STATE_CACHE_ENABLED,
+                "ready": self._ready,
+                "fresh": self.is_fresh(),
+                "containers": len(self._containers),
+                "images": len(self._images),
+                "generation": self.generation,
+                "events_processed": self.events_processed,
+                "resyncs": self.resyncs,
+                "seconds_since_confirmed": round(time.monotonic() - self._last_confirmed, 1) if self._ready else None
+            }
+
+    # 全量同步容器和镜像；since取同步开始前的时间，保证同步期间的事件会被重放
+    def resync(self):
+        since = int(time.time())
+        containers = self._client.api.containers(all=True)
+        images = self._client.api.images()
+        with self._lock:
+            self._containers = {c['Id']: c for c in containers}
+            self._images = {i['Id']: i for i in images}
+            self._ready = True
+            self._last_confirmed = time.monotonic()
+            self._last_sync = self._last_confirmed
+            self._since = since
+            self.generation += 1
+            self.resyncs += 1
+        logger.info(f"Docker状态缓存已同步: {len(containers)} 个容器, {len(images)} 个镜像")
+
+    # 处理单个docker事件
+    def handle_event(self, event: Dict[str, Any]):
+        event_type = event.get('Type')
+        action = (event.get('Action') or '').split(':')[0]
+        actor_id = (event.get('Actor') or {}).get('ID') or event.get('id')
+
+        if event_type == 'container' and actor_id:
+            if action == 'destroy':
+                with self._lock:
+                    if self._containers.pop(actor_id, None) is not None:
+                        self.generation += 1
+            elif action in CONTAINER_REFRESH_ACTIONS:
+                summaries = self._client.api.containers(all=True, filters={"id": actor_id})
+                with self._lock:
+                    for summary in summaries:
+                        self._containers[summary['Id']] = summary
+                    self.generation += 1
+        elif event_type == 'image' and action in IMAGE_REFRESH_ACTIONS:
+            images = self._client.api.images()
+            with self._lock:
+                self._images = {i['Id']: i for i in images}
+                self.generation += 1
+
+        with self._lock:
+            self.events_processed += 1
+            self._last_confirmed = time.monotonic()
+            if event.get('time'):
+                self._since = max(self._since or 0, int(event['time']))
+
+    # 消费一个时间窗口内的事件，流中断时抛出异常
+    def _consume_window(self):
+        until = int(time.time() + self.event_window)
+        self._stream = self._client.events(decode=True, since=self._since, until=until)
+        try:
+            for event in self._stream:
+                if self._stop.is_set():
+                    return
+                self.handle_event(event)
+        finally:
+            self._stream = None
+        with self._lock:
+            self._last_confirmed = time.monotonic()
+            self._since = until
+
+    # 后台线程主循环：事件流中断（出现缺口）或到达兜底间隔时全量重新同步
+    def _run(self):
+        need_resync = True
+        while not self._stop.is_set():
+            try:
+                if self._client is None:
+                    self._client = get_docker_client()
+                if need_resync or time.monotonic() - self._last_sync > self.resync_interval:
+                    self.resync()
+                self._consume_window()
+                need_resync = False
+            except Exception as e:
+                if self._stop.is_set():
+                    break
+                logger.error(f"Docker事件流中断，将重新同步: {str(e)}")
+                need_resync = True
+                self._stop.wait(min(5.0, self.event_window))
+
+# 进程级共享实例
+state_cache = DockerStateCache()
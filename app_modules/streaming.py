@@ -0,0 +1,19 @@
+import inspect
+from typing import Any, Callable
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+# 流式响应结束后（包括客户端在第一个数据块之前断开、响应体从未开始迭代的情况）总是执行on_close，
+# 用于释放在返回响应之前占用的资源（上游连接、并发槽位等）；on_close可以是普通函数或协程函数，需要可以重复调用
+class ClosingStreamingResponse(StreamingResponse):
+    def __init__(self, content: Any, on_close: Callable[[], Any], **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            result = self.on_close()
+            if inspect.isawaitable(result):
+                await result
@@ -0,0 +1,174 @@
+import os
+import queue
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, Optional
+from starlette.concurrency import run_in_threadpool
+from app_modules.cache import TTLCache
+from app_modules.models import UserInDB
+
+# 用户表使用的SQLite文件路径，为空时用户只保存在当前进程的内存中（多进程部署时需要设置）
+USER_DB = os.getenv("USER_DB", "")
+# SQLite连接池大小
+USER_DB_POOL_SIZE = int(os.getenv("USER_DB_POOL_SIZE", 4))
+# 从数据库读取的用户在内存中的缓存时间（秒），其他进程对用户的修改最多延迟这么久可见
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", 30))
+# 内存中缓存的用户数上限
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 1024))
+
+# 用户表中保存的字段
+USER_FIELDS = ("id", "username", "email", "full_name", "disabled", "hashed_password", "created_at")
+
+# 用户存储接口
+class UserRepository(ABC):
+    backend = "base"
+    # 操作是否可能阻塞（读写数据库、等待其他进程的写锁），阻塞的存储在线程池中调用
+    blocking = True
+
+    # 按用户名获取用户，不存在时返回None
+    @abstractmethod
+    def get(self, username: str) -> Optional[UserInDB]:
+        ...
+
+    # 创建用户，用户名已存在时返回False
+    @abstractmethod
+    def create(self, user: Dict[str, Any]) -> bool:
+        ...
+
+    # 用户数
+    @abstractmethod
+    def count(self) -> int:
+        ...
+
+    # 存储运行指标
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.backend, "users": self.count()}
+
+# 内存用户存储：用户保存在字典中，仅在当前进程内有效，重启后丢失
+class MemoryUserRepository(UserRepository):
+    backend = "memory"
+    blocking = False
+
+    def __init__(self, users: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.users = users if users is not None else {}
+        self._lock = threading.Lock()
+
+    def get(self, username: str) -> Optional[UserInDB]:
+        user_dict = self.users.get(username)
+        return UserInDB(**user_dict) if user_dict is not None else None
+
+    def create(self, user: Dict[str, Any]) -> bool:
+        with self._lock:
+            if user["username"] in self.users:
+                return False
+            self.users[user["username"]] = user
+            return True
+
+    def count(self) -> int:
+        return len(self.users)
+
+# SQLite用户存储：WAL模式下多个进程可以同时读写同一个文件，连接在线程之间复用，
+# 读取的用户放入内存缓存，减少重复查询
+class SQLiteUserRepository(UserRepository):
+    backend = "sqlite"
+
+    def __init__(self, db_path: str, pool_size: int = USER_DB_POOL_SIZE,
+                 cache_ttl: float = USER_CACHE_TTL, cache_size: int = USER_CACHE_SIZE):
+        self.db_path = db_path
+        self.cache_ttl = cache_ttl
+        self._cache = TTLCache(cache_size, cache_ttl)
+        self._pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(maxsize=pool_size)
+        self._pool_size = pool_size
+        self._opened = 0
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    # 打开一个新连接，首次连接时创建用户表
+    def _connect(self) -> sqlite3.Connection:
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        db = sqlite3.connect(self.db_path, check_same_thread=False, timeout=10)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        if not self._initialized:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS users ("
+                "username TEXT PRIMARY KEY, id TEXT NOT NULL UNIQUE, email TEXT, full_name TEXT, "
+                "disabled INTEGER NOT NULL DEFAULT 0, hashed_password TEXT NOT NULL, created_at TEXT NOT NULL)"
+            )
+            db.commit()
+            self._initialized = True
+        return db
+
+    # 从连接池中取出连接，用完后放回；池中没有空闲连接且未达到上限时新建连接
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        try:
+            db = self._pool.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self._opened < self._pool_size
+                if can_open:
+                    db = self._connect()
+                    self._opened += 1
+            if not can_open:
+                db = self._pool.get()
+        try:
+            yield db
+        finally:
+            self._pool.put(db)
+
+    def get(self, username: str) -> Optional[UserInDB]:
+        user = self._cache.get(username) if self.cache_ttl > 0 else None
+        if user is not None:
+            return user
+        with self._connection() as db:
+            row = db.execute(
+                f"SELECT {', '.join(USER_FIELDS)} FROM users WHERE username = ?", (username,)
+            ).fetchone()
+        if row is None:
+            return None
+        user = UserInDB(**dict(zip(USER_FIELDS, row)))
+        if self.cache_ttl > 0:
+            self._cache.set(username, user)
+        return user
+
+    def create(self, user: Dict[str, Any]) -> bool:
+        created_at = user.get("created_at") or datetime.now()
+        values = {**user, "disabled": int(bool(user.get("disabled"))), "created_at": created_at.isoformat()}
+        with self._connection() as db:
+            try:
+                db.execute(
+                    f"INSERT INTO users ({', '.join(USER_FIELDS)}) VALUES ({', '.join('?' for _ in USER_FIELDS)})",
+                    tuple(values.get(field) for field in USER_FIELDS)
+                )
+                db.commit()
+            except sqlite3.IntegrityError:
+                db.rollback()
+                return False
+        return True
+
+    def count(self) -> int:
+        with self._connection() as db:
+            return db.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "cache": self._cache.stats()}
+
+# 内存中的用户表（未配置USER_DB时使用）
+fake_users_db: Dict[str, Dict[str, Any]] = {}
+
+# 应用使用的用户存储
+user_repository: UserRepository = (
+    SQLiteUserRepository(USER_DB) if USER_DB else MemoryUserRepository(fake_users_db)
+)
+
+# 在事件循环中调用用户存储的方法：阻塞的存储在线程池中执行，避免等待数据库锁时阻塞所有请求
+async def run_user_repository(func: Callable[..., Any], *args) -> Any:
+    if user_repository.blocking:
+        return await run_in_threadpool(func, *args)
+    return func(*args)
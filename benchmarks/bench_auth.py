@@ -0,0 +1,78 @@
+# 认证开销基准测试：比较令牌缓存开启和关闭时的令牌验证耗时和请求耗时
+# 运行方式: python benchmarks/bench_auth.py（BENCH_REQUESTS控制每组请求数）
+import os
+import sys
+import time
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+from app import app
+from app_modules import auth
+
+# 每组测量的请求数
+REQUESTS = int(os.getenv("BENCH_REQUESTS", 2000))
+
+# 创建测试用户并返回令牌
+def setup_user() -> str:
+    auth.fake_users_db["bench"] = {
+        "id": "bench-user-id",
+        "username": "bench",
+        "email": "bench@example.com",
+        "full_name": "Bench User",
+        "disabled": False,
+        "hashed_password": "not-used",
+        "created_at": datetime.now()
+    }
+    return auth.create_access_token(data={"sub": "bench"}, expires_delta=timedelta(minutes=30))
+
+# 测量令牌验证本身的耗时（微秒/次）
+def bench_resolve(token: str, cache_ttl: float) -> float:
+    async def resolve_many():
+        await auth.resolve_token(token)
+        started = time.perf_counter()
+        for _ in range(REQUESTS * 10):
+            await auth.resolve_token(token)
+        return (time.perf_counter() - started) / (REQUESTS * 10) * 1e6
+
+    with patch.object(auth, "AUTH_TOKEN_CACHE_TTL", cache_ttl):
+        auth.token_cache.pop(token)
+        return asyncio.run(resolve_many())
+
+# 测量经过完整认证依赖的请求耗时（微秒/次）
+def bench_requests(client: TestClient, token: str, cache_ttl: float) -> float:
+    headers = {"Authorization": f"Bearer {token}"}
+    with patch.object(auth, "AUTH_TOKEN_CACHE_TTL", cache_ttl):
+        auth.token_cache.pop(token)
+        for _ in range(50):
+            client.get("/api/claude/config", headers=headers)
+        started = time.perf_counter()
+        for _ in range(REQUESTS):
+            client.get("/api/claude/config", headers=headers)
+        return (time.perf_counter() - started) / REQUESTS * 1e6
+
+def main():
+    # 关闭测试客户端的请求日志，避免日志输出影响测量
+    for name in ("httpx", "httpx2"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+    token = setup_user()
+    client = TestClient(app)
+
+    # 每组取3轮中的最小值，减少抖动
+    resolve_uncached = min(bench_resolve(token, 0) for _ in range(3))
+    resolve_cached = min(bench_resolve(token, 60) for _ in range(3))
+    request_uncached = min(bench_requests(client, token, 0) for _ in range(3))
+    request_cached = min(bench_requests(client, token, 60) for _ in range(3))
+
+    print(f"令牌验证（不缓存）: {resolve_uncached:8.1f} us/次")
+    print(f"令牌验证（缓存）:   {resolve_cached:8.1f} us/次")
+    print(f"认证请求（不缓存）: {request_uncached:8.1f} us/请求")
+    print(f"认证请求（缓存）:   {request_cached:8.1f} us/请求，节省 {request_uncached - request_cached:6.1f} us/请求")
+
+if __name__ == "__main__":
+    main()
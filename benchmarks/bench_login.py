@@ -0,0 +1,76 @@
+# 登录吞吐量基准测试：比较在事件循环中直接计算bcrypt和使用密码线程池时的登录吞吐量，
+# 以及登录高峰期间其他请求的延迟（用事件循环心跳的延迟近似）
+# 运行方式: python benchmarks/bench_login.py（BENCH_LOGINS控制并发登录数）
+import os
+import sys
+import time
+import asyncio
+from datetime import datetime
+from unittest.mock import patch
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app_modules import auth
+
+# 同时发起的登录请求数
+LOGINS = int(os.getenv("BENCH_LOGINS", 16))
+# 心跳间隔（秒）
+HEARTBEAT_INTERVAL = 0.005
+
+# 在事件循环中直接执行的对照实现（改动前的行为）
+class InlineRunner:
+    async def run(self, func, *args, operation: str = "default", timeout=None, **kwargs):
+        return func(*args, **kwargs)
+
+# 创建测试用户
+def setup_user():
+    auth.fake_users_db["bench"] = {
+        "id": "bench-user-id",
+        "username": "bench",
+        "email": "bench@example.com",
+        "full_name": "Bench User",
+        "disabled": False,
+        "hashed_password": auth.get_password_hash("bench-password"),
+        "created_at": datetime.now()
+    }
+
+# 登录高峰期间定期检查事件循环的响应延迟
+async def heartbeat(lags, stop: asyncio.Event):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+        lags.append(time.perf_counter() - started - HEARTBEAT_INTERVAL)
+
+# 并发执行LOGINS次登录，返回（每秒登录数，心跳延迟p50，心跳延迟最大值）
+async def run_storm():
+    lags = []
+    stop = asyncio.Event()
+    monitor = asyncio.ensure_future(heartbeat(lags, stop))
+    await asyncio.sleep(HEARTBEAT_INTERVAL * 2)
+    started = time.perf_counter()
+    users = await asyncio.gather(*(
+        auth.authenticate_user("bench", "bench-password") for _ in range(LOGINS)
+    ))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await monitor
+    assert all(users)
+    lags.sort()
+    return LOGINS / elapsed, lags[len(lags) // 2] * 1000, lags[-1] * 1000
+
+def main():
+    setup_user()
+    with patch.object(auth, "password_executor", InlineRunner()):
+        inline = asyncio.run(run_storm())
+    # 测量吞吐量时不限制排队数和超时
+    with patch.object(auth.password_executor, "max_queue", None), \
+            patch.object(auth.password_executor, "default_timeout", 300):
+        pooled = asyncio.run(run_storm())
+
+    print(f"并发登录数: {LOGINS}，密码线程池大小: {auth.password_executor.max_workers}")
+    for label, (throughput, p50, worst) in (("事件循环中计算", inline), ("密码线程池", pooled)):
+        print(f"{label}: {throughput:7.1f} 次登录/秒，其他请求延迟 p50 {p50:7.1f} ms，最大 {worst:7.1f} ms")
+
+if __name__ == "__main__":
+    main()
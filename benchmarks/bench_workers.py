@@ -0,0 +1,113 @@
+# 多进程吞吐量基准测试：以不同的工作进程数启动服务，测量认证接口的吞吐量
+# 运行方式: python benchmarks/bench_workers.py
+# BENCH_WORKERS为要比较的进程数（逗号分隔），BENCH_CONCURRENCY为并发连接数，BENCH_DURATION为每组测量秒数
+import os
+import sys
+import json
+import time
+import signal
+import tempfile
+import threading
+import subprocess
+import http.client
+import urllib.parse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORKER_COUNTS = [int(n) for n in os.getenv("BENCH_WORKERS", "1,2,4").split(",")]
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", 32))
+DURATION = float(os.getenv("BENCH_DURATION", 5))
+PORT = int(os.getenv("BENCH_PORT", 5099))
+# 健康检查通过后等待其他工作进程启动完成的时间（秒）
+WARMUP = float(os.getenv("BENCH_WARMUP", 5))
+
+# 发送一个请求并返回（状态码，响应体）
+def request(conn: http.client.HTTPConnection, method: str, path: str, body=None, headers=None):
+    conn.request(method, path, body=body, headers=headers or {})
+    response = conn.getresponse()
+    return response.status, response.read()
+
+# 启动服务并等待健康检查通过
+def start_server(workers: int, data_dir: str) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "PORT": str(PORT),
+        "HOST": "127.0.0.1",
+        "WORKERS": str(workers),
+        "MCP_DATA_DIR": data_dir,
+        "STATE_CACHE_ENABLED": "False",
+        "DEBUG": "False"
+    }
+    process = subprocess.Popen([sys.executable, "app.py"], cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", PORT, timeout=1)
+            if request(conn, "GET", "/health")[0] == 200:
+                conn.close()
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("服务启动超时")
+
+# 注册测试用户并登录（注册和登录可能由不同的工作进程处理）
+def get_token() -> str:
+    conn = http.client.HTTPConnection("127.0.0.1", PORT, timeout=30)
+    user = {"username": "bench", "password": "bench-password"}
+    request(conn, "POST", "/api/auth/register", json.dumps(user), {"Content-Type": "application/json"})
+    status, body = request(conn, "POST", "/api/auth/token", urllib.parse.urlencode(user),
+                           {"Content-Type": "application/x-www-form-urlencoded"})
+    conn.close()
+    if status != 200:
+        raise RuntimeError(f"登录失败: {status} {body!r}")
+    return json.loads(body)["access_token"]
+
+# 多个长连接在DURATION秒内持续请求，返回（每秒请求数，失败数）
+def run_load(token: str):
+    headers = {"Authorization": f"Bearer {token}"}
+    counts = [0] * CONCURRENCY
+    failures = [0] * CONCURRENCY
+    deadline = time.monotonic() + DURATION
+
+    def worker(index: int):
+        conn = http.client.HTTPConnection("127.0.0.1", PORT, timeout=30)
+        while time.monotonic() < deadline:
+            try:
+                status, _ = request(conn, "GET", "/api/auth/me", headers=headers)
+                if status == 200:
+                    counts[index] += 1
+                else:
+                    failures[index] += 1
+            except (OSError, http.client.HTTPException):
+                failures[index] += 1
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", PORT, timeout=30)
+        conn.close()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(CONCURRENCY)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / (time.monotonic() - started), sum(failures)
+
+def main():
+    print(f"CPU核数: {os.cpu_count()}，并发连接数: {CONCURRENCY}，每组 {DURATION} 秒")
+    baseline = None
+    for workers in WORKER_COUNTS:
+        with tempfile.TemporaryDirectory() as data_dir:
+            process = start_server(workers, data_dir)
+            try:
+                time.sleep(WARMUP)
+                throughput, failures = run_load(get_token())
+            finally:
+                process.send_signal(signal.SIGINT)
+                process.wait(timeout=60)
+        baseline = baseline or throughput
+        print(f"{workers} 个工作进程: {throughput:8.1f} 请求/秒（{throughput / baseline:4.2f}x），失败 {failures}")
+
+if __name__ == "__main__":
+    main()
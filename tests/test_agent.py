@@ -0,0 +1,142 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from app_modules.agent import execute_tool_calls, run_agent
+from app_modules.models import User
+
+# 构造Claude返回的内容块
+def text_block(text):
+    return MagicMock(type="text", text=text)
+
+def tool_use_block(tool_id, name, tool_input):
+    block = MagicMock(type="tool_use", id=tool_id, input=tool_input)
+    block.name = name
+    return block
+
+def make_message(content, stop_reason):
+    return MagicMock(content=content, stop_reason=stop_reason, model="claude-3-opus-20240229",
+                     usage=MagicMock(input_tokens=10, output_tokens=5))
+
+# 测试通过工具调用查询容器后给出回答
+@patch('app_modules.claude.ANTHROPIC_API_KEY', "test-key")
+@patch('app_modules.containers.get_container_logs', new_callable=AsyncMock)
+@patch('app_modules.containers.list_container_models', new_callable=AsyncMock)
+@patch('app_modules.claude.get_anthropic_client')
+@patch('app_modules.claude.get_docker_context')
+def test_claude_agent(mock_get_docker_context, mock_get_anthropic_client, mock_list_containers,
+                      mock_get_logs, authorized_client):
+    mock_get_docker_context.return_value = {"containers": [], "images": []}
+    mock_list_containers.return_value = [{"id": "abc123", "name": "web", "status": "running"}]
+    mock_get_logs.return_value = {"logs": "GET / 200"}
+    mock_client = MagicMock()
+    mock_client.messages.create = AsyncMock(side_effect=[
+        make_message([
+            tool_use_block("t1", "list_containers", {}),
+            tool_use_block("t2", "get_container_logs", {"container_id": "web", "tail": 10})
+        ], "tool_use"),
+        make_message([text_block("web容器运行正常")], "end_turn")
+    ])
+    mock_get_anthropic_client.return_value = mock_client
+    
+    response = authorized_client.post("/api/claude/agent", json={"prompt": "web容器运行正常吗?"})
+    
+    assert response.status_code == 200
+    data = response.json()
+    assert data["completion"] == "web容器运行正常"
+    assert data["steps"] == 2
+    assert data["input_tokens"] == 20
+    assert [call["name"] for call in data["tool_calls"]] == ["list_containers", "get_container_logs"]
+    assert mock_get_logs.await_args.args[0] == "web"
+    assert mock_get_logs.await_args.kwargs["tail"] == 10
+    mock_list_containers.assert_awaited_once()
+    # 工具定义和工具结果都发送给了Claude
+    second_call = mock_client.messages.create.call_args_list[1].kwargs
+    assert any(tool["name"] == "stop_container" for tool in second_call["tools"])
+    tool_results = second_call["messages"][-1]["content"]
+    assert [result["tool_use_id"] for result in tool_results] == ["t1", "t2"]
+
+# 测试演练模式不执行修改环境的工具
+@patch('app_modules.containers.stop_container', new_callable=AsyncMock)
+def test_agent_dry_run(mock_stop_container):
+    user = User(id="test-user-id", username="testuser")
+    create_message = AsyncMock(side_effect=[
+        make_message([tool_use_block("t1", "stop_container", {"container_id": "web"})], "tool_use"),
+        make_message([text_block("将会停止web容器")], "end_turn")
+    ])
+    params = {"model": "claude-3-opus-20240229", "system": [], "messages": [{"role": "user", "content": "停止web"}]}
+    
+    result = asyncio.run(run_agent(params, create_message, user, dry_run=True))
+    
+    mock_stop_container.assert_not_called()
+    assert result["tool_calls"][0]["result"]["dry_run"] is True
+    assert result["completion"] == "将会停止web容器"
+
+# 测试达到最大轮数时停止
+def test_agent_max_steps():
+    user = User(id="test-user-id", username="testuser")
+    create_message = AsyncMock(return_value=make_message(
+        [tool_use_block("t1", "unknown_tool", {})], "tool_use"
+    ))
+    params = {"model": "claude-3-opus-20240229", "system": [], "messages": [{"role": "user", "content": "?"}]}
+    
+    result = asyncio.run(run_agent(params, create_message, user, max_steps=2))
+    
+    assert result["stop_reason"] == "max_steps"
+    assert result["steps"] == 2
+    assert result["tool_calls"][0]["is_error"] is True
+
+# 测试不同对象上的调用并行执行，同一对象上的调用按顺序执行
+def test_execute_tool_calls_grouping():
+    user = User(id="test-user-id", username="testuser")
+    events = []
+    
+    def handler(name):
+        async def run(container_id, current_user):
+            events.append(f"{name}:{container_id}:start")
+            await asyncio.sleep(0.05)
+            events.append(f"{name}:{container_id}:end")
+            return {"id": container_id}
+        return run
+    
+    tool_uses = [
+        {"id": "t1", "name": "stop_container", "input": {"container_id": "a"}},
+        {"id": "t2", "name": "start_container", "input": {"container_id": "a"}},
+        {"id": "t3", "name": "stop_container", "input": {"container_id": "b"}}
+    ]
+    with patch('app_modules.containers.stop_container', side_effect=handler("stop")), \
+         patch('app_modules.containers.start_container', side_effect=handler("start")):
+        results = asyncio.run(execute_tool_calls(tool_uses, user, dry_run=False))
+    
+    assert [r["id"] for r in results] == ["t1", "t2", "t3"]
+    # a上的stop结束后才开始start，b上的stop与a上的stop同时进行
+    assert events.index("stop:a:end") < events.index("start:a:start")
+    assert events.index("stop:b:start") < events.index("stop:a:end")
+
+# 测试修改操作越过时间上限时，已完成的调用照常记录，未完成的调用记为超时
+def test_agent_timeout_keeps_calls():
+    user = User(id="test-user-id", username="testuser")
+    create_message = AsyncMock(return_value=make_message([
+        tool_use_block("t1", "start_container", {"container_id": "a"}),
+        tool_use_block("t2", "stop_container", {"container_id": "b"})
+    ], "tool_use"))
+    params = {"model": "claude-3-opus-20240229", "system": [], "messages": [{"role": "user", "content": "?"}]}
+    
+    async def slow_stop(container_id, current_user):
+        await asyncio.sleep(1)
+        return {"id": container_id}
+    
+    async def fast_start(container_id, current_user):
+        return {"id": container_id}
+    
+    with patch('app_modules.containers.stop_container', side_effect=slow_stop), \
+         patch('app_modules.containers.start_container', side_effect=fast_start):
+        result = asyncio.run(run_agent(params, create_message, user, timeout=0.2))
+    
+    assert result["stop_reason"] == "timeout"
+    calls = {call["id"]: call for call in result["tool_calls"]}
+    assert calls["t1"]["is_error"] is False
+    assert calls["t1"]["result"] == {"id": "a"}
+    assert calls["t2"]["is_error"] is True
+    assert calls["t2"]["timed_out"] is True
+    assert "可能仍在执行" in calls["t2"]["result"]["error"]
+    assert create_message.await_count == 1
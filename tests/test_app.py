@@ -12,4 +12,38 @@ def test_root_endpoint(client):
 def test_health_check_endpoint(client):
     response = client.get("/health")
     assert response.status_code == 200
-    assert response.json() == {"status": "healthy"}
\ No newline at end of file
+    assert response.json() == {"status": "healthy"}
+
+# 测试运行指标端点
+def test_metrics_endpoint(client):
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    stats = response.json()["docker_executor"]
+    assert "queued" in stats
+    assert "active" in stats
+    assert "timeouts" in stats
+
+# 测试多进程模式的监听套接字设置了TCP_NODELAY
+def test_bind_listen_socket():
+    import socket
+    from app import bind_listen_socket
+    sock = bind_listen_socket("127.0.0.1", 0)
+    try:
+        assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+        assert sock.get_inheritable()
+    finally:
+        sock.close()
+
+# 测试多进程模式默认把共享状态保存到数据目录，已配置的路径不被覆盖
+def test_configure_shared_state(monkeypatch):
+    import os
+    from app import configure_shared_state
+    # 先设置再删除，测试结束后monkeypatch会恢复原来的环境变量
+    for name in ("USER_DB", "COMPOSE_JOB_DB"):
+        monkeypatch.setenv(name, "")
+        monkeypatch.delenv(name)
+    monkeypatch.setenv("CLAUDE_RESULT_DB", "/tmp/results.db")
+    configure_shared_state()
+    assert os.environ["USER_DB"].endswith("users.db")
+    assert os.environ["COMPOSE_JOB_DB"].endswith("compose_jobs.db")
+    assert os.environ["CLAUDE_RESULT_DB"] == "/tmp/results.db"
@@ -75,4 +75,56 @@ def test_read_users_me(authorized_client, test_user):
 # 测试未授权访问
 def test_read_users_me_unauthorized(client):
     response = client.get("/api/auth/me")
-    assert response.status_code == 401
\ No newline at end of file
+    assert response.status_code == 401
+# 测试无效令牌返回401
+def test_read_users_me_invalid_token(client):
+    response = client.get("/api/auth/me", headers={"Authorization": "Bearer invalid"})
+    assert response.status_code == 401
+    assert response.json()["detail"] == "无法验证凭据"
+
+# 测试已验证的令牌在缓存有效期内不再重复解码
+def test_token_cache(authorized_client, test_user_token):
+    from unittest.mock import patch
+    from app_modules.auth import token_cache, jwt
+    token_cache.pop(test_user_token)
+    with patch.object(jwt, "decode", wraps=jwt.decode) as mock_decode:
+        for _ in range(3):
+            assert authorized_client.get("/api/auth/me").status_code == 200
+    assert mock_decode.call_count == 1
+
+# 测试已过期的令牌不会被缓存
+def test_expired_token_not_cached(client, test_user):
+    from datetime import timedelta
+    from app_modules.auth import create_access_token, token_cache
+    token = create_access_token(data={"sub": test_user.username}, expires_delta=timedelta(seconds=-1))
+    response = client.get("/api/auth/me", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 401
+    assert token_cache.get(token) is None
+
+# 测试登录时的密码验证在密码线程池中执行
+def test_login_uses_password_executor(client, test_user, test_user_data):
+    from app_modules.auth import password_executor
+    completed = password_executor.stats()["completed"]
+    response = client.post(
+        "/api/auth/token",
+        data={
+            "username": test_user_data["username"],
+            "password": test_user_data["password"]
+        }
+    )
+    assert response.status_code == 200
+    assert password_executor.stats()["completed"] == completed + 1
+
+# 测试密码线程池繁忙时登录返回503
+def test_login_password_executor_busy(client, test_user, test_user_data):
+    from unittest.mock import patch
+    from app_modules.auth import password_executor
+    with patch.object(password_executor, "max_queue", 0):
+        response = client.post(
+            "/api/auth/token",
+            data={
+                "username": test_user_data["username"],
+                "password": test_user_data["password"]
+            }
+        )
+    assert response.status_code == 503
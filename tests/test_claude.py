@@ -1,7 +1,12 @@
+import json
+import asyncio
 import pytest
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 from fastapi.testclient import TestClient
+from starlette.requests import ClientDisconnect
 from app import app
+from app_modules.claude import chat_with_claude_stream, get_claude_semaphore, CLAUDE_MAX_CONCURRENCY
+from app_modules.models import ClaudeRequest
 
 # 测试获取Claude配置
 def test_get_claude_config(authorized_client):
@@ -19,9 +24,10 @@ def test_get_claude_config_unauthorized(client):
     assert response.status_code == 401
 
 # 测试与Claude聊天
-@patch('anthropic.Anthropic')
+@patch('app_modules.claude.ANTHROPIC_API_KEY', "test-key")
+@patch('app_modules.claude.get_anthropic_client')
 @patch('app_modules.claude.get_docker_context')
-def test_chat_with_claude(mock_get_docker_context, mock_anthropic, authorized_client):
+def test_chat_with_claude(mock_get_docker_context, mock_get_anthropic_client, authorized_client):
     # 模拟Docker上下文
     mock_get_docker_context.return_value = {
         "containers": [
@@ -44,14 +50,14 @@ def test_chat_with_claude(mock_get_docker_context, mock_anthropic, authorized_cl
     
     # 模拟Anthropic客户端
     mock_client = MagicMock()
-    mock_anthropic.return_value = mock_client
+    mock_get_anthropic_client.return_value = mock_client
     
     # 模拟消息响应
     mock_message = MagicMock()
-    mock_message.content = [{"type": "text", "text": "这是Claude的回复"}]
+    mock_message.content = [MagicMock(type="text", text="这是Claude的回复")]
     mock_message.stop_reason = "end_turn"
     mock_message.model = "claude-3-opus-20240229"
-    mock_client.messages.create.return_value = mock_message
+    mock_client.messages.create = AsyncMock(return_value=mock_message)
     
     # 发送请求
     response = authorized_client.post(
@@ -66,9 +72,60 @@ def test_chat_with_claude(mock_get_docker_context, mock_anthropic, authorized_cl
     # 验证响应
     assert response.status_code == 200
     data = response.json()
-    assert "completion" in data
+    assert data["completion"] == "这是Claude的回复"
     assert "stop_reason" in data
     assert "model" in data
+    # 请求使用共享客户端，并携带Docker上下文
+    kwargs = mock_client.messages.create.call_args.kwargs
+    assert kwargs["model"] == "claude-3-opus-20240229"
+    context_block, prompt_block = kwargs["messages"][0]["content"]
+    assert "test-container" in context_block["text"]
+    assert prompt_block["text"] == "如何使用Docker?"
+    # 系统提示词和环境信息标记为可缓存前缀
+    assert kwargs["system"][0]["cache_control"] == {"type": "ephemeral"}
+    assert context_block["cache_control"] == {"type": "ephemeral"}
+
+# 测试连续请求复用相同的环境快照并返回缓存用量
+@patch('app_modules.claude.ANTHROPIC_API_KEY', "test-key")
+@patch('app_modules.claude.get_anthropic_client')
+@patch('app_modules.claude.get_docker_context')
+def test_chat_with_claude_prompt_cache(mock_get_docker_context, mock_get_anthropic_client, authorized_client):
+    from app_modules.claude import pinned_contexts
+    pinned_contexts.pop("testuser")
+    mock_get_docker_context.return_value = {
+        "containers": [
+            {"id": f"{i:012x}", "name": f"app-{i}", "image": "busybox:latest", "status": "running"}
+            for i in range(3)
+        ],
+        "images": []
+    }
+    mock_client = MagicMock()
+    mock_client.messages.create = AsyncMock(return_value=MagicMock(
+        content=[MagicMock(type="text", text="回复")],
+        stop_reason="end_turn",
+        model="claude-3-opus-20240229",
+        usage=MagicMock(input_tokens=20, output_tokens=5, cache_creation_input_tokens=0, cache_read_input_tokens=1200)
+    ))
+    mock_get_anthropic_client.return_value = mock_client
+    
+    first = authorized_client.post("/api/claude/chat", json={"prompt": "查看app-2的状态"})
+    second = authorized_client.post("/api/claude/chat", json={"prompt": "有哪些容器在运行?"})
+    assert first.status_code == 200
+    assert second.json()["cache_read_input_tokens"] == 1200
+    assert second.json()["input_tokens"] == 20
+    
+    # 环境未变化时第二次请求复用第一次的环境快照
+    texts = [call.kwargs["messages"][0]["content"][0]["text"] for call in mock_client.messages.create.call_args_list]
+    assert texts[0] == texts[1]
+
+# 测试Claude客户端在请求之间复用
+@patch('app_modules.claude._anthropic_client', None)
+@patch('app_modules.claude.ANTHROPIC_API_KEY', "test-key")
+def test_anthropic_client_is_shared():
+    from app_modules.claude import get_anthropic_client, CLAUDE_MAX_RETRIES
+    first = get_anthropic_client()
+    assert get_anthropic_client() is first
+    assert first.max_retries == CLAUDE_MAX_RETRIES
 
 # 测试API密钥未配置的情况
 @patch('app_modules.claude.ANTHROPIC_API_KEY', None)
@@ -82,4 +139,299 @@ def test_chat_with_claude_no_api_key(authorized_client):
         }
     )
     assert response.status_code == 500
-    assert response.json()["detail"] == "Claude API密钥未配置"
\ No newline at end of file
+    assert response.json()["detail"] == "Claude API密钥未配置"
+# 测试以SSE流式返回Claude回复
+@patch('app_modules.claude.ANTHROPIC_API_KEY', "test-key")
+@patch('app_modules.claude.get_anthropic_client')
+@patch('app_modules.claude.get_docker_context')
+def test_chat_with_claude_stream(mock_get_docker_context, mock_get_anthropic_client, authorized_client):
+    mock_get_docker_context.return_value = {"containers": [], "images": []}
+    
+    # 模拟流式响应
+    async def text_stream():
+        for text in ["你好", "，Docker"]:
+            yield text
+    mock_stream = MagicMock()
+    mock_stream.text_stream = text_stream()
+    mock_stream.get_final_message = AsyncMock(return_value=MagicMock(
+        content=[MagicMock(type="text", text="你好，Docker")],
+        stop_reason="end_turn",
+        model="claude-3-opus-20240229"
+    ))
+    mock_manager = MagicMock()
+    mock_manager.__aenter__ = AsyncMock(return_value=mock_stream)
+    mock_manager.__aexit__ = AsyncMock(return_value=None)
+    mock_client = MagicMock()
+    mock_client.messages.stream.return_value = mock_manager
+    mock_get_anthropic_client.return_value = mock_client
+    
+    response = authorized_client.post(
+        "/api/claude/chat/stream",
+        json={"prompt": "如何使用Docker?", "model": "claude-3-opus-20240229"}
+    )
+    
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [block.split("\n") for block in response.text.strip().split("\n\n")]
+    names = [lines[0][len("event: "):] for lines in events]
+    assert names == ["start", "delta", "delta", "done"]
+    done = json.loads(events[-1][1][len("data: "):])
+    assert done["completion"] == "你好，Docker"
+    assert done["stop_reason"] == "end_turn"
+    assert done["time_to_first_token"] is not None
+    mock_manager.__aexit__.assert_awaited_once()
+
+# 测试客户端在第一个事件之前断开时仍然关闭上游流并释放并发名额
+@patch('app_modules.claude.ANTHROPIC_API_KEY', "test-key")
+@patch('app_modules.claude.get_anthropic_client')
+@patch('app_modules.claude.get_docker_context')
+def test_chat_with_claude_stream_disconnect_before_first_event(mock_get_docker_context, mock_get_anthropic_client, test_user):
+    mock_get_docker_context.return_value = {"containers": [], "images": []}
+    mock_manager = MagicMock()
+    mock_manager.__aenter__ = AsyncMock(return_value=MagicMock())
+    mock_manager.__aexit__ = AsyncMock(return_value=None)
+    mock_client = MagicMock()
+    mock_client.messages.stream.return_value = mock_manager
+    mock_get_anthropic_client.return_value = mock_client
+    
+    # 发送响应头时客户端已经断开
+    async def send(message):
+        raise OSError("client disconnected")
+    
+    async def receive():
+        return {"type": "http.disconnect"}
+    
+    async def scenario():
+        request = ClaudeRequest(prompt="如何使用Docker?", model="claude-3-opus-20240229")
+        response = await chat_with_claude_stream(request, current_user=test_user)
+        with pytest.raises(ClientDisconnect):
+            await response({"type": "http", "asgi": {"spec_version": "2.4"}}, receive, send)
+        return get_claude_semaphore()
+    
+    semaphore = asyncio.run(scenario())
+    mock_manager.__aexit__.assert_awaited_once()
+    assert semaphore._value == CLAUDE_MAX_CONCURRENCY
+
+# 测试temperature为0的相同请求命中响应缓存
+@patch('app_modules.claude.ANTHROPIC_API_KEY', "test-key")
+@patch('app_modules.claude.get_anthropic_client')
+@patch('app_modules.claude.get_docker_context')
+def test_chat_with_claude_response_cache(mock_get_docker_context, mock_get_anthropic_client, authorized_client):
+    mock_get_docker_context.return_value = {
+        "containers": [{"id": "abc123def456", "name": "cache-test", "image": "nginx:latest", "status": "running"}],
+        "images": []
+    }
+    mock_client = MagicMock()
+    mock_client.messages.create = AsyncMock(return_value=MagicMock(
+        content=[MagicMock(type="text", text="正在运行的容器: cache-test")],
+        stop_reason="end_turn",
+        model="claude-3-opus-20240229"
+    ))
+    mock_get_anthropic_client.return_value = mock_client
+    request = {"prompt": "显示所有正在运行的容器", "temperature": 0}
+    
+    first = authorized_client.post("/api/claude/chat", json=request)
+    second = authorized_client.post("/api/claude/chat", json=request)
+    assert first.headers["X-Cache"] == "MISS"
+    assert second.headers["X-Cache"] == "HIT"
+    assert second.json()["completion"] == first.json()["completion"]
+    assert mock_client.messages.create.await_count == 1
+    
+    # 环境变化后不再命中
+    mock_get_docker_context.return_value["containers"][0]["status"] = "exited"
+    third = authorized_client.post("/api/claude/chat", json=request)
+    assert third.headers["X-Cache"] == "MISS"
+    
+    # 非确定性请求不使用缓存
+    fourth = authorized_client.post("/api/claude/chat", json={"prompt": "显示所有正在运行的容器"})
+    assert fourth.headers["X-Cache"] == "BYPASS"
+
+# 测试异步请求结果可以轮询查询
+@patch('app_modules.claude.ANTHROPIC_API_KEY', "test-key")
+@patch('app_modules.claude.get_anthropic_client')
+@patch('app_modules.claude.get_docker_context')
+def test_chat_with_claude_async_result(mock_get_docker_context, mock_get_anthropic_client, authorized_client):
+    mock_get_docker_context.return_value = {"containers": [], "images": []}
+    mock_client = MagicMock()
+    mock_client.messages.create = AsyncMock(return_value=MagicMock(
+        content=[MagicMock(type="text", text="异步回复")],
+        stop_reason="end_turn",
+        model="claude-3-opus-20240229"
+    ))
+    mock_get_anthropic_client.return_value = mock_client
+    
+    response = authorized_client.post("/api/claude/chat/async", json={"prompt": "如何使用Docker?"})
+    assert response.status_code == 200
+    request_id = response.json()["request_id"]
+    
+    # 后台任务在响应发送后执行完毕
+    response = authorized_client.get(f"/api/claude/chat/async/{request_id}")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["status"] == "succeeded"
+    assert data["progress"] == "completed"
+    assert data["result"]["completion"] == "异步回复"
+
+# 测试查询不存在的异步请求
+def test_get_chat_async_result_not_found(authorized_client):
+    response = authorized_client.get("/api/claude/chat/async/unknown")
+    assert response.status_code == 404
+
+# 测试会话中第二轮只发送环境变化并带上历史消息
+@patch('app_modules.claude.ANTHROPIC_API_KEY', "test-key")
+@patch('app_modules.claude.get_anthropic_client')
+@patch('app_modules.claude.get_docker_context')
+def test_chat_in_session(mock_get_docker_context, mock_get_anthropic_client, authorized_client):
+    mock_get_docker_context.return_value = {
+        "containers": [{"id": "abc123def456", "name": "web", "image": "nginx:latest", "status": "running"}],
+        "images": []
+    }
+    mock_client = MagicMock()
+    mock_client.messages.create = AsyncMock(return_value=MagicMock(
+        content=[MagicMock(type="text", text="web容器正在运行")],
+        stop_reason="end_turn",
+        model="claude-3-opus-20240229"
+    ))
+    mock_get_anthropic_client.return_value = mock_client
+    
+    session_id = authorized_client.post("/api/claude/sessions").json()["id"]
+    first = authorized_client.post(f"/api/claude/sessions/{session_id}/chat", json={"prompt": "web状态?"})
+    assert first.status_code == 200
+    assert first.json()["context_mode"] == "full"
+    
+    mock_get_docker_context.return_value = {
+        "containers": [{"id": "abc123def456", "name": "web", "image": "nginx:latest", "status": "exited"}],
+        "images": []
+    }
+    second = authorized_client.post(f"/api/claude/sessions/{session_id}/chat", json={"prompt": "现在呢?"})
+    assert second.json()["context_mode"] == "diff"
+    assert second.json()["turn"] == 2
+    
+    messages = mock_client.messages.create.call_args.kwargs["messages"]
+    assert len(messages) == 3
+    assert "status: running -> exited" in messages[-1]["content"]
+    
+    session = authorized_client.get(f"/api/claude/sessions/{session_id}").json()
+    assert session["turns"] == 2
+    assert len(session["messages"]) == 4
+    
+    assert authorized_client.delete(f"/api/claude/sessions/{session_id}").status_code == 204
+    assert authorized_client.get(f"/api/claude/sessions/{session_id}").status_code == 404
+
+# 测试批量请求在遇到限流后重试并返回每项结果
+@patch('app_modules.claude.ANTHROPIC_API_KEY', "test-key")
+@patch('app_modules.claude.create_claude_message_with_headers')
+@patch('app_modules.claude.get_docker_context')
+def test_chat_with_claude_batch(mock_get_docker_context, mock_create, authorized_client):
+    import anthropic
+    mock_get_docker_context.return_value = {"containers": [], "images": []}
+    message = MagicMock(
+        content=[MagicMock(type="text", text="审计完成")],
+        stop_reason="end_turn",
+        model="claude-3-opus-20240229"
+    )
+    rate_limited = anthropic.RateLimitError(
+        "rate limited", response=MagicMock(status_code=429, headers={"retry-after": "0"}), body=None
+    )
+    mock_create.side_effect = [rate_limited, (message, {}), (message, {})]
+    
+    response = authorized_client.post("/api/claude/batch", json={
+        "requests": [{"prompt": "审计堆栈A"}, {"prompt": "审计堆栈B"}],
+        "max_concurrency": 1
+    })
+    
+    assert response.status_code == 200
+    data = response.json()
+    assert data["succeeded"] == 2
+    assert data["failed"] == 0
+    assert [item["index"] for item in data["results"]] == [0, 1]
+    assert data["results"][0]["attempts"] == 2
+    assert data["results"][1]["response"]["completion"] == "审计完成"
+
+# 测试批量请求中一项构造参数失败时只记为该项失败，其他项正常完成
+@patch('app_modules.claude.ANTHROPIC_API_KEY', "test-key")
+@patch('app_modules.claude.create_claude_message_with_headers')
+@patch('app_modules.claude.get_docker_context')
+def test_chat_with_claude_batch_item_error(mock_get_docker_context, mock_create, authorized_client):
+    from fastapi import HTTPException
+    from app_modules import claude
+    mock_get_docker_context.return_value = {"containers": [], "images": []}
+    message = MagicMock(content=[MagicMock(type="text", text="审计完成")], stop_reason="end_turn",
+                        model="claude-3-opus-20240229")
+    mock_create.return_value = (message, {})
+    build_message_params = claude.build_message_params
+    
+    def build_params(request, context, username):
+        if request.prompt == "bad":
+            raise HTTPException(status_code=400, detail="参数错误")
+        return build_message_params(request, context, username)
+    
+    with patch('app_modules.claude.build_message_params', side_effect=build_params):
+        response = authorized_client.post("/api/claude/batch", json={
+            "requests": [{"prompt": "bad"}, {"prompt": "审计堆栈B"}]
+        })
+    
+    assert response.status_code == 200
+    data = response.json()
+    assert data["succeeded"] == 1
+    assert data["results"][0]["status"] == "failed"
+    assert data["results"][0]["error"] == "参数错误"
+    assert data["results"][0]["attempts"] == 0
+    assert data["results"][1]["status"] == "succeeded"
+    assert claude.claude_batch_scheduler.stats()["active"] == 0
+
+# 测试批量请求的一项在调用Claude期间被取消时归还调度器的并发名额
+@patch('app_modules.claude.create_claude_message_with_headers')
+def test_run_batch_item_cancelled_releases_slot(mock_create, test_user):
+    from app_modules import claude
+    started = asyncio.Event()
+    
+    async def create(params):
+        started.set()
+        await asyncio.sleep(60)
+    mock_create.side_effect = create
+    
+    async def scenario():
+        request = ClaudeRequest(prompt="审计堆栈A", model="claude-3-opus-20240229")
+        task = asyncio.ensure_future(claude.run_batch_item(0, request, {"containers": [], "images": []},
+                                                           test_user, asyncio.Semaphore(1)))
+        await started.wait()
+        assert claude.claude_batch_scheduler.stats()["active"] == 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    
+    asyncio.run(scenario())
+    assert claude.claude_batch_scheduler.stats()["active"] == 0
+
+# 测试批量请求条目数限制
+@patch('app_modules.claude.ANTHROPIC_API_KEY', "test-key")
+def test_chat_with_claude_batch_empty(authorized_client):
+    response = authorized_client.post("/api/claude/batch", json={"requests": []})
+    assert response.status_code == 400
+
+# 测试按提示词自动选择模型，并支持指定路由
+@patch('app_modules.claude.ANTHROPIC_API_KEY', "test-key")
+@patch('app_modules.claude.get_anthropic_client')
+@patch('app_modules.claude.get_docker_context')
+def test_chat_with_claude_routing(mock_get_docker_context, mock_get_anthropic_client, authorized_client):
+    from app_modules.routing import ROUTE_MODELS
+    mock_get_docker_context.return_value = {"containers": [], "images": []}
+    mock_client = MagicMock()
+    mock_client.messages.create = AsyncMock(return_value=MagicMock(
+        content=[MagicMock(type="text", text="回复")],
+        stop_reason="end_turn",
+        model=ROUTE_MODELS["fast"]
+    ))
+    mock_get_anthropic_client.return_value = mock_client
+    
+    response = authorized_client.post("/api/claude/chat", json={"prompt": "列出所有容器"})
+    assert response.status_code == 200
+    assert response.json()["route"] == "fast"
+    assert mock_client.messages.create.call_args.kwargs["model"] == ROUTE_MODELS["fast"]
+    
+    authorized_client.post("/api/claude/chat", json={"prompt": "列出所有容器", "route": "quality"})
+    assert mock_client.messages.create.call_args.kwargs["model"] == ROUTE_MODELS["quality"]
+    
+    response = authorized_client.post("/api/claude/chat", json={"prompt": "列出所有容器", "route": "cheap"})
+    assert response.status_code == 422
@@ -1,59 +1,136 @@
 import pytest
-from unittest.mock import MagicMock, patch
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
 import os
 import tempfile
+import time
 from fastapi.testclient import TestClient
 from app import app
+from app_modules.registry import ProjectBusyError, ProjectRegistry
+
+# 使用临时目录作为Compose项目注册表
+@pytest.fixture(autouse=True)
+def registry(tmp_path, monkeypatch):
+    test_registry = ProjectRegistry(str(tmp_path / "compose"))
+    monkeypatch.setattr('app_modules.compose.project_registry', test_registry)
+    return test_registry
+
+# 模拟asyncio子进程
+def fake_subprocess(stdout=b"", stderr=b"", returncode=0):
+    async def create_subprocess_exec(*args, **kwargs):
+        process = MagicMock()
+        process.stdout = asyncio.StreamReader()
+        process.stdout.feed_data(stdout)
+        process.stdout.feed_eof()
+        process.stderr = asyncio.StreamReader()
+        process.stderr.feed_data(stderr)
+        process.stderr.feed_eof()
+        process.returncode = returncode
+        process.wait = AsyncMock(return_value=returncode)
+        return process
+    return MagicMock(side_effect=create_subprocess_exec)
 
 # 测试部署Compose堆栈
-@patch('os.system')
-@patch('tempfile.NamedTemporaryFile')
-def test_compose_up(mock_temp_file, mock_system, authorized_client):
-    # 模拟临时文件
-    mock_file = MagicMock()
-    mock_file.name = "/tmp/test_compose_12345.yml"
-    mock_temp_file.return_value.__enter__.return_value = mock_file
+@patch('asyncio.create_subprocess_exec')
+def test_compose_up(mock_exec, authorized_client, registry):
+    # 模拟docker-compose执行成功
+    mock_exec.side_effect = fake_subprocess(stdout=b"Creating web ... done\n").side_effect
+    content = "version: '3'\nservices:\n  web:\n    image: nginx\n    ports:\n      - '80:80'"
     
-    # 模拟系统命令执行成功
-    mock_system.return_value = 0
+    # 发送请求（等待任务完成）
+    response = authorized_client.post("/api/compose/up?wait=true", json={"content": content})
+    
+    # 验证响应
+    assert response.status_code == 200
+    data = response.json()
+    assert data["status"] == "success"
+    assert "已成功部署" in data["message"]
+    
+    # 验证compose文件保存到注册表
+    project_name = data["project_name"]
+    record = registry.get(project_name)
+    assert record["owner"] == "testuser"
+    assert record["last_status"] == "succeeded"
+    assert registry.read_compose_file(project_name) == content
+    
+    # 验证子进程调用
+    mock_exec.assert_called_once()
+    args = mock_exec.call_args[0]
+    assert args[args.index("-f") + 1] == record["compose_file"]
+    assert args[args.index("-p") + 1] == project_name
+    assert "up" in args and "-d" in args
+    
+    # 验证任务输出可查询
+    job = authorized_client.get(f"/api/compose/jobs/{data['job_id']}").json()
+    assert job["status"] == "succeeded"
+    assert job["output"] == [{"stream": "stdout", "line": "Creating web ... done"}]
+
+# 测试提交部署任务后立即返回任务ID
+@patch('asyncio.create_subprocess_exec')
+def test_compose_up_returns_job(mock_exec, authorized_client):
+    mock_exec.side_effect = fake_subprocess().side_effect
     
-    # 发送请求
     response = authorized_client.post(
         "/api/compose/up",
-        json={
-            "content": "version: '3'\nservices:\n  web:\n    image: nginx\n    ports:\n      - '80:80'"
-        }
+        json={"content": "services:\n  web:\n    image: nginx"}
     )
     
-    # 验证响应
     assert response.status_code == 200
     data = response.json()
-    assert data["status"] == "success"
-    assert "已成功部署" in data["message"]
+    assert data["status"] == "accepted"
+    assert data["job_id"]
+    assert data["project_name"].startswith("mcp_")
+
+# 测试项目名称：同样内容得到同样的项目，用户指定和compose文件中的name优先
+@patch('asyncio.create_subprocess_exec')
+def test_compose_project_identity(mock_exec, authorized_client):
+    mock_exec.side_effect = fake_subprocess().side_effect
+    content = "services:\n  web:\n    image: nginx"
+    
+    first = authorized_client.post("/api/compose/up?wait=true", json={"content": content}).json()
+    down = authorized_client.post("/api/compose/down?wait=true", json={"content": content}).json()
+    assert down["project_name"] == first["project_name"]
+    
+    named = authorized_client.post("/api/compose/up?wait=true", json={"content": "name: shop\n" + content}).json()
+    assert named["project_name"] == "shop"
     
-    # 验证临时文件写入
-    mock_file.write.assert_called_once()
+    custom = authorized_client.post("/api/compose/up?wait=true", json={"content": content, "project_name": "blog"}).json()
+    assert custom["project_name"] == "blog"
     
-    # 验证系统命令调用
-    mock_system.assert_called_once()
-    assert "docker-compose" in mock_system.call_args[0][0]
-    assert "up -d" in mock_system.call_args[0][0]
+    invalid = authorized_client.post("/api/compose/up", json={"content": content, "project_name": "Bad Name"})
+    assert invalid.status_code == 400
 
-# 测试停止Compose堆栈
-@patch('os.system')
-@patch('tempfile.NamedTemporaryFile')
-def test_compose_down(mock_temp_file, mock_system, authorized_client):
-    # 模拟临时文件
-    mock_file = MagicMock()
-    mock_file.name = "/tmp/test_compose_12345.yml"
-    mock_temp_file.return_value.__enter__.return_value = mock_file
+# 测试内容未变化且服务都在运行时跳过部署
+@patch('app_modules.compose.client')
+@patch('asyncio.create_subprocess_exec')
+def test_compose_up_unchanged(mock_exec, mock_client, authorized_client):
+    mock_exec.side_effect = fake_subprocess().side_effect
+    content = "name: shop\nservices:\n  web:\n    image: nginx"
+    mock_client.api.containers.return_value = [
+        {'Id': 'web-1', 'Names': ['/shop-web-1'], 'State': 'running',
+         'Labels': {'com.docker.compose.project': 'shop', 'com.docker.compose.service': 'web'}}
+    ]
     
-    # 模拟系统命令执行成功
-    mock_system.return_value = 0
+    first = authorized_client.post("/api/compose/up?wait=true", json={"content": content}).json()
+    assert first["status"] == "success"
     
-    # 发送请求
+    second = authorized_client.post("/api/compose/up?wait=true", json={"content": content}).json()
+    assert second["status"] == "unchanged"
+    assert mock_exec.call_count == 1
+    
+    forced = authorized_client.post("/api/compose/up?wait=true&force=true", json={"content": content}).json()
+    assert forced["status"] == "success"
+    assert mock_exec.call_count == 2
+
+# 测试停止Compose堆栈
+@patch('asyncio.create_subprocess_exec')
+def test_compose_down(mock_exec, authorized_client):
+    # 模拟docker-compose执行成功
+    mock_exec.side_effect = fake_subprocess().side_effect
+    
+    # 发送请求（等待任务完成）
     response = authorized_client.post(
-        "/api/compose/down",
+        "/api/compose/down?wait=true",
         json={
             "content": "version: '3'\nservices:\n  web:\n    image: nginx\n    ports:\n      - '80:80'"
         }
@@ -65,13 +142,89 @@ def test_compose_down(mock_temp_file, mock_system, authorized_client):
     assert data["status"] == "success"
     assert "已成功停止" in data["message"]
     
-    # 验证临时文件写入
-    mock_file.write.assert_called_once()
+    # 验证子进程调用
+    mock_exec.assert_called_once()
+    assert mock_exec.call_args[0][-1] == "down"
+
+# 测试按项目名称查询状态和停止（无需重新上传compose文件）
+@patch('app_modules.compose.client')
+@patch('asyncio.create_subprocess_exec')
+def test_compose_project_by_name(mock_exec, mock_client, authorized_client):
+    mock_exec.side_effect = fake_subprocess().side_effect
+    mock_client.api.containers.return_value = []
+    authorized_client.post("/api/compose/up?wait=true", json={"content": "name: shop\nservices:\n  web:\n    image: nginx"})
+    
+    projects = authorized_client.get("/api/compose/projects").json()
+    assert [p["project_name"] for p in projects] == ["shop"]
+    
+    project_status = authorized_client.get("/api/compose/projects/shop/status").json()
+    assert project_status["services"]["web"]["status"] == "not_created"
+    
+    response = authorized_client.post("/api/compose/projects/shop/down?wait=true")
+    assert response.status_code == 200
+    assert mock_exec.call_args[0][-1] == "down"
+    
+    assert authorized_client.get("/api/compose/projects/missing/status").status_code == 404
+
+# 测试项目占用：上一个任务未结束时不能占用，结束状态不覆盖之后任务的占用
+def test_registry_claim(registry):
+    registry.claim("shop", "job1", "alice", last_action="up")
+    with pytest.raises(ProjectBusyError):
+        registry.claim("shop", "job2", "alice", last_action="up")
+    with pytest.raises(PermissionError):
+        registry.claim("shop", "job2", "bob", finished_job_id="job1")
+    
+    # 调用方确认job1已结束（状态还未写回）时可以占用
+    registry.claim("shop", "job2", "alice", finished_job_id="job1", last_action="down")
+    registry.finish("shop", "job1", "succeeded")
+    record = registry.get("shop")
+    assert record["last_job_id"] == "job2"
+    assert record["last_status"] == "queued"
+    assert record["last_action"] == "down"
     
-    # 验证系统命令调用
-    mock_system.assert_called_once()
-    assert "docker-compose" in mock_system.call_args[0][0]
-    assert "down" in mock_system.call_args[0][0]
+    registry.finish("shop", "job2", "succeeded")
+    registry.claim("shop", "job3", "alice")
+    assert registry.get("shop")["last_job_id"] == "job3"
+
+# 测试同一项目的任务未结束时再次部署返回409，且不覆盖正在使用的compose文件
+@patch('asyncio.create_subprocess_exec')
+def test_compose_up_conflict(mock_exec, authorized_client, registry):
+    async def create_subprocess_exec(*args, **kwargs):
+        process = await fake_subprocess().side_effect(*args, **kwargs)
+        
+        async def wait():
+            await asyncio.sleep(0.3)
+            return 0
+        process.wait = wait
+        return process
+    mock_exec.side_effect = create_subprocess_exec
+    content = "name: shop\nservices:\n  web:\n    image: nginx"
+    
+    # 在同一个事件循环中发送请求，后台任务在请求之间继续运行
+    with authorized_client:
+        first = authorized_client.post("/api/compose/up", json={"content": content})
+        assert first.status_code == 200
+        second = authorized_client.post("/api/compose/up", json={"content": content + "\n  db:\n    image: postgres"})
+        assert second.status_code == 409
+        assert registry.read_compose_file("shop") == content
+        
+        time.sleep(0.5)
+        assert registry.get("shop")["last_status"] == "succeeded"
+        third = authorized_client.post("/api/compose/down?wait=true", json={"content": content})
+        assert third.status_code == 200
+
+# 测试部署失败
+@patch('asyncio.create_subprocess_exec')
+def test_compose_up_failure(mock_exec, authorized_client):
+    mock_exec.side_effect = fake_subprocess(stderr=b"no such image\n", returncode=1).side_effect
+    
+    response = authorized_client.post(
+        "/api/compose/up?wait=true",
+        json={"content": "services:\n  web:\n    image: nginx"}
+    )
+    
+    assert response.status_code == 500
+    assert response.json()["detail"] == "部署Compose堆栈失败"
 
 # 测试获取Compose堆栈状态
 @patch('app_modules.compose.client')
@@ -91,25 +244,20 @@ def test_compose_status(mock_temp_file, mock_yaml_load, mock_client, authorized_
         }
     }
     
-    # 模拟容器
-    mock_web_container = MagicMock()
-    mock_web_container.id = "web-container-id"
-    mock_web_container.name = "web"
-    mock_web_container.status = "running"
-    
-    mock_db_container = MagicMock()
-    mock_db_container.id = "db-container-id"
-    mock_db_container.name = "db"
-    mock_db_container.status = "exited"
-    
-    # 设置模拟客户端返回值
-    mock_client.containers.list.return_value = [mock_web_container, mock_db_container]
+    # 模拟容器摘要
+    mock_client.api.containers.return_value = [
+        {'Id': 'web-container-id', 'Names': ['/demo-web-1'], 'State': 'running',
+         'Labels': {'com.docker.compose.project': 'demo', 'com.docker.compose.service': 'web'}},
+        {'Id': 'db-container-id', 'Names': ['/demo-db-1'], 'State': 'exited',
+         'Labels': {'com.docker.compose.project': 'demo', 'com.docker.compose.service': 'db'}}
+    ]
     
     # 发送请求
     response = authorized_client.post(
         "/api/compose/status",
         json={
-            "content": "version: '3'\nservices:\n  web:\n    image: nginx\n  db:\n    image: postgres"
+            "content": "version: '3'\nservices:\n  web:\n    image: nginx\n  db:\n    image: postgres",
+            "project_name": "demo"
         }
     )
     
@@ -118,4 +266,59 @@ def test_compose_status(mock_temp_file, mock_yaml_load, mock_client, authorized_
     data = response.json()
     assert "services" in data
     assert "is_running" in data
-    assert data["is_running"] == False  # 因为db容器状态为exited
\ No newline at end of file
+    assert data["is_running"] == False  # 因为db容器状态为exited
+    assert data["services"]["web"]["id"] == "web-container-id"
+    assert data["services"]["web"]["running"] == True
+
+# 测试无法确定项目时不合并其他项目中的同名服务
+@patch('app_modules.compose.project_registry')
+@patch('app_modules.compose.client')
+def test_compose_status_unknown_project(mock_client, mock_registry, authorized_client):
+    mock_registry.get.return_value = None
+    mock_client.api.containers.return_value = [
+        {'Id': 'other-web', 'Names': ['/other-web-1'], 'State': 'running',
+         'Labels': {'com.docker.compose.project': 'other', 'com.docker.compose.service': 'web'}}
+    ]
+    
+    response = authorized_client.post("/api/compose/status", json={"content": "services:\n  web:\n    image: nginx"})
+    
+    assert response.status_code == 200
+    data = response.json()
+    assert data["services"]["web"]["status"] == "not_created"
+    assert data["is_running"] == False
+    mock_client.api.containers.assert_not_called()
+
+# 测试按项目标签过滤并列出所有副本（服务名重叠时不误匹配）
+@patch('app_modules.compose.client')
+def test_compose_status_replicas(mock_client, authorized_client):
+    def labels(service, number):
+        return {
+            'com.docker.compose.project': 'shop',
+            'com.docker.compose.service': service,
+            'com.docker.compose.container-number': str(number)
+        }
+    
+    mock_client.api.containers.return_value = [
+        {'Id': 'web-2', 'Names': ['/shop-web-2'], 'State': 'exited', 'Labels': labels('web', 2)},
+        {'Id': 'web-1', 'Names': ['/shop-web-1'], 'State': 'running', 'Labels': labels('web', 1)},
+        {'Id': 'hook-1', 'Names': ['/shop-webhook-1'], 'State': 'running', 'Labels': labels('webhook', 1)}
+    ]
+    
+    response = authorized_client.post(
+        "/api/compose/status",
+        json={"content": "name: shop\nservices:\n  web:\n    image: nginx\n  webhook:\n    image: hook"}
+    )
+    
+    assert response.status_code == 200
+    data = response.json()
+    web = data["services"]["web"]
+    assert [replica["id"] for replica in web["replicas"]] == ["web-1", "web-2"]
+    assert web["status"] == "exited"
+    assert web["running"] == False
+    assert data["services"]["webhook"]["running"] == True
+    assert data["is_running"] == False
+    
+    # 验证使用服务端标签过滤的单次查询
+    mock_client.api.containers.assert_called_once_with(
+        all=True, filters={"label": "com.docker.compose.project=shop"}
+    )
@@ -1,8 +1,13 @@
 import pytest
+import io
+import asyncio
+import json
+import struct
 from unittest.mock import MagicMock, patch
 from fastapi.testclient import TestClient
+from starlette.requests import ClientDisconnect
 from app import app
-from app_modules.containers import convert_container
+from app_modules.containers import convert_container, stream_container_logs
 from datetime import datetime
 
 # 测试获取容器列表
@@ -25,7 +30,7 @@ def test_list_containers(mock_client, authorized_client):
     mock_client.containers.list.return_value = [mock_container]
     
     # 发送请求
-    response = authorized_client.get("/api/containers/")
+    response = authorized_client.get("/api/containers/?detail=full")
     
     # 验证响应
     assert response.status_code == 200
@@ -36,6 +41,215 @@ def test_list_containers(mock_client, authorized_client):
     assert containers[0]["image"] == "test-image:latest"
     assert containers[0]["status"] == "running"
 
+# 测试基于摘要的容器列表（不触发逐个inspect）
+@patch('app_modules.containers.client')
+def test_list_containers_summary(mock_client, authorized_client):
+    # 模拟/containers/json和/images/json返回值
+    mock_client.api.containers.return_value = [
+        {
+            'Id': 'test-container-id',
+            'Names': ['/test-container'],
+            'Image': 'test-image',
+            'ImageID': 'sha256:abc',
+            'State': 'running',
+            'Created': 1700000000,
+            'Ports': [
+                {'IP': '0.0.0.0', 'PrivatePort': 80, 'PublicPort': 8080, 'Type': 'tcp'},
+                {'PrivatePort': 443, 'Type': 'tcp'}
+            ],
+            'Mounts': [{'Source': '/host/path', 'Destination': '/container/path', 'Type': 'bind'}]
+        },
+        {
+            'Id': 'untagged-container-id',
+            'Names': ['/untagged'],
+            'ImageID': 'sha256:def',
+            'State': 'exited',
+            'Created': 1700000000,
+            'Ports': [],
+            'Mounts': []
+        }
+    ]
+    mock_client.api.images.return_value = [
+        {'Id': 'sha256:abc', 'RepoTags': ['test-image:latest']},
+        {'Id': 'sha256:def', 'RepoTags': ['<none>:<none>']}
+    ]
+    
+    # 发送请求
+    response = authorized_client.get("/api/containers/")
+    
+    # 验证响应
+    assert response.status_code == 200
+    containers = response.json()
+    assert len(containers) == 2
+    assert containers[0]["name"] == "test-container"
+    assert containers[0]["image"] == "test-image:latest"
+    assert containers[0]["ports"] == {"80/tcp": [{"HostIp": "0.0.0.0", "HostPort": "8080"}]}
+    assert containers[0]["volumes"][0]["target"] == "/container/path"
+    assert containers[0]["environment"] is None
+    assert containers[1]["image"] == "sha256:def"
+    
+    # 验证镜像列表只获取一次，且未逐个inspect
+    mock_client.api.images.assert_called_once()
+    mock_client.containers.list.assert_not_called()
+    mock_client.containers.get.assert_not_called()
+
+# 构造容器摘要
+def make_summary(container_id, name, state, created, labels=None):
+    return {
+        'Id': container_id,
+        'Names': [f'/{name}'],
+        'ImageID': 'sha256:abc',
+        'State': state,
+        'Created': created,
+        'Labels': labels or {},
+        'Ports': [],
+        'Mounts': []
+    }
+
+# 测试状态和标签过滤交给Docker处理，名称前缀在本地过滤
+@patch('app_modules.containers.client')
+def test_list_containers_filters(mock_client, authorized_client):
+    mock_client.api.containers.return_value = [
+        make_summary('id-1', 'web-1', 'running', 1700000000),
+        make_summary('id-2', 'db-1', 'running', 1700000001)
+    ]
+    mock_client.api.images.return_value = [{'Id': 'sha256:abc', 'RepoTags': ['test-image:latest']}]
+
+    response = authorized_client.get("/api/containers/?status=running&label=app=demo&label=tier&name=web")
+
+    assert response.status_code == 200
+    assert [c["name"] for c in response.json()] == ["web-1"]
+    mock_client.api.containers.assert_called_once_with(
+        all=True, filters={"status": ["running"], "label": ["app=demo", "tier"]}
+    )
+
+# 测试状态缓存可用时在缓存的摘要上过滤，不查询Docker
+@patch('app_modules.containers.state_cache')
+@patch('app_modules.containers.client')
+def test_list_containers_filters_cached(mock_client, mock_state_cache, authorized_client):
+    mock_state_cache.is_fresh.return_value = True
+    mock_state_cache.list_images.return_value = []
+    mock_state_cache.list_containers.return_value = [
+        make_summary('id-1', 'web-1', 'running', 1700000000, {'app': 'demo'}),
+        make_summary('id-2', 'web-2', 'exited', 1700000001, {'app': 'demo'}),
+        make_summary('id-3', 'web-3', 'running', 1700000002, {'app': 'other'})
+    ]
+
+    response = authorized_client.get("/api/containers/?status=running&label=app=demo")
+
+    assert [c["id"] for c in response.json()] == ["id-1"]
+    mock_client.api.containers.assert_not_called()
+
+# 测试按字段排序和游标分页
+@patch('app_modules.containers.client')
+def test_list_containers_pagination(mock_client, authorized_client):
+    mock_client.api.containers.return_value = [
+        make_summary(f'id-{i}', f'app-{i}', 'running', 1700000000 + i) for i in range(5)
+    ]
+    mock_client.api.images.return_value = []
+
+    names = []
+    cursor = None
+    for _ in range(3):
+        url = "/api/containers/?sort=name&limit=2" + (f"&cursor={cursor}" if cursor else "")
+        response = authorized_client.get(url)
+        assert response.status_code == 200
+        assert response.headers["X-Total-Count"] == "5"
+        names.extend(c["name"] for c in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+    assert names == [f"app-{i}" for i in range(5)]
+    assert cursor is None
+
+    # 默认按创建时间降序
+    response = authorized_client.get("/api/containers/?limit=1")
+    assert [c["name"] for c in response.json()] == ["app-4"]
+
+# 测试无效的过滤和分页参数
+def test_list_containers_invalid_params(authorized_client):
+    assert authorized_client.get("/api/containers/?status=sleeping").status_code == 400
+    assert authorized_client.get("/api/containers/?sort=size").status_code == 400
+    assert authorized_client.get("/api/containers/?limit=0").status_code == 400
+    assert authorized_client.get("/api/containers/?label==web").status_code == 400
+
+# 测试无效或与排序不匹配的游标
+@patch('app_modules.containers.client')
+def test_list_containers_invalid_cursor(mock_client, authorized_client):
+    from app_modules.containers import encode_cursor
+    mock_client.api.containers.return_value = []
+    mock_client.api.images.return_value = []
+    assert authorized_client.get("/api/containers/?limit=2&cursor=not-a-cursor").status_code == 400
+    cursor = encode_cursor("name", ("app-1", "id-1"))
+    assert authorized_client.get(f"/api/containers/?sort=-created&cursor={cursor}").status_code == 400
+
+# 测试fields参数只返回请求的字段，不需要镜像时不查询镜像列表，不需要环境变量时不逐个inspect
+@patch('app_modules.containers.client')
+def test_list_containers_fields(mock_client, authorized_client):
+    mock_client.api.containers.return_value = [
+        make_summary('id-1', 'web-1', 'running', 1700000000),
+        make_summary('id-2', 'web-2', 'exited', 1700000001)
+    ]
+
+    response = authorized_client.get("/api/containers/?detail=full&fields=name,status&sort=-created&limit=1")
+
+    assert response.status_code == 200
+    assert response.json() == [{"id": "id-2", "name": "web-2", "status": "exited"}]
+    assert response.headers["X-Total-Count"] == "2"
+    mock_client.api.images.assert_not_called()
+    mock_client.containers.list.assert_not_called()
+
+# 测试单个容器的fields参数：状态缓存可用时不调用inspect
+@patch('app_modules.containers.state_cache')
+@patch('app_modules.containers.client')
+def test_get_container_fields(mock_client, mock_state_cache, authorized_client):
+    mock_state_cache.is_fresh.return_value = True
+    mock_state_cache.find_container.return_value = make_summary('id-1', 'web-1', 'running', 1700000000)
+
+    response = authorized_client.get("/api/containers/web-1?fields=status")
+
+    assert response.status_code == 200
+    assert response.json() == {"id": "id-1", "status": "running"}
+    mock_client.containers.get.assert_not_called()
+
+    mock_state_cache.find_container.return_value = None
+    assert authorized_client.get("/api/containers/missing?fields=status").status_code == 404
+
+# 测试状态缓存不可用时按ID或名称查询容器摘要，仍然不调用inspect
+@patch('app_modules.containers.state_cache')
+@patch('app_modules.containers.client')
+def test_get_container_fields_without_cache(mock_client, mock_state_cache, authorized_client):
+    mock_state_cache.is_fresh.return_value = False
+    summary = make_summary('id-1', 'web-1', 'running', 1700000000)
+    mock_client.api.containers.side_effect = lambda all, filters: [summary] if "name" in filters else []
+    mock_client.api.inspect_image.return_value = {'Id': 'sha256:abc', 'RepoTags': ['test-image:latest']}
+
+    response = authorized_client.get("/api/containers/web-1?fields=status,image")
+
+    assert response.status_code == 200
+    assert response.json() == {"id": "id-1", "status": "running", "image": "test-image:latest"}
+    mock_client.containers.get.assert_not_called()
+    mock_client.api.images.assert_not_called()
+    assert authorized_client.get("/api/containers/web?fields=status").status_code == 404
+
+# 测试fields参数在OpenAPI文档中的响应模型：除id外的字段都是可选的
+def test_container_fields_openapi_schema(client):
+    schema = client.get("/openapi.json").json()
+    get_schema = schema["paths"]["/api/containers/{container_id}"]["get"]["responses"]["200"]["content"]["application/json"]["schema"]
+    assert get_schema["$ref"].endswith("/ContainerFields")
+    assert schema["components"]["schemas"]["ContainerFields"]["required"] == ["id"]
+
+# 测试需要环境变量时仍然inspect，未知字段返回400
+@patch('app_modules.containers.client')
+def test_get_container_fields_inspect(mock_client, authorized_client):
+    mock_container = make_mock_container("id-1")
+    mock_container.attrs['Config']['Env'] = ['KEY=VALUE']
+    mock_client.containers.get.return_value = mock_container
+
+    response = authorized_client.get("/api/containers/id-1?fields=environment")
+
+    assert response.status_code == 200
+    assert response.json() == {"id": "id-1", "environment": {"KEY": "VALUE"}}
+    assert authorized_client.get("/api/containers/id-1?fields=size").status_code == 400
+
 # 测试获取单个容器
 @patch('app_modules.containers.client')
 def test_get_container(mock_client, authorized_client):
@@ -103,4 +317,174 @@ def test_create_container(mock_client, authorized_client):
     assert container["id"] == "new-container-id"
     assert container["name"] == "new-container"
     assert container["image"] == "test-image:latest"
-    assert container["status"] == "created"
\ No newline at end of file
+    assert container["status"] == "created"
+
+# 创建指定ID的模拟容器对象
+def make_mock_container(container_id, status="running"):
+    mock_container = MagicMock()
+    mock_container.id = container_id
+    mock_container.name = f"{container_id}-name"
+    mock_container.image.tags = ["test-image:latest"]
+    mock_container.status = status
+    mock_container.attrs = {
+        'Created': datetime.now(),
+        'NetworkSettings': {'Ports': {}},
+        'Mounts': [],
+        'Config': {'Env': []}
+    }
+    return mock_container
+
+# 测试批量停止容器：逐个返回结果，不存在的容器映射为404而不影响其他容器
+@patch('app_modules.containers.client')
+def test_bulk_stop_containers(mock_client, authorized_client):
+    import docker
+    containers = {cid: make_mock_container(cid) for cid in ("c1", "c2")}
+
+    def get(container_id):
+        if container_id not in containers:
+            raise docker.errors.NotFound("missing")
+        return containers[container_id]
+
+    mock_client.containers.get.side_effect = get
+
+    response = authorized_client.post(
+        "/api/containers/bulk",
+        json={"action": "stop", "ids": ["c1", "c2", "missing", "c1"]}
+    )
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["succeeded"] == 2
+    assert data["failed"] == 1
+    results = {item["id"]: item for item in data["results"]}
+    assert len(data["results"]) == 3
+    assert results["c1"]["container"]["id"] == "c1"
+    assert results["missing"]["status_code"] == 404
+    assert results["missing"]["error"] == "容器未找到"
+    containers["c1"].stop.assert_called_once()
+    containers["c2"].stop.assert_called_once()
+
+# 测试批量操作中一个容器出现非Docker API错误（如连接中断）时只记为该项失败
+@patch('app_modules.containers.client')
+def test_bulk_unexpected_error(mock_client, authorized_client):
+    import requests
+    containers = {"c1": make_mock_container("c1"), "c2": make_mock_container("c2")}
+    containers["c2"].restart.side_effect = requests.ConnectionError("connection aborted")
+    mock_client.containers.get.side_effect = lambda container_id: containers[container_id]
+
+    response = authorized_client.post("/api/containers/bulk", json={"action": "restart", "ids": ["c1", "c2"]})
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["succeeded"] == 1
+    results = {item["id"]: item for item in data["results"]}
+    assert results["c1"]["status"] == "succeeded"
+    assert results["c2"]["status_code"] == 500
+    assert "connection aborted" in results["c2"]["error"]
+
+# 测试按标签批量删除容器
+@patch('app_modules.containers.state_cache')
+@patch('app_modules.containers.client')
+def test_bulk_remove_by_labels(mock_client, mock_state_cache, authorized_client):
+    mock_state_cache.is_fresh.return_value = False
+    mock_client.api.containers.return_value = [{"Id": "c1"}, {"Id": "c2"}]
+    containers = {cid: make_mock_container(cid) for cid in ("c1", "c2")}
+    mock_client.containers.get.side_effect = lambda container_id: containers[container_id]
+
+    response = authorized_client.post(
+        "/api/containers/bulk",
+        json={"action": "remove", "labels": {"app": "web"}, "force": True}
+    )
+
+    assert response.status_code == 200
+    assert response.json()["succeeded"] == 2
+    mock_client.api.containers.assert_called_once_with(all=True, filters={"label": ["app=web"]})
+    containers["c2"].remove.assert_called_once_with(force=True)
+
+# 测试批量操作的参数校验
+def test_bulk_invalid_request(authorized_client):
+    response = authorized_client.post("/api/containers/bulk", json={"action": "pause", "ids": ["c1"]})
+    assert response.status_code == 422
+    response = authorized_client.post("/api/containers/bulk", json={"action": "stop"})
+    assert response.status_code == 400
+    response = authorized_client.post(
+        "/api/containers/bulk", json={"action": "stop", "ids": ["c1"], "labels": {"app": "web"}}
+    )
+    assert response.status_code == 400
+
+# 测试重启容器
+@patch('app_modules.containers.client')
+def test_restart_container(mock_client, authorized_client):
+    mock_container = make_mock_container("c1")
+    mock_client.containers.get.return_value = mock_container
+    response = authorized_client.post("/api/containers/c1/restart")
+    assert response.status_code == 200
+    mock_container.restart.assert_called_once()
+
+# 构造docker多路复用日志帧
+def make_frame(stream_id, payload):
+    return struct.pack('>BxxxL', stream_id, len(payload)) + payload
+
+# 测试流式获取容器日志（拆分stdout/stderr，容忍非UTF-8字节）
+@patch('app_modules.containers.client')
+def test_stream_container_logs(mock_client, authorized_client):
+    mock_container = MagicMock()
+    mock_container.id = "test-container-id"
+    mock_container.attrs = {'Config': {'Tty': False}}
+    mock_client.containers.get.return_value = mock_container
+    
+    # 模拟日志接口的原始响应，第二行被拆成两个数据帧，中间插入另一个流的输出
+    mock_response = MagicMock()
+    mock_response.raw = io.BytesIO(
+        make_frame(1, b"2024-01-01T00:00:00Z hello\n2024-01-01T00:00:02Z spl") +
+        make_frame(2, b"2024-01-01T00:00:01Z bad \xff byte\n") +
+        make_frame(1, b"it line\n")
+    )
+    mock_client.api._get.return_value = mock_response
+    
+    # 发送请求
+    response = authorized_client.get("/api/containers/test-container-id/logs/stream?tail=10&since=1700000000&until=0")
+    
+    # 验证响应
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    frames = [json.loads(line) for line in response.text.splitlines()]
+    assert frames[0] == {"stream": "stdout", "timestamp": "2024-01-01T00:00:00Z", "line": "hello"}
+    assert frames[1]["stream"] == "stderr"
+    assert frames[1]["line"] == "bad \ufffd byte"
+    assert frames[2] == {"stream": "stdout", "timestamp": "2024-01-01T00:00:02Z", "line": "split line"}
+    assert len(frames) == 3
+    
+    # 验证请求参数、取消读取超时和连接关闭
+    params = mock_client.api._get.call_args[1]["params"]
+    assert params["tail"] == 10
+    assert params["since"] == 1700000000
+    assert params["until"] == 0
+    assert params["follow"] == 0
+    mock_client.api._disable_socket_timeout.assert_called_once()
+    assert mock_response.close.called
+
+# 测试客户端在第一帧日志之前断开时仍然关闭日志连接
+@patch('app_modules.containers.client')
+def test_stream_container_logs_disconnect_before_first_frame(mock_client, test_user):
+    mock_container = MagicMock()
+    mock_container.id = "test-container-id"
+    mock_container.attrs = {'Config': {'Tty': False}}
+    mock_client.containers.get.return_value = mock_container
+    mock_response = MagicMock()
+    mock_client.api._get.return_value = mock_response
+    
+    # 发送响应头时客户端已经断开
+    async def send(message):
+        raise OSError("client disconnected")
+    
+    async def receive():
+        return {"type": "http.disconnect"}
+    
+    async def scenario():
+        response = await stream_container_logs("test-container-id", follow=True, current_user=test_user)
+        with pytest.raises(ClientDisconnect):
+            await response({"type": "http", "asgi": {"spec_version": "2.4"}}, receive, send)
+    
+    asyncio.run(scenario())
+    mock_response.close.assert_called_once()
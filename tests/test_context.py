@@ -0,0 +1,72 @@
+from app_modules.context import (estimate_tokens, format_docker_context, context_fingerprint, snapshot_covers_prompt,
+                                 ID_PREFIX_PATTERN)
+
+# 构造测试用的Docker环境信息
+def make_context(count):
+    return {
+        "containers": [
+            {
+                "id": f"{i:012x}",
+                "name": f"app-{i}",
+                "image": "busybox:latest",
+                "status": "running" if i % 2 else "exited"
+            } for i in range(count)
+        ] + [
+            {"id": "abcdef123456", "name": "web", "image": "nginx:latest", "status": "exited"}
+        ],
+        "images": [
+            {"id": "img000000001", "tags": ["busybox:latest"], "size": 1},
+            {"id": "img000000002", "tags": ["nginx:latest"], "size": 120}
+        ]
+    }
+
+# 测试输出紧凑的表格格式
+def test_format_docker_context_tabular():
+    text = format_docker_context(make_context(1), "")
+    assert "容器 2/2 (name|id|image|status):" in text
+    assert "web|abcdef123456|nginx:latest|exited" in text
+    assert "nginx:latest|img000000002|120" in text
+    assert "未列出" not in text
+
+# 测试提示词中提到的容器排在最前面
+def test_format_docker_context_ranks_mentioned_first():
+    lines = format_docker_context(make_context(5), "重启web容器").split("\n")
+    assert lines[1].startswith("web|")
+    # 其次是运行中的容器
+    assert lines[2].endswith("|running")
+
+# 测试超出预算时截断并给出汇总
+def test_format_docker_context_budget():
+    context = make_context(500)
+    text = format_docker_context(context, "查看nginx", token_budget=300)
+    assert estimate_tokens(text) <= 300
+    assert "另有" in text
+    assert "web|abcdef123456" in text
+
+# 测试截断的快照不包含新提示词提到的容器时需要重新生成
+def test_snapshot_covers_prompt():
+    context = make_context(500)
+    snapshot = format_docker_context(context, "", token_budget=200)
+    assert snapshot_covers_prompt(snapshot, context, "列出容器")
+    assert not snapshot_covers_prompt(snapshot, context, "重启web容器")
+
+# 测试中文提示词中紧挨着中文的容器ID前缀也能识别，不含数字的英文单词不当作ID
+def test_id_prefix_in_chinese_prompt():
+    context = make_context(500)
+    prompt = "查看容器00000000018f的日志"
+    lines = format_docker_context(context, prompt, token_budget=200).split("\n")
+    assert lines[1] == "app-399|00000000018f|busybox:latest|running"
+    snapshot = format_docker_context(context, "", token_budget=200)
+    assert not snapshot_covers_prompt(snapshot, context, prompt)
+    assert ID_PREFIX_PATTERN.findall("列出dead状态的容器, added cafe") == []
+    assert ID_PREFIX_PATTERN.findall("重启abcdef123456") == ["abcdef123456"]
+
+# 测试环境指纹忽略时间戳
+def test_context_fingerprint_ignores_timestamp():
+    context = make_context(2)
+    assert context_fingerprint({**context, "timestamp": "1"}) == context_fingerprint({**context, "timestamp": "2"})
+    assert context_fingerprint(context) != context_fingerprint(make_context(3))
+
+# 测试Docker不可用时的上下文
+def test_format_docker_context_error():
+    assert "不可用" in format_docker_context({"error": "connection refused"}, "")
@@ -0,0 +1,29 @@
+import pytest
+from unittest.mock import MagicMock, patch
+import app_modules.docker_client as docker_client_module
+from app_modules.docker_client import LazyDockerClient, get_docker_client
+
+# 重置共享客户端
+@pytest.fixture
+def reset_client(monkeypatch):
+    monkeypatch.setattr(docker_client_module, "_client", None)
+
+# 测试共享客户端只创建一次并使用连接池配置
+@patch('docker.from_env')
+def test_get_docker_client_shared(mock_from_env, reset_client):
+    mock_from_env.return_value = MagicMock()
+    first = get_docker_client()
+    second = get_docker_client()
+    assert first is second
+    mock_from_env.assert_called_once()
+    assert mock_from_env.call_args[1]["max_pool_size"] == docker_client_module.DOCKER_MAX_CONNECTIONS
+
+# 测试代理在首次访问时才创建客户端
+@patch('docker.from_env')
+def test_lazy_docker_client(mock_from_env, reset_client):
+    lazy_client = LazyDockerClient()
+    mock_from_env.assert_not_called()
+    assert not hasattr(lazy_client, "_private")
+    mock_from_env.assert_not_called()
+    lazy_client.containers.list(all=True)
+    mock_from_env.return_value.containers.list.assert_called_once_with(all=True)
@@ -0,0 +1,79 @@
+import pytest
+import asyncio
+import time
+from fastapi import HTTPException
+from app_modules.executor import BoundedExecutor
+
+# 测试在线程池中执行同步函数
+def test_executor_run():
+    executor = BoundedExecutor("test", max_workers=2, default_timeout=5)
+    result = asyncio.run(executor.run(lambda x, y: x + y, 1, y=2, operation="add"))
+    assert result == 3
+    stats = executor.stats()
+    assert stats["completed"] == 1
+    assert stats["queued"] == 0
+    assert stats["active"] == 0
+
+# 测试操作超时返回504
+def test_executor_timeout():
+    executor = BoundedExecutor("test", max_workers=1, default_timeout=5, timeouts={"slow": 0.05})
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(executor.run(time.sleep, 0.5, operation="slow"))
+    assert exc_info.value.status_code == 504
+    assert executor.stats()["timeouts"] == 1
+
+# 测试慢操作不阻塞事件循环
+def test_executor_does_not_block_event_loop():
+    executor = BoundedExecutor("test", max_workers=2, default_timeout=5)
+
+    async def scenario():
+        started = time.monotonic()
+        slow = asyncio.ensure_future(executor.run(time.sleep, 0.3, operation="slow"))
+        await asyncio.sleep(0.01)
+        # 慢操作执行期间事件循环仍可处理其他协程
+        elapsed = time.monotonic() - started
+        await slow
+        return elapsed
+
+    assert asyncio.run(scenario()) < 0.2
+
+# 测试排队任务数达到上限时返回503
+def test_executor_rejects_when_queue_full():
+    executor = BoundedExecutor("test", max_workers=1, default_timeout=5, max_queue=1)
+
+    async def scenario():
+        # 第一个任务占用唯一的工作线程，第二个任务排队
+        running = asyncio.ensure_future(executor.run(time.sleep, 0.2, operation="slow"))
+        queued = asyncio.ensure_future(executor.run(time.sleep, 0, operation="slow"))
+        await asyncio.sleep(0.05)
+        with pytest.raises(HTTPException) as exc_info:
+            await executor.run(time.sleep, 0, operation="slow")
+        await asyncio.gather(running, queued)
+        return exc_info.value.status_code
+
+    assert asyncio.run(scenario()) == 503
+    stats = executor.stats()
+    assert stats["rejected"] == 1
+    assert stats["completed"] == 2
+
+# 测试等待的协程被取消时，排队中的任务退出排队计数，不会占满队列
+def test_executor_cancelled_queued_calls():
+    executor = BoundedExecutor("test", max_workers=1, default_timeout=5, max_queue=3)
+
+    async def scenario():
+        running = asyncio.ensure_future(executor.run(time.sleep, 0.2, operation="slow"))
+        queued = [asyncio.ensure_future(executor.run(time.sleep, 0, operation="slow")) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        for task in queued:
+            task.cancel()
+        await asyncio.gather(*queued, return_exceptions=True)
+        assert executor.stats()["queued"] == 0
+        # 取消后队列重新可用
+        await asyncio.gather(*(executor.run(time.sleep, 0, operation="slow") for _ in range(3)))
+        await running
+
+    asyncio.run(scenario())
+    stats = executor.stats()
+    assert stats["queued"] == 0
+    assert stats["rejected"] == 0
+    assert stats["completed"] == 4
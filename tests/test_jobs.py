@@ -0,0 +1,99 @@
+import pytest
+import asyncio
+import sys
+from app_modules.jobs import JobRunner
+
+# 测试任务逐行收集stdout/stderr输出
+def test_job_runner_collects_output():
+    runner = JobRunner(max_concurrent=1, timeout=10, history=10)
+    script = "import sys; print('hello'); print('oops', file=sys.stderr); sys.exit(3)"
+
+    async def scenario():
+        job = await runner.submit("up", "demo", [sys.executable, "-c", script], "tester")
+        lines = [line async for line in runner.follow(job)]
+        return job, lines, await runner.list_jobs("tester"), await runner.list_jobs("other")
+
+    job, lines, tester_jobs, other_jobs = asyncio.run(scenario())
+    assert job.status == "failed"
+    assert job.returncode == 3
+    assert {"stream": "stdout", "line": "hello"} in lines
+    assert {"stream": "stderr", "line": "oops"} in lines
+    assert tester_jobs == [job]
+    assert other_jobs == []
+
+# 测试任务超时后被终止
+def test_job_runner_timeout():
+    runner = JobRunner(max_concurrent=1, timeout=0.2, history=10)
+    finished_statuses = []
+
+    async def scenario():
+        job = await runner.submit("up", "demo", [sys.executable, "-c", "import time; time.sleep(10)"], "tester",
+                            on_finish=lambda finished: finished_statuses.append(finished.status))
+        return await runner.wait(job)
+
+    job = asyncio.run(scenario())
+    assert job.status == "timeout"
+    assert finished_statuses == ["timeout"]
+
+# 测试并发上限
+def test_job_runner_concurrency_limit():
+    runner = JobRunner(max_concurrent=1, timeout=10, history=10)
+
+    async def scenario():
+        first = await runner.submit("up", "a", [sys.executable, "-c", "import time; time.sleep(0.3)"], "tester")
+        second = await runner.submit("up", "b", [sys.executable, "-c", "pass"], "tester")
+        await asyncio.sleep(0.1)
+        statuses = (first.status, second.status)
+        await runner.wait(first)
+        await runner.wait(second)
+        return statuses, second
+
+    statuses, second = asyncio.run(scenario())
+    assert statuses == ("running", "queued")
+    assert second.status == "succeeded"
+
+# 测试配置数据库后，其他进程（另一个执行器实例）可以查询、等待和跟踪任务
+def test_job_runner_shared_store(tmp_path):
+    from app_modules.jobs import FINISHED_STATUSES
+    from app_modules.results import ResultStore
+    db_path = str(tmp_path / "jobs.db")
+
+    def make_store():
+        return ResultStore(10, 60, db_path, key_field="id", finished_statuses=FINISHED_STATUSES)
+
+    runner = JobRunner(max_concurrent=1, timeout=10, history=10, store=make_store())
+    other = JobRunner(max_concurrent=1, timeout=10, history=10, store=make_store())
+    script = "import time; print('hello'); time.sleep(0.3)"
+
+    async def scenario():
+        job = await runner.submit("up", "demo", [sys.executable, "-c", script], "tester")
+        remote = await other.get(job.id)
+        assert remote.remote and not remote.finished
+        lines = [line async for line in other.follow(remote)]
+        await runner.wait(job)
+        assert [j.id for j in await other.list_jobs("tester")] == [job.id]
+        assert await other.list_jobs("other") == []
+        assert await other.get("missing") is None
+        return job, remote, lines
+
+    job, remote, lines = asyncio.run(scenario())
+    assert remote.status == "succeeded"
+    assert remote.returncode == 0
+    assert lines == [{"stream": "stdout", "line": "hello"}]
+
+# 测试协程形式的on_finish在任务结束前执行完毕
+def test_job_runner_async_on_finish():
+    runner = JobRunner(max_concurrent=1, timeout=10, history=10)
+    finished_statuses = []
+
+    async def on_finish(job):
+        await asyncio.sleep(0.05)
+        finished_statuses.append(job.status)
+
+    async def scenario():
+        job = await runner.submit("up", "demo", [sys.executable, "-c", "pass"], "tester", on_finish=on_finish)
+        return await runner.wait(job)
+
+    job = asyncio.run(scenario())
+    assert job.status == "succeeded"
+    assert finished_statuses == ["succeeded"]
@@ -0,0 +1,47 @@
+import time
+import asyncio
+from app_modules.ratelimit import RateLimitScheduler, parse_retry_after
+
+# 测试限流时并发上限减半，成功时逐步恢复
+def test_scheduler_aimd():
+    scheduler = RateLimitScheduler(requests_per_minute=6000, max_concurrency=8)
+    asyncio.run(scheduler.acquire())
+    scheduler.release(rate_limited=True)
+    assert scheduler.concurrency_limit == 4
+    for _ in range(20):
+        asyncio.run(scheduler.acquire())
+        scheduler.release()
+    assert 4 < scheduler.concurrency_limit <= 8
+    assert scheduler.stats()["rate_limited"] == 1
+
+# 测试令牌桶限制请求速率
+def test_scheduler_token_bucket():
+    scheduler = RateLimitScheduler(requests_per_minute=600, max_concurrency=2)
+
+    async def scenario():
+        started = time.monotonic()
+        for _ in range(4):
+            await scheduler.acquire()
+            scheduler.release()
+        return time.monotonic() - started
+
+    # 桶中初始有2个令牌，之后每0.1秒补充一个
+    assert 0.15 <= asyncio.run(scenario()) < 1.0
+
+# 测试额度用完时暂停到重置时间
+def test_scheduler_honors_headers():
+    scheduler = RateLimitScheduler(requests_per_minute=50, max_concurrency=4)
+    scheduler.update_from_headers({
+        "anthropic-ratelimit-requests-limit": "120",
+        "anthropic-ratelimit-requests-remaining": "0",
+        "anthropic-ratelimit-requests-reset": "5"
+    })
+    stats = scheduler.stats()
+    assert stats["requests_per_minute"] == 120
+    assert 4 < stats["paused_seconds"] <= 5
+
+# 测试解析retry-after头
+def test_parse_retry_after():
+    assert 2.9 < parse_retry_after({"retry-after": "3"}) <= 3.0
+    assert parse_retry_after({}) is None
+    assert parse_retry_after(None) is None
@@ -0,0 +1,76 @@
+import time
+import asyncio
+import threading
+from app_modules.cache import TTLCache
+from app_modules.results import ResultStore
+
+# 测试缓存按最近使用淘汰
+def test_ttl_cache_lru_eviction():
+    cache = TTLCache(max_entries=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+# 测试缓存条目过期
+def test_ttl_cache_expiry():
+    cache = TTLCache(max_entries=10, ttl=0.05)
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    time.sleep(0.1)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+# 测试请求ID不冲突并可更新状态
+def test_result_store_create_and_update():
+    store = ResultStore(max_entries=10, ttl=60)
+    first = store.create("alice")
+    second = store.create("alice")
+    assert first["request_id"] != second["request_id"]
+    assert first["status"] == "queued"
+    store.update(first["request_id"], status="succeeded", result={"completion": "ok"})
+    record = store.get(first["request_id"])
+    assert record["status"] == "succeeded"
+    assert record["result"]["completion"] == "ok"
+    assert store.update("missing", status="failed") is None
+
+# 测试结果持久化到SQLite后可被新的存储实例读取
+def test_result_store_sqlite_persistence(tmp_path):
+    db_path = str(tmp_path / "results.db")
+    store = ResultStore(max_entries=10, ttl=60, db_path=db_path)
+    record = store.create("alice", model="claude-3-haiku-20240307")
+    store.update(record["request_id"], status="succeeded", result={"completion": "ok"})
+
+    reopened = ResultStore(max_entries=10, ttl=60, db_path=db_path)
+    loaded = reopened.get(record["request_id"])
+    assert loaded["status"] == "succeeded"
+    assert loaded["model"] == "claude-3-haiku-20240307"
+
+# 测试过期记录从SQLite中清除
+def test_result_store_purge_expired(tmp_path):
+    store = ResultStore(max_entries=10, ttl=0.05, db_path=str(tmp_path / "results.db"))
+    record = store.create("alice")
+    time.sleep(0.1)
+    store.purge_expired()
+    assert store.get(record["request_id"]) is None
+
+# 测试配置数据库时存储操作在存储专用的线程中按提交顺序执行
+def test_result_store_run_off_loop(tmp_path):
+    store = ResultStore(max_entries=10, ttl=60, db_path=str(tmp_path / "results.db"))
+    threads = []
+
+    def put(value):
+        threads.append(threading.get_ident())
+        return value
+
+    async def scenario():
+        return await asyncio.gather(*(store.run(put, i) for i in range(5)))
+
+    assert asyncio.run(scenario()) == [0, 1, 2, 3, 4]
+    assert len(set(threads)) == 1 and threads[0] != threading.get_ident()
+    record = asyncio.run(store.run(store.create, "alice"))
+    assert store.get(record["request_id"])["owner"] == "alice"
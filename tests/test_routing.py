@@ -0,0 +1,33 @@
+from app_modules.routing import RouteStats, classify_prompt, estimate_cost
+
+# 测试简单查询使用fast路由
+def test_classify_prompt_fast():
+    assert classify_prompt("显示所有正在运行的容器") == "fast"
+    assert classify_prompt("list containers") == "fast"
+    assert classify_prompt("帮我list一下容器") == "fast"
+
+# 测试排查类问题使用quality路由
+def test_classify_prompt_quality():
+    assert classify_prompt("为什么web容器启动后立即退出?") == "quality"
+    assert classify_prompt("help me debug this stack") == "quality"
+    assert classify_prompt("请帮我debug这个容器") == "quality"
+    assert classify_prompt("x" * 2000) == "quality"
+
+# 测试其他问题使用balanced路由
+def test_classify_prompt_balanced():
+    assert classify_prompt("帮我写一个运行nginx和redis的compose文件") == "balanced"
+    assert classify_prompt("查看这个文件\n```yaml\nservices:\n  web:\n    image: nginx\n```") == "balanced"
+
+# 测试费用估算和统计
+def test_route_stats():
+    usage = {"input_tokens": 1_000_000, "output_tokens": 0}
+    assert estimate_cost("claude-3-haiku-20240307", usage) == 0.25
+    assert estimate_cost("unknown", usage) is None
+    stats = RouteStats()
+    stats.record("fast", "claude-3-haiku-20240307", 0.5, usage)
+    stats.record("fast", "claude-3-haiku-20240307", 1.5, {}, error=True)
+    fast = stats.stats()["fast"]
+    assert fast["calls"] == 2
+    assert fast["errors"] == 1
+    assert fast["avg_seconds"] == 1.0
+    assert fast["cost_usd"] == 0.25
@@ -0,0 +1,106 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock
+from app_modules.sessions import ConversationSession, SessionStore, diff_docker_context
+
+OLD_CONTEXT = {
+    "containers": [
+        {"id": "aaa", "name": "web", "image": "nginx:latest", "status": "running"},
+        {"id": "bbb", "name": "db", "image": "postgres:16", "status": "running"}
+    ],
+    "images": [{"id": "img1", "tags": ["nginx:latest"], "size": 120}]
+}
+
+# 测试环境变化的差异文本
+def test_diff_docker_context():
+    new_context = {
+        "containers": [
+            {"id": "aaa", "name": "web", "image": "nginx:latest", "status": "exited"},
+            {"id": "ccc", "name": "cache", "image": "redis:7", "status": "running"}
+        ],
+        "images": [{"id": "img1", "tags": ["nginx:latest"], "size": 120}]
+    }
+    diff = diff_docker_context(OLD_CONTEXT, new_context)
+    assert "~ 容器 web|aaa status: running -> exited" in diff
+    assert "+ 容器 cache|ccc|redis:7|running" in diff
+    assert "- 容器 db|bbb" in diff
+    assert "镜像" not in diff
+
+# 测试环境无变化
+def test_diff_docker_context_unchanged():
+    assert diff_docker_context(OLD_CONTEXT, OLD_CONTEXT) == "自上一轮以来Docker环境没有变化"
+
+# 测试第一轮发送完整快照，之后发送变化
+def test_session_context_mode():
+    session = ConversationSession("alice")
+    mode, _ = session.context_text(OLD_CONTEXT, lambda c: "完整快照")
+    assert mode == "full"
+    session.record_turn("问题", "回答", OLD_CONTEXT)
+    mode, text = session.context_text(OLD_CONTEXT, lambda c: "完整快照")
+    assert mode == "diff"
+    assert "没有变化" in text
+
+# 测试历史超过预算时压缩较早的消息
+def test_session_compact():
+    session = ConversationSession("alice")
+    for i in range(6):
+        session.record_turn(f"问题{i} " + "x" * 400, f"回答{i}", OLD_CONTEXT)
+    summarize = AsyncMock(return_value="之前讨论了web容器")
+    
+    compacted = asyncio.run(session.compact(summarize, token_budget=300, keep_messages=4))
+    
+    assert compacted
+    assert session.summary == "之前讨论了web容器"
+    assert len(session.messages) == 4
+    assert session.messages[0]["role"] == "user"
+    assert session.messages[0]["content"].startswith("问题4")
+    assert len(summarize.await_args.args[1]) == 8
+    # 压缩后下一轮重新发送完整快照
+    assert session.context_text(OLD_CONTEXT, lambda c: "完整快照")[0] == "full"
+
+# 测试变化超过token预算时改为发送完整快照
+def test_session_context_large_diff():
+    session = ConversationSession("alice")
+    session.record_turn("问题", "回答", OLD_CONTEXT)
+    new_context = {
+        "containers": [
+            {"id": f"id{i:04d}", "name": f"worker-{i}", "image": "busybox:latest", "status": "running"}
+            for i in range(200)
+        ],
+        "images": OLD_CONTEXT["images"]
+    }
+    mode, text = session.context_text(new_context, lambda c: "完整快照", token_budget=500)
+    assert mode == "full"
+    assert text.endswith("完整快照")
+
+# 测试生成摘要失败时保留原来的历史
+def test_session_compact_summary_failure():
+    session = ConversationSession("alice")
+    for i in range(6):
+        session.record_turn(f"问题{i} " + "x" * 400, f"回答{i}", OLD_CONTEXT)
+    summarize = AsyncMock(side_effect=RuntimeError("upstream error"))
+    
+    with pytest.raises(RuntimeError):
+        asyncio.run(session.compact(summarize, token_budget=300, keep_messages=4))
+    
+    assert len(session.messages) == 12
+    assert session.summary is None
+    assert session.compactions == 0
+
+# 测试未超过预算时不压缩
+def test_session_compact_within_budget():
+    session = ConversationSession("alice")
+    session.record_turn("问题", "回答", OLD_CONTEXT)
+    summarize = AsyncMock()
+    assert not asyncio.run(session.compact(summarize, token_budget=1000))
+    summarize.assert_not_called()
+
+# 测试按用户列出会话
+def test_session_store_list():
+    store = SessionStore(max_entries=10, ttl=60)
+    first = store.create("alice")
+    store.create("bob")
+    second = store.create("alice")
+    assert [s.id for s in store.list_sessions("alice")] == [second.id, first.id]
+    store.delete(first.id)
+    assert store.get(first.id) is None
@@ -0,0 +1,70 @@
+import pytest
+from unittest.mock import MagicMock
+from app_modules.state import DockerStateCache
+
+# 创建已完成同步的状态缓存
+@pytest.fixture
+def synced_cache():
+    mock_client = MagicMock()
+    mock_client.api.containers.return_value = [
+        {'Id': 'aaa111', 'Names': ['/web'], 'ImageID': 'sha256:img', 'State': 'running'},
+        {'Id': 'bbb222', 'Names': ['/db'], 'ImageID': 'sha256:img', 'State': 'exited'}
+    ]
+    mock_client.api.images.return_value = [{'Id': 'sha256:img', 'RepoTags': ['nginx:latest']}]
+    cache = DockerStateCache(max_staleness=60)
+    cache._client = mock_client
+    cache.resync()
+    return cache
+
+# 测试全量同步后从内存提供列表和查找
+def test_state_cache_resync(synced_cache):
+    assert synced_cache.is_fresh()
+    assert len(synced_cache.list_containers()) == 2
+    assert len(synced_cache.list_images()) == 1
+    assert synced_cache.find_container("web")['Id'] == "aaa111"
+    assert synced_cache.find_container("bbb")['Id'] == "bbb222"
+    assert synced_cache.find_container("missing") is None
+
+# 测试容器事件只刷新对应容器
+def test_state_cache_container_events(synced_cache):
+    mock_client = synced_cache._client
+    mock_client.api.containers.return_value = [
+        {'Id': 'bbb222', 'Names': ['/db'], 'ImageID': 'sha256:img', 'State': 'running'}
+    ]
+    generation = synced_cache.generation
+    
+    synced_cache.handle_event({'Type': 'container', 'Action': 'start', 'Actor': {'ID': 'bbb222'}, 'time': 1700000000})
+    mock_client.api.containers.assert_called_with(all=True, filters={"id": "bbb222"})
+    assert synced_cache.find_container("db")['State'] == "running"
+    assert synced_cache.generation == generation + 1
+    
+    synced_cache.handle_event({'Type': 'container', 'Action': 'destroy', 'Actor': {'ID': 'aaa111'}})
+    assert synced_cache.find_container("web") is None
+    assert len(synced_cache.list_containers()) == 1
+
+# 测试镜像标签事件刷新镜像列表
+def test_state_cache_image_events(synced_cache):
+    synced_cache._client.api.images.return_value = []
+    synced_cache.handle_event({'Type': 'image', 'Action': 'untag', 'Actor': {'ID': 'sha256:img'}})
+    assert synced_cache.list_images() == []
+
+# 测试未同步或超过陈旧时间限制时不可用
+def test_state_cache_staleness(synced_cache):
+    assert not DockerStateCache().is_fresh()
+    synced_cache.max_staleness = 0
+    assert not synced_cache.is_fresh()
+
+
+# 测试compose索引在状态未变化时复用
+def test_state_cache_compose_index(synced_cache):
+    synced_cache._client.api.containers.return_value = [
+        {'Id': 'ccc333', 'Names': ['/demo-web-1'], 'State': 'running',
+         'Labels': {'com.docker.compose.project': 'demo', 'com.docker.compose.service': 'web'}}
+    ]
+    assert synced_cache.compose_index() == {}
+    first = synced_cache.compose_index()
+    assert synced_cache.compose_index() is first
+    
+    synced_cache.handle_event({'Type': 'container', 'Action': 'create', 'Actor': {'ID': 'ccc333'}})
+    index = synced_cache.compose_index()
+    assert index["demo"]["web"][0]['Id'] == "ccc333"
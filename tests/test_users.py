@@ -0,0 +1,94 @@
+import asyncio
+import threading
+import pytest
+from datetime import datetime
+from unittest.mock import patch
+from app_modules.users import MemoryUserRepository, SQLiteUserRepository, UserRepository, run_user_repository
+
+# 构造用户记录
+def make_user(username: str, disabled: bool = False):
+    return {
+        "id": f"{username}-id",
+        "username": username,
+        "email": f"{username}@example.com",
+        "full_name": None,
+        "disabled": disabled,
+        "hashed_password": "hashed",
+        "created_at": datetime.now()
+    }
+
+# 测试内存用户存储的创建和查询
+def test_memory_repository():
+    users = {}
+    repository = MemoryUserRepository(users)
+    assert repository.create(make_user("alice"))
+    assert not repository.create(make_user("alice"))
+    assert repository.get("alice").email == "alice@example.com"
+    assert repository.get("bob") is None
+    assert "alice" in users
+    assert repository.stats() == {"backend": "memory", "users": 1}
+
+# 测试SQLite用户存储：用户名唯一，新的存储实例（相当于另一个工作进程）可以读到已创建的用户
+def test_sqlite_repository_shared_between_instances(tmp_path):
+    db_path = str(tmp_path / "users.db")
+    first = SQLiteUserRepository(db_path)
+    second = SQLiteUserRepository(db_path)
+    assert first.create(make_user("alice", disabled=True))
+    assert not second.create(make_user("alice"))
+
+    user = second.get("alice")
+    assert user.id == "alice-id"
+    assert user.disabled is True
+    assert isinstance(user.created_at, datetime)
+    assert second.get("bob") is None
+    assert second.count() == 1
+
+# 测试SQLite用户存储使用WAL模式并缓存已读取的用户
+def test_sqlite_repository_cache(tmp_path):
+    repository = SQLiteUserRepository(str(tmp_path / "users.db"), pool_size=2)
+    repository.create(make_user("alice"))
+    with repository._connection() as db:
+        assert db.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    for _ in range(3):
+        assert repository.get("alice") is not None
+    assert repository.stats()["cache"]["hits"] == 2
+
+# 测试多个线程并发使用时连接数不超过连接池大小
+def test_sqlite_repository_pool(tmp_path):
+    repository = SQLiteUserRepository(str(tmp_path / "users.db"), pool_size=2, cache_ttl=0)
+    repository.create(make_user("alice"))
+    errors = []
+
+    def worker():
+        try:
+            for _ in range(20):
+                assert repository.get("alice").username == "alice"
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert repository._opened <= 2
+
+# 测试用户存储接口未实现全部方法时不能实例化
+def test_user_repository_is_abstract():
+    with pytest.raises(TypeError):
+        UserRepository()
+
+# 测试SQLite用户存储在线程池中调用，内存用户存储直接在事件循环中调用
+def test_run_user_repository(tmp_path):
+    called_in = []
+
+    def get(username):
+        called_in.append(threading.get_ident())
+        return None
+
+    for repository in (SQLiteUserRepository(str(tmp_path / "users.db")), MemoryUserRepository()):
+        with patch("app_modules.users.user_repository", repository):
+            assert asyncio.run(run_user_repository(get, "alice")) is None
+    assert called_in[0] != threading.get_ident()
+    assert called_in[1] == threading.get_ident()